@@ -1,19 +1,20 @@
 import json
 import os
+from functools import partial
 
-import cv2
 import joblib
 import numpy as np
 import torch
 import torch.utils.data as data
 from pytorch3d.transforms.rotation_conversions import axis_angle_to_matrix
-from tqdm import tqdm
 
 from hybrik.models.layers.smplx.joint_names import JOINT_NAMES
 from hybrik.models.layers.smplx.load_body_models import load_models
+from hybrik.utils.columns import build_columns, load_columns
 from hybrik.utils.pose_utils import pixel2cam, reconstruction_error
 from hybrik.utils.presets.simple_transform_3d_smplx import \
     SimpleTransform3DSMPLX
+from hybrik.utils.shards import open_shards, read_image
 
 (
     smplx_layer_neutral,
@@ -111,6 +112,7 @@ class AGORAX(data.Dataset):
         self.high_res_inp = high_res_inp
 
         self.db = self.load_pt()
+        self._shards = open_shards(cfg, self._ann_file + self._resolution + '_final', len(self))
 
         self.finetune = finetune
 
@@ -130,10 +132,8 @@ class AGORAX(data.Dataset):
             rand_bbox_shift=False
         )
 
-    def __getitem__(self, idx):
-        # get image id
+    def image_path(self, idx):
         img_path = self.db['img_path'][idx]
-        img_id = self.db['img_id'][idx]
 
         img_path = img_path.split('/')
         assert img_path[3] == 'images', img_path
@@ -144,7 +144,12 @@ class AGORAX(data.Dataset):
             img_path[5] = basename
         else:
             img_path[3] = 'images_small'
-        img_path = '/'.join(img_path)
+        return '/'.join(img_path)
+
+    def __getitem__(self, idx):
+        # get image id
+        img_path = self.image_path(idx)
+        img_id = self.db['img_id'][idx]
 
         # load ground truth, including bbox, keypoints, image size
         label = {}
@@ -154,7 +159,7 @@ class AGORAX(data.Dataset):
             else:
                 label[k] = self.db[k][idx].copy()
 
-        img = cv2.cvtColor(cv2.imread(img_path), cv2.COLOR_BGR2RGB)
+        img = read_image(img_path, self._shards, idx)
 
         if self.high_res_inp:
             assert img.shape[1] == 3840, img.shape
@@ -186,221 +191,185 @@ class AGORAX(data.Dataset):
     def __len__(self):
         return len(self.db['img_path'])
 
-    def load_pt(self):
-        if self.high_res_inp:
-            resolution = '_4k_'
-        else:
-            resolution = '_720p_'
-        if os.path.exists(self._ann_file + resolution + '_final.pt'):
-            db = joblib.load(self._ann_file + resolution + '_final.pt', 'r')
-        else:
-            self._save_pt()
-            db = joblib.load(self._ann_file + resolution + '_final.pt', 'r')
-
-        return db
-
-    def _save_pt(self):
-
-        if self.high_res_inp:
-            resolution = '_4k_'
-        else:
-            resolution = '_720p_'
-
-        _db = joblib.load(self._ann_file, 'r')
-        _items, _labels = self._lazy_load_pt(_db)
-
-        keys = list(_labels[0].keys())
-        _db = {}
-        for k in keys:
-            _db[k] = []
-
-        print(f'Generating AGORA pt: {len(_labels)}...')
-        for obj in _labels:
-            for k in keys:
-                _db[k].append(np.array(obj[k]))
-
-        _db['img_path'] = _items
-        for k in keys:
-            _db[k] = np.stack(_db[k])
-            assert _db[k].shape[0] == len(_labels)
-
-        joblib.dump(_db, self._ann_file + resolution + '_final.pt')
-
-    def _lazy_load_pt(self, db):
-        """Load all image paths and labels from json annotation files into buffer."""
+    @property
+    def _resolution(self):
+        return '_4k_' if self.high_res_inp else '_720p_'
 
-        items = []
-        labels = []
+    def load_pt(self):
+        params = dict(root=self._root, high_res_inp=self.high_res_inp, use_kid=self.use_kid)
+        return load_columns(
+            self._ann_file + self._resolution + '_final', self._build_db, sources=[self._ann_file], params=params)
 
+    def _build_db(self):
+        db = joblib.load(self._ann_file, 'r')
         db_len = len(db['ann_path'])
-
         for k, v in db.items():
             assert len(v) == db_len, k
 
-        img_cnt = 0
-        kid_cnt = 0
-
-        for idx in tqdm(range(db_len)):
-            img_name = db['img_path'][idx]
-            ann_path = db['ann_path'][idx]
+        print(f'Generating AGORA annotations: {db_len}...')
+        _db = build_columns(
+            partial(self._lazy_load_pt, db), list(range(db_len)),
+            workers=self._cfg.DATASET.get('CACHE_WORKERS', 1), initializer=partial(torch.set_num_threads, 1))
+        _db['img_id'] = np.arange(len(_db['img_id']))
 
-            focal, pelvis_pos = get_focal(db, idx, img_name)
-
-            # print(ann_path, img_name)
-            ann_file = ann_path.split('/')[-1]
-
-            ann_file = ann_file.split('_')
-            if 'train' in img_name:
-                img_parent_path = os.path.join(self._root, 'images', f'{ann_file[0]}_{ann_file[1]}')
-            else:
-                img_parent_path = os.path.join(self._root, 'images', 'validation')
+        print('datalen', db_len, len(_db['img_id']), 'kid', _db['is_kid'].sum() / len(_db['img_id']))
+        return _db
 
-            img_path = os.path.join(img_parent_path, img_name)
+    def _lazy_load_pt(self, db, idx):
+        """Load the image path and labels of an annotation, a kid is added twice."""
+        img_name = db['img_path'][idx]
+        ann_path = db['ann_path'][idx]
 
-            beta = np.array(db['shape'][idx]).reshape(10)
-            expression = np.array(db['expression'][idx]).reshape(10)
-            theta_full = np.array(db['full_pose'][idx]).reshape(-1, 3)
-            angle = db['twist_angle'][idx].reshape(-1)
-            cos = np.cos(angle)
-            sin = np.sin(angle)
+        focal, pelvis_pos = get_focal(db, idx, img_name)
 
-            phi = np.stack((cos, sin), axis=1)
-            phi_weight = (angle > -10) * 1.0
-            phi_weight = np.stack([phi_weight, phi_weight], axis=1)
-
-            # convert to torch
-            beta = torch.from_numpy(beta).reshape(1, 10)
-            expression = torch.from_numpy(expression).reshape(1, 10)
-            theta = torch.from_numpy(theta_full).reshape(1, 55, 3)
-            phi = torch.from_numpy(phi).reshape(1, -1, 2)
-            theta = axis_angle_to_matrix(theta.reshape(55, 3)).reshape(1, 55, 3, 3)
-
-            gender = db['gender'][idx]
-            is_kid = db['is_kid'][idx]
-
-            if is_kid:
-                shape_kid = np.array(db['shape_kid'][idx]).reshape(1)
-                shape_kid = torch.from_numpy(shape_kid).reshape(1, 1)
-                beta = torch.cat((beta, shape_kid), dim=1)
-                if gender == 'female':
-                    smplx_layer = smplx_layer_female_kid
-                elif gender == 'male':
-                    smplx_layer = smplx_layer_male_kid
-                elif gender == 'neutral':
-                    smplx_layer = smplx_layer_neutral_kid
-            else:
-                if gender == 'female':
-                    smplx_layer = smplx_layer_female
-                elif gender == 'male':
-                    smplx_layer = smplx_layer_male
-                elif gender == 'neutral':
-                    smplx_layer = smplx_layer_neutral
+        # print(ann_path, img_name)
+        ann_file = ann_path.split('/')[-1]
 
-            output = smplx_layer.forward_simple(
-                betas=beta,
-                full_pose=theta,
-                expression=expression,
-                return_verts=True,
-                root_align=True
-            )
+        ann_file = ann_file.split('_')
+        if 'train' in img_name:
+            img_parent_path = os.path.join(self._root, 'images', f'{ann_file[0]}_{ann_file[1]}')
+        else:
+            img_parent_path = os.path.join(self._root, 'images', 'validation')
+
+        img_path = os.path.join(img_parent_path, img_name)
+
+        beta = np.array(db['shape'][idx]).reshape(10)
+        expression = np.array(db['expression'][idx]).reshape(10)
+        theta_full = np.array(db['full_pose'][idx]).reshape(-1, 3)
+        angle = db['twist_angle'][idx].reshape(-1)
+        cos = np.cos(angle)
+        sin = np.sin(angle)
+
+        phi = np.stack((cos, sin), axis=1)
+        phi_weight = (angle > -10) * 1.0
+        phi_weight = np.stack([phi_weight, phi_weight], axis=1)
+
+        # convert to torch
+        beta = torch.from_numpy(beta).reshape(1, 10)
+        expression = torch.from_numpy(expression).reshape(1, 10)
+        theta = torch.from_numpy(theta_full).reshape(1, 55, 3)
+        phi = torch.from_numpy(phi).reshape(1, -1, 2)
+        theta = axis_angle_to_matrix(theta.reshape(55, 3)).reshape(1, 55, 3, 3)
+
+        gender = db['gender'][idx]
+        is_kid = db['is_kid'][idx]
+
+        if is_kid:
+            shape_kid = np.array(db['shape_kid'][idx]).reshape(1)
+            shape_kid = torch.from_numpy(shape_kid).reshape(1, 1)
+            beta = torch.cat((beta, shape_kid), dim=1)
+            if gender == 'female':
+                smplx_layer = smplx_layer_female_kid
+            elif gender == 'male':
+                smplx_layer = smplx_layer_male_kid
+            elif gender == 'neutral':
+                smplx_layer = smplx_layer_neutral_kid
+        else:
+            if gender == 'female':
+                smplx_layer = smplx_layer_female
+            elif gender == 'male':
+                smplx_layer = smplx_layer_male
+            elif gender == 'neutral':
+                smplx_layer = smplx_layer_neutral
+
+        output = smplx_layer.forward_simple(
+            betas=beta,
+            full_pose=theta,
+            expression=expression,
+            return_verts=True,
+            root_align=True
+        )
 
-            gt_joints_55 = output.joints_55
-            gt_verts = output.vertices
+        gt_joints_55 = output.joints_55
+        gt_verts = output.vertices
 
-            leaf_vertices = gt_verts[:, smplx_layer.LEAF_INDICES].clone()
-            gt_joints_71_xyz = torch.cat([gt_joints_55, leaf_vertices], dim=1)
+        leaf_vertices = gt_verts[:, smplx_layer.LEAF_INDICES].clone()
+        gt_joints_71_xyz = torch.cat([gt_joints_55, leaf_vertices], dim=1)
 
-            gt_joints_71_xyz = gt_joints_71_xyz.cpu().numpy()[0]
-            gt_joints_71_xyz = gt_joints_71_xyz + pelvis_pos[None, :]
-            rel_71_xyz = gt_joints_71_xyz - gt_joints_71_xyz[[0], :]
+        gt_joints_71_xyz = gt_joints_71_xyz.cpu().numpy()[0]
+        gt_joints_71_xyz = gt_joints_71_xyz + pelvis_pos[None, :]
+        rel_71_xyz = gt_joints_71_xyz - gt_joints_71_xyz[[0], :]
 
-            x0 = 1280 / 2
-            y0 = 720 / 2
-            if self.high_res_inp:
-                focal = focal * 3
-                x0 = x0 * 3
-                y0 = y0 * 3
+        x0 = 1280 / 2
+        y0 = 720 / 2
+        if self.high_res_inp:
+            focal = focal * 3
+            x0 = x0 * 3
+            y0 = y0 * 3
 
-            gt_joints_71_uv = project(gt_joints_71_xyz, focal, x0, y0)
+        gt_joints_71_uv = project(gt_joints_71_xyz, focal, x0, y0)
 
-            joint_img_71 = np.zeros_like(gt_joints_71_xyz)
-            joint_img_71[:, :2] = gt_joints_71_uv.copy()
-            joint_img_71[:, 2] = rel_71_xyz[:, 2].copy()
-            joint_vis_71 = np.ones_like(joint_img_71)
+        joint_img_71 = np.zeros_like(gt_joints_71_xyz)
+        joint_img_71[:, :2] = gt_joints_71_uv.copy()
+        joint_img_71[:, 2] = rel_71_xyz[:, 2].copy()
+        joint_vis_71 = np.ones_like(joint_img_71)
 
-            root_cam = pelvis_pos
+        root_cam = pelvis_pos
 
-            # generate bbox from kpt2d
-            # print(joint_2d)
-            left, right, upper, lower = \
-                gt_joints_71_uv[:, 0].min(), gt_joints_71_uv[:, 0].max(), gt_joints_71_uv[:, 1].min(), gt_joints_71_uv[:, 1].max()
+        # generate bbox from kpt2d
+        # print(joint_2d)
+        left, right, upper, lower = \
+            gt_joints_71_uv[:, 0].min(), gt_joints_71_uv[:, 0].max(), gt_joints_71_uv[:, 1].min(), gt_joints_71_uv[:, 1].max()
 
-            center = np.array([(left + right) * 0.5, (upper + lower) * 0.5], dtype=np.float32)
-            scale = [right - left, lower - upper]
+        center = np.array([(left + right) * 0.5, (upper + lower) * 0.5], dtype=np.float32)
+        scale = [right - left, lower - upper]
 
-            scale = float(max(scale))
+        scale = float(max(scale))
 
-            # rand_norm = np.array([local_random.gauss(mu=0, sigma=1), local_random.gauss(mu=0, sigma=1)])
-            # print(rand_norm)
-            # rand_shift = 0.05 * scale * rand_norm
-            # center = center + rand_shift
+        # rand_norm = np.array([local_random.gauss(mu=0, sigma=1), local_random.gauss(mu=0, sigma=1)])
+        # print(rand_norm)
+        # rand_shift = 0.05 * scale * rand_norm
+        # center = center + rand_shift
 
-            scale = scale * 1.3
+        scale = scale * 1.3
 
-            xmin, ymin, xmax, ymax = center[0] - scale * 0.5, center[1] - scale * 0.5, center[0] + scale * 0.5, center[1] + scale * 0.5
+        xmin, ymin, xmax, ymax = center[0] - scale * 0.5, center[1] - scale * 0.5, center[0] + scale * 0.5, center[1] + scale * 0.5
 
-            if self.high_res_inp:
-                if not (xmin < 3840 - 3 and ymin < 2160 - 3 and xmax > 3 and ymax > 3):
-                    continue
-            else:
-                if not (xmin < 1280 - 3 and ymin < 720 - 3 and xmax > 3 and ymax > 3):
-                    continue
+        if self.high_res_inp:
+            if not (xmin < 3840 - 3 and ymin < 2160 - 3 and xmax > 3 and ymax > 3):
+                return []
+        else:
+            if not (xmin < 1280 - 3 and ymin < 720 - 3 and xmax > 3 and ymax > 3):
+                return []
 
-            is_valid = db['is_valid'][idx]
+        is_valid = db['is_valid'][idx]
 
-            gender = db['gender'][idx]
-            is_kid = False
-            if self.use_kid:
-                is_kid = db['is_kid'][idx]
-                beta_kid = np.array(db['shape_kid'][idx])
-                kid_cnt += (2 if is_kid else 0)
-            else:
-                beta_kid = np.zeros(1)
-
-            beta = beta.numpy()[0, :10]
-            expression = expression.numpy()[0]
-            phi = phi.numpy()[0]
-
-            added_num = 2 if is_kid else 1
-            for _ in range(added_num):
-                # child ratio x 2
-                items.append(img_path)
-                labels.append({
-                    'bbox': (xmin, ymin, xmax, ymax),
-                    'img_id': img_cnt,
-                    'img_path': img_path,
-                    'img_name': img_name,
-                    'is_valid': is_valid,
-                    'joint_img': joint_img_71.copy(),
-                    'joint_vis': joint_vis_71.copy(),
-                    'joint_xyz': rel_71_xyz.copy(),
-                    'twist_phi': phi,
-                    'twist_weight': phi_weight,
-                    'beta': beta,
-                    'expression': expression,
-                    'theta_full': theta_full,
-                    'root_cam': root_cam,
-                    'beta_kid': beta_kid,
-                    'gender': gender,
-                    'is_kid': is_kid,
-                    'focal': focal,
-                    'pelvis_depth': pelvis_pos
-                })
-
-                img_cnt += 1
-
-        print('datalen', db_len, len(items), 'kid', kid_cnt / len(items))
-        return items, labels
+        gender = db['gender'][idx]
+        is_kid = False
+        if self.use_kid:
+            is_kid = db['is_kid'][idx]
+            beta_kid = np.array(db['shape_kid'][idx])
+        else:
+            beta_kid = np.zeros(1)
+
+        beta = beta.numpy()[0, :10]
+        expression = expression.numpy()[0]
+        phi = phi.numpy()[0]
+
+        added_num = 2 if is_kid else 1
+        # child ratio x 2
+        return [(img_path, {
+            'bbox': (xmin, ymin, xmax, ymax),
+            # sample index, set after parsing
+            'img_id': -1,
+            'img_path': img_path,
+            'img_name': img_name,
+            'is_valid': is_valid,
+            'joint_img': joint_img_71.copy(),
+            'joint_vis': joint_vis_71.copy(),
+            'joint_xyz': rel_71_xyz.copy(),
+            'twist_phi': phi,
+            'twist_weight': phi_weight,
+            'beta': beta,
+            'expression': expression,
+            'theta_full': theta_full,
+            'root_cam': root_cam,
+            'beta_kid': beta_kid,
+            'gender': gender,
+            'is_kid': is_kid,
+            'focal': focal,
+            'pelvis_depth': pelvis_pos
+        }) for _ in range(added_num)]
 
     def evaluate_uvd_24(self, preds, result_dir):
         print('Evaluation start...')
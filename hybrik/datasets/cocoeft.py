@@ -2,12 +2,12 @@
 import os
 
 # import scipy.misc
-import cv2
-import joblib
 import numpy as np
 import torch
 import torch.utils.data as data
+from hybrik.utils.columns import load_columns
 from hybrik.utils.presets.simple_transform_3d_cam_eft import SimpleTransform3DCamEFT
+from hybrik.utils.shards import open_shards, read_image
 from pytorch3d.transforms.rotation_conversions import matrix_to_axis_angle
 
 s_coco_2_smpl_jt = [
@@ -108,6 +108,7 @@ class COCO_EFT_3D(data.Dataset):
             loss_type=self._loss_type, scale_mult=1.25)
 
         self.db = self.load_pt()
+        self._shards = open_shards(cfg, self._ann_file + '_smpl_annot', len(self))
 
     def __getitem__(self, idx):
         # get image id
@@ -124,7 +125,7 @@ class COCO_EFT_3D(data.Dataset):
 
         label_new = self.preprocess_pt_item(label, idx)
         # img = scipy.misc.imread(img_path, mode='RGB')
-        src = cv2.cvtColor(cv2.imread(img_path), cv2.COLOR_BGR2RGB)
+        src = read_image(img_path, self._shards, idx)
         # transform ground truth into training label and apply data augmentation
         target = self.transformation(src, label_new)
 
@@ -137,8 +138,7 @@ class COCO_EFT_3D(data.Dataset):
         return len(self.db['img_path'])
 
     def load_pt(self):
-        db = joblib.load(self._ann_file + '_smpl_annot.pt', 'r')
-        return db
+        return load_columns(self._ann_file + '_smpl_annot', sources=[self._ann_file + '_smpl_annot.pt'])
 
     @property
     def joint_pairs(self):
@@ -1,16 +1,17 @@
 """Human3.6M dataset."""
 import json
 import os
+from functools import partial
 
-import cv2
-import joblib
 import numpy as np
 import torch.utils.data as data
 
 from hybrik.utils.bbox import bbox_clip_xyxy, bbox_xywh_to_xyxy
+from hybrik.utils.columns import build_columns, load_columns
 from hybrik.utils.pose_utils import cam2pixel, pixel2cam, reconstruction_error
 from hybrik.utils.presets import (SimpleTransform3DSMPL,
                                   SimpleTransform3DSMPLCam)
+from hybrik.utils.shards import open_shards, read_image
 
 
 class H36mSMPL(data.Dataset):
@@ -129,6 +130,7 @@ class H36mSMPL(data.Dataset):
         self.rshoulder_idx_29 = self.joints_name_29.index('right_shoulder')
 
         self.db = self.load_pt()
+        self._shards = open_shards(cfg, self._ann_file, len(self))
 
         if cfg.MODEL.EXTRA.PRESET == 'simple_smpl_3d':
             self.transformation = SimpleTransform3DSMPL(
@@ -153,7 +155,8 @@ class H36mSMPL(data.Dataset):
                 bbox_3d_shape=self.bbox_3d_shape,
                 rot=self._rot, sigma=self._sigma,
                 train=self._train, add_dpg=self._dpg,
-                loss_type=self._loss_type, scale_mult=1)
+                loss_type=self._loss_type, scale_mult=1,
+                gpu_augment=cfg.DATASET.get('GPU_AUGMENT', False))
 
     def __getitem__(self, idx):
         # get image id
@@ -165,7 +168,7 @@ class H36mSMPL(data.Dataset):
         for k in self.db.keys():
             label[k] = self.db[k][idx].copy()
 
-        img = cv2.cvtColor(cv2.imread(img_path), cv2.COLOR_BGR2RGB)
+        img = read_image(img_path, self._shards, idx)
         # img = load_image(img_path)
         # img = cv2.imread(img_path, cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
 
@@ -180,140 +183,124 @@ class H36mSMPL(data.Dataset):
         return len(self.db['img_path'])
 
     def load_pt(self):
-        if os.path.exists(self._ann_file + '.pt'):
-            db = joblib.load(self._ann_file + '.pt', 'r')
-        else:
-            self._save_pt()
-            db = joblib.load(self._ann_file + '.pt', 'r')
-
-        return db
+        params = dict(root=self._root, det_bbox_file=self._det_bbox_file, block_list=self.block_list)
+        return load_columns(self._ann_file, self._build_db, sources=self._ann_sources(), params=params)
 
-    def _save_pt(self):
-        _items, _labels = self._load_jsons()
-        keys = list(_labels[0].keys())
-        _db = {}
-        for k in keys:
-            _db[k] = []
-
-        print(f'Generating Human3.6M pt: {len(_labels)}...')
-        for obj in _labels:
-            for k in keys:
-                _db[k].append(np.array(obj[k]))
+    def _ann_sources(self):
+        sources = [self._ann_file]
+        if self._det_bbox_file is not None:
+            sources.append(os.path.join(
+                self._root, 'annotations', self._det_bbox_file + f'_protocol_{self.protocol}.json'))
+        return sources
 
-        _db['img_path'] = _items
-        for k in keys:
-            _db[k] = np.stack(_db[k])
-            assert _db[k].shape[0] == len(_labels)
+    def _build_db(self):
+        records = self._load_jsons()
+        det_bbox_set = {}
+        if self._det_bbox_file is not None:
+            bbox_list = json.load(open(self._ann_sources()[1], 'r'))
+            for item in bbox_list:
+                image_id = item['image_id']
+                det_bbox_set[image_id] = item['bbox']
 
-        joblib.dump(_db, self._ann_file + '.pt')
+        print(f'Generating Human3.6M annotations: {len(records)}...')
+        return build_columns(
+            partial(self._parse_ann, det_bbox_set), records,
+            workers=self._cfg.DATASET.get('CACHE_WORKERS', 1))
 
     def _load_jsons(self):
-        """Load all image paths and labels from JSON annotation files into buffer."""
-        items = []
-        labels = []
-
+        """Load the (image, annotation) records of the JSON annotation file."""
         with open(self._ann_file, 'r') as fid:
             database = json.load(fid)
-        # iterate through the annotations
-        bbox_scale_list = []
-        det_bbox_set = {}
+        return list(zip(database['images'], database['annotations']))
+
+    def _parse_ann(self, det_bbox_set, record):
+        """Image path and label of an annotation record, none for blocked sequences."""
+        ann_image, ann_annotations = record
+        ann = dict()
+        for k, v in ann_image.items():
+            assert k not in ann.keys()
+            ann[k] = v
+        for k, v in ann_annotations.items():
+            ann[k] = v
+        skip = False
+        for name in self.block_list:
+            if name in ann['file_name']:
+                skip = True
+        if skip:
+            return []
+
+        image_id = ann['image_id']
+
+        width, height = ann['width'], ann['height']
         if self._det_bbox_file is not None:
-            bbox_list = json.load(open(os.path.join(
-                self._root, 'annotations', self._det_bbox_file + f'_protocol_{self.protocol}.json'), 'r'))
-            for item in bbox_list:
-                image_id = item['image_id']
-                det_bbox_set[image_id] = item['bbox']
+            xmin, ymin, xmax, ymax = bbox_clip_xyxy(
+                bbox_xywh_to_xyxy(det_bbox_set[ann['file_name']]), width, height)
+        else:
+            xmin, ymin, xmax, ymax = bbox_clip_xyxy(
+                bbox_xywh_to_xyxy(ann['bbox']), width, height)
+
+        f, c = np.array(ann['cam_param']['f'], dtype=np.float32), np.array(
+            ann['cam_param']['c'], dtype=np.float32)
 
-        for ann_image, ann_annotations in zip(database['images'], database['annotations']):
-            ann = dict()
-            for k, v in ann_image.items():
-                assert k not in ann.keys()
-                ann[k] = v
-            for k, v in ann_annotations.items():
-                ann[k] = v
-            skip = False
-            for name in self.block_list:
-                if name in ann['file_name']:
-                    skip = True
-            if skip:
-                continue
-
-            image_id = ann['image_id']
-
-            width, height = ann['width'], ann['height']
-            if self._det_bbox_file is not None:
-                xmin, ymin, xmax, ymax = bbox_clip_xyxy(
-                    bbox_xywh_to_xyxy(det_bbox_set[ann['file_name']]), width, height)
-            else:
-                xmin, ymin, xmax, ymax = bbox_clip_xyxy(
-                    bbox_xywh_to_xyxy(ann['bbox']), width, height)
-
-            f, c = np.array(ann['cam_param']['f'], dtype=np.float32), np.array(
-                ann['cam_param']['c'], dtype=np.float32)
-
-            joint_cam_17 = np.array(ann['h36m_joints']).reshape(17, 3)
-            joint_cam = np.array(ann['smpl_joints'])
-            if joint_cam.size == 24 * 3:
-                joint_cam_29 = np.zeros((29, 3))
-                joint_cam_29[:24, :] = joint_cam.reshape(24, 3)
-            else:
-                joint_cam_29 = joint_cam.reshape(29, 3)
-            beta = np.array(ann['betas'])
-            theta = np.array(ann['thetas']).reshape(self.num_thetas, 3)
-
-            joint_img_17 = cam2pixel(joint_cam_17, f, c)
-            joint_img_17[:, 2] = joint_img_17[:, 2] - joint_cam_17[self.root_idx_17, 2]
-            joint_relative_17 = joint_cam_17 - joint_cam_17[self.root_idx_17, :]
-
-            joint_img_29 = cam2pixel(joint_cam_29, f, c)
-            joint_img_29[:, 2] = joint_img_29[:, 2] - joint_cam_29[self.root_idx_smpl, 2]
-            joint_vis_17 = np.ones((17, 3))
-            joint_vis_29 = np.ones((29, 3))
-
-            root_cam = np.array(ann['root_coord'])
-
-            abs_path = os.path.join(self._root, 'images', ann['file_name'])
-
-            if 'angle_twist' in ann.keys():
-                twist = ann['angle_twist']
-                angle = np.array(twist['angle'])
-                cos = np.array(twist['cos'])
-                sin = np.array(twist['sin'])
-                assert (np.cos(angle) - cos < 1e-6).all(), np.cos(angle) - cos
-                assert (np.sin(angle) - sin < 1e-6).all(), np.sin(angle) - sin
-                phi = np.stack((cos, sin), axis=1)
-                # phi_weight = np.ones_like(phi)
-                phi_weight = (angle > -10) * 1.0  # invalid angles are set to be -999
-                phi_weight = np.stack([phi_weight, phi_weight], axis=1)
-            else:
-                phi = np.zeros((23, 2))
-                phi_weight = np.zeros_like(phi)
-
-            items.append(abs_path)
-            labels.append({
-                'bbox': (xmin, ymin, xmax, ymax),
-                'img_id': image_id,
-                'img_path': abs_path,
-                'width': width,
-                'height': height,
-                'joint_img_17': joint_img_17,
-                'joint_vis_17': joint_vis_17,
-                'joint_cam_17': joint_cam_17,
-                'joint_relative_17': joint_relative_17,
-                'joint_img_29': joint_img_29,
-                'joint_vis_29': joint_vis_29,
-                'joint_cam_29': joint_cam_29,
-                'twist_phi': phi,
-                'twist_weight': phi_weight,
-                'beta': beta,
-                'theta': theta,
-                'root_cam': root_cam,
-                'f': f,
-                'c': c
-            })
-            bbox_scale_list.append(max(xmax - xmin, ymax - ymin))
-
-        return items, labels
+        joint_cam_17 = np.array(ann['h36m_joints']).reshape(17, 3)
+        joint_cam = np.array(ann['smpl_joints'])
+        if joint_cam.size == 24 * 3:
+            joint_cam_29 = np.zeros((29, 3))
+            joint_cam_29[:24, :] = joint_cam.reshape(24, 3)
+        else:
+            joint_cam_29 = joint_cam.reshape(29, 3)
+        beta = np.array(ann['betas'])
+        theta = np.array(ann['thetas']).reshape(self.num_thetas, 3)
+
+        joint_img_17 = cam2pixel(joint_cam_17, f, c)
+        joint_img_17[:, 2] = joint_img_17[:, 2] - joint_cam_17[self.root_idx_17, 2]
+        joint_relative_17 = joint_cam_17 - joint_cam_17[self.root_idx_17, :]
+
+        joint_img_29 = cam2pixel(joint_cam_29, f, c)
+        joint_img_29[:, 2] = joint_img_29[:, 2] - joint_cam_29[self.root_idx_smpl, 2]
+        joint_vis_17 = np.ones((17, 3))
+        joint_vis_29 = np.ones((29, 3))
+
+        root_cam = np.array(ann['root_coord'])
+
+        abs_path = os.path.join(self._root, 'images', ann['file_name'])
+
+        if 'angle_twist' in ann.keys():
+            twist = ann['angle_twist']
+            angle = np.array(twist['angle'])
+            cos = np.array(twist['cos'])
+            sin = np.array(twist['sin'])
+            assert (np.cos(angle) - cos < 1e-6).all(), np.cos(angle) - cos
+            assert (np.sin(angle) - sin < 1e-6).all(), np.sin(angle) - sin
+            phi = np.stack((cos, sin), axis=1)
+            # phi_weight = np.ones_like(phi)
+            phi_weight = (angle > -10) * 1.0  # invalid angles are set to be -999
+            phi_weight = np.stack([phi_weight, phi_weight], axis=1)
+        else:
+            phi = np.zeros((23, 2))
+            phi_weight = np.zeros_like(phi)
+
+        return [(abs_path, {
+            'bbox': (xmin, ymin, xmax, ymax),
+            'img_id': image_id,
+            'img_path': abs_path,
+            'width': width,
+            'height': height,
+            'joint_img_17': joint_img_17,
+            'joint_vis_17': joint_vis_17,
+            'joint_cam_17': joint_cam_17,
+            'joint_relative_17': joint_relative_17,
+            'joint_img_29': joint_img_29,
+            'joint_vis_29': joint_vis_29,
+            'joint_cam_29': joint_cam_29,
+            'twist_phi': phi,
+            'twist_weight': phi_weight,
+            'beta': beta,
+            'theta': theta,
+            'root_cam': root_cam,
+            'f': f,
+            'c': c
+        })]
 
     @property
     def joint_pairs_17(self):
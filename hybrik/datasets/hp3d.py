@@ -2,16 +2,16 @@
 import json
 import os
 
-import cv2
-import joblib
 import numpy as np
 import torch.utils.data as data
 
 from hybrik.utils.bbox import bbox_clip_xyxy, bbox_xywh_to_xyxy
+from hybrik.utils.columns import build_columns, load_columns
 from hybrik.utils.pose_utils import (cam2pixel_matrix, pixel2cam_matrix,
                                      reconstruction_error)
 from hybrik.utils.presets import (SimpleTransform3DSMPL,
                                   SimpleTransform3DSMPLCam)
+from hybrik.utils.shards import open_shards, read_image
 
 
 class HP3D(data.Dataset):
@@ -154,13 +154,15 @@ class HP3D(data.Dataset):
                 rot=self._rot, sigma=self._sigma,
                 train=self._train, add_dpg=self._dpg,
                 loss_type=self._loss_type, two_d=True,
-                root_idx=self.root_idx)
+                root_idx=self.root_idx,
+                gpu_augment=cfg.DATASET.get('GPU_AUGMENT', False))
 
         self.root_idx_17 = 0
         self.lshoulder_idx = self.joints_name.index('left_shoulder') if self._train else self.EVAL_JOINTS.index(self.joints_name.index('left_shoulder'))
         self.rshoulder_idx = self.joints_name.index('right_shoulder') if self._train else self.EVAL_JOINTS.index(self.joints_name.index('right_shoulder'))
 
         self.db = self.load_pt()
+        self._shards = open_shards(cfg, self._ann_file, len(self))
 
     def __getitem__(self, idx):
         # get image id
@@ -171,7 +173,7 @@ class HP3D(data.Dataset):
         label = {}
         for k in self.db.keys():
             label[k] = self.db[k][idx].copy()
-        img = cv2.cvtColor(cv2.imread(img_path), cv2.COLOR_BGR2RGB)
+        img = read_image(img_path, self._shards, idx)
 
         # transform ground truth into training label and apply data augmentation
         target = self.transformation(img, label)
@@ -184,89 +186,70 @@ class HP3D(data.Dataset):
         return len(self.db['img_path'])
 
     def load_pt(self):
-        if os.path.exists(self._ann_file + '.pt'):
-            db = joblib.load(self._ann_file + '.pt', 'r')
-        else:
-            self._save_pt()
-            db = joblib.load(self._ann_file + '.pt', 'r')
+        params = dict(root=self._root, train=self._train, num_joints=self.num_joints)
+        return load_columns(self._ann_file, self._build_db, sources=[self._ann_file], params=params)
 
-        return db
+    def _build_db(self):
+        records = self._load_jsons()
 
-    def _save_pt(self):
-        _items, _labels = self._load_jsons()
-        keys = list(_labels[0].keys())
-        _db = {}
-        for k in keys:
-            _db[k] = []
-
-        print(f'Generating 3DHP pt: {len(_labels)}...')
-        for obj in _labels:
-            for k in keys:
-                _db[k].append(np.array(obj[k]))
-
-        _db['img_path'] = _items
-        for k in keys:
-            _db[k] = np.stack(_db[k])
-            assert _db[k].shape[0] == len(_labels)
-
-        joblib.dump(_db, self._ann_file + '.pt')
+        print(f'Generating 3DHP annotations: {len(records)}...')
+        return build_columns(self._parse_ann, records, workers=self._cfg.DATASET.get('CACHE_WORKERS', 1))
 
     def _load_jsons(self):
-        """Load all image paths and labels from JSON annotation files into buffer."""
-        items = []
-        labels = []
-
+        """Load the (image, annotation) records of the JSON annotation file."""
         with open(self._ann_file, 'r') as fid:
             database = json.load(fid)
-        # iterate through the annotations
-        for ann_image, ann_annotations in zip(database['images'], database['annotations']):
-            ann = dict()
-            for k, v in ann_image.items():
-                assert k not in ann.keys()
-                ann[k] = v
-            for k, v in ann_annotations.items():
-                ann[k] = v
-
-            image_id = ann['image_id']
-
-            width, height = ann['width'], ann['height']
-            xmin, ymin, xmax, ymax = bbox_clip_xyxy(
-                bbox_xywh_to_xyxy(ann['bbox']), width, height)
-
-            intrinsic_param = np.array(ann['cam_param']['intrinsic_param'], dtype=np.float32)
-
-            f = np.array([intrinsic_param[0, 0], intrinsic_param[1, 1]], dtype=np.float32)
-            c = np.array([intrinsic_param[0, 2], intrinsic_param[1, 2]], dtype=np.float32)
-
-            joint_cam = np.array(ann['keypoints_cam'])
-
-            joint_img = cam2pixel_matrix(joint_cam, intrinsic_param)
-            joint_img[:, 2] = joint_img[:, 2] - joint_cam[self.root_idx, 2]
-            joint_vis = np.ones((self.num_joints, 3))
-
-            root_cam = joint_cam[self.root_idx]
-
-            abs_path = os.path.join(self._root, 'mpi_inf_3dhp_{}_set'.format('train' if self._train else 'test'), ann['file_name'])
-
-            items.append(abs_path)
-            labels.append({
-                'bbox': (xmin, ymin, xmax, ymax),
-                'img_id': image_id,
-                'img_path': abs_path,
-                'img_name': ann['file_name'],
-                'width': width,
-                'height': height,
-                'joint_img': joint_img,
-                'joint_vis': joint_vis,
-                'joint_cam': joint_cam,
-                'root_cam': root_cam,
-                'intrinsic_param': intrinsic_param,
-                'f': f,
-                'c': c
-            })
-            if not self._train:
-                labels[-1]['activity_id'] = ann['activity_id']
-        return items, labels
+        return list(zip(database['images'], database['annotations']))
+
+    def _parse_ann(self, record):
+        """Image path and label of an annotation record."""
+        ann_image, ann_annotations = record
+        ann = dict()
+        for k, v in ann_image.items():
+            assert k not in ann.keys()
+            ann[k] = v
+        for k, v in ann_annotations.items():
+            ann[k] = v
+
+        image_id = ann['image_id']
+
+        width, height = ann['width'], ann['height']
+        xmin, ymin, xmax, ymax = bbox_clip_xyxy(
+            bbox_xywh_to_xyxy(ann['bbox']), width, height)
+
+        intrinsic_param = np.array(ann['cam_param']['intrinsic_param'], dtype=np.float32)
+
+        f = np.array([intrinsic_param[0, 0], intrinsic_param[1, 1]], dtype=np.float32)
+        c = np.array([intrinsic_param[0, 2], intrinsic_param[1, 2]], dtype=np.float32)
+
+        joint_cam = np.array(ann['keypoints_cam'])
+
+        joint_img = cam2pixel_matrix(joint_cam, intrinsic_param)
+        joint_img[:, 2] = joint_img[:, 2] - joint_cam[self.root_idx, 2]
+        joint_vis = np.ones((self.num_joints, 3))
+
+        root_cam = joint_cam[self.root_idx]
+
+        abs_path = os.path.join(self._root, 'mpi_inf_3dhp_{}_set'.format('train' if self._train else 'test'), ann['file_name'])
+
+        label = {
+            'bbox': (xmin, ymin, xmax, ymax),
+            'img_id': image_id,
+            'img_path': abs_path,
+            'img_name': ann['file_name'],
+            'width': width,
+            'height': height,
+            'joint_img': joint_img,
+            'joint_vis': joint_vis,
+            'joint_cam': joint_cam,
+            'root_cam': root_cam,
+            'intrinsic_param': intrinsic_param,
+            'f': f,
+            'c': c
+        }
+        if not self._train:
+            label['activity_id'] = ann['activity_id']
+        return [(abs_path, label)]
 
     @property
     def joint_pairs(self):
@@ -1,14 +1,15 @@
 """MS COCO Human keypoint dataset."""
 import os
+from functools import partial
 
-import cv2
-import joblib
 import numpy as np
 import torch.utils.data as data
 from pycocotools.coco import COCO
 
 from hybrik.utils.bbox import bbox_clip_xyxy, bbox_xywh_to_xyxy
+from hybrik.utils.columns import build_columns, load_columns
 from hybrik.utils.presets import SimpleTransform, SimpleTransformCam
+from hybrik.utils.shards import open_shards, read_image
 
 
 class Mscoco(data.Dataset):
@@ -101,9 +102,11 @@ class Mscoco(data.Dataset):
                 rot=self._rot, sigma=self._sigma,
                 train=self._train, add_dpg=self._dpg,
                 loss_type=self._loss_type, dict_output=True,
-                bbox_3d_shape=self.bbox_3d_shape)
+                bbox_3d_shape=self.bbox_3d_shape,
+                gpu_augment=cfg.DATASET.get('GPU_AUGMENT', False))
 
         self.db = self.load_pt()
+        self._shards = open_shards(cfg, self._ann_file, len(self))
 
     def __getitem__(self, idx):
         # get image id
@@ -118,7 +121,7 @@ class Mscoco(data.Dataset):
             except AttributeError:
                 label[k] = self.db[k][idx]
 
-        img = cv2.cvtColor(cv2.imread(img_path), cv2.COLOR_BGR2RGB)
+        img = read_image(img_path, self._shards, idx)
         # transform ground truth into training label and apply data augmentation
         target = self.transformation(img, label)
 
@@ -130,38 +133,12 @@ class Mscoco(data.Dataset):
         return len(self.db['img_path'])
 
     def load_pt(self):
-        if os.path.exists(self._ann_file + '.pt'):
-            db = joblib.load(self._ann_file + '.pt', 'r')
-        else:
-            self._save_pt()
-            db = joblib.load(self._ann_file + '.pt', 'r')
-
-        return db
-
-    def _save_pt(self):
-        _items, _labels = self._load_jsons()
-        keys = list(_labels[0].keys())
-        _db = {}
-        for k in keys:
-            _db[k] = []
-
-        print(f'Generating COCO pt: {len(_labels)}...')
-        for obj in _labels:
-            for k in keys:
-                _db[k].append(np.array(obj[k]))
-
-        _db['img_path'] = _items
-        for k in keys:
-            _db[k] = np.stack(_db[k])
-            assert _db[k].shape[0] == len(_labels)
-
-        joblib.dump(_db, self._ann_file + '.pt')
-
-    def _load_jsons(self):
-        """Load all image paths and labels from JSON annotation files into buffer."""
-        items = []
-        labels = []
+        params = dict(
+            root=self._root, train=self._train, skip_empty=self._skip_empty,
+            check_centers=self._check_centers, num_joints=self.num_joints)
+        return load_columns(self._ann_file, self._build_db, sources=[self._ann_file], params=params)
 
+    def _build_db(self):
         _coco = COCO(self._ann_file)
         classes = [c['name'] for c in _coco.loadCats(_coco.getCatIds())]
         assert classes == self.CLASSES, "Incompatible category names with COCO. "
@@ -169,23 +146,24 @@ class Mscoco(data.Dataset):
         self.json_id_to_contiguous = {
             v: k for k, v in enumerate(_coco.getCatIds())}
 
-        # iterate through the annotations
         image_ids = sorted(_coco.getImgIds())
-        for entry in _coco.loadImgs(image_ids):
-            dirname, filename = entry['coco_url'].split('/')[-2:]
-            abs_path = os.path.join(self._root, dirname, filename)
-            if not os.path.exists(abs_path):
-                raise IOError('Image: {} not exists.'.format(abs_path))
-            label = self._check_load_keypoints(_coco, entry)
-            if not label:
-                continue
-
-            # num of items are relative to person, not image
-            for obj in label:
-                items.append(abs_path)
-                labels.append(obj)
-
-        return items, labels
+        records = _coco.loadImgs(image_ids)
+
+        print(f'Generating COCO annotations: {len(records)}...')
+        return build_columns(
+            partial(self._load_entry, _coco), records,
+            workers=self._cfg.DATASET.get('CACHE_WORKERS', 1))
+
+    def _load_entry(self, coco, entry):
+        """Load the image path and labels of all persons in an image."""
+        dirname, filename = entry['coco_url'].split('/')[-2:]
+        abs_path = os.path.join(self._root, dirname, filename)
+        if not os.path.exists(abs_path):
+            raise IOError('Image: {} not exists.'.format(abs_path))
+        label = self._check_load_keypoints(coco, entry)
+
+        # num of items are relative to person, not image
+        return [(abs_path, obj) for obj in label]
 
     def _check_load_keypoints(self, coco, entry):
         """Check and load ground-truth keypoints"""
@@ -2,16 +2,16 @@
 import json
 import os
 
-import cv2
-import joblib
 import numpy as np
 import torch.utils.data as data
 from pycocotools.coco import COCO
 
 from hybrik.utils.bbox import bbox_clip_xyxy, bbox_xywh_to_xyxy
+from hybrik.utils.columns import build_columns, load_columns
 from hybrik.utils.pose_utils import pixel2cam, reconstruction_error
 from hybrik.utils.presets import (SimpleTransform3DSMPL,
                                   SimpleTransform3DSMPLCam)
+from hybrik.utils.shards import open_shards, read_image
 
 
 class PW3D(data.Dataset):
@@ -127,6 +127,7 @@ class PW3D(data.Dataset):
         self.rshoulder_idx_24 = self.joints_name_24.index('right_shoulder')
 
         self.db = self.load_pt()
+        self._shards = open_shards(cfg, self._ann_file, len(self))
 
         if cfg.MODEL.EXTRA.PRESET == 'simple_smpl_3d':
             self.transformation = SimpleTransform3DSMPL(
@@ -151,7 +152,8 @@ class PW3D(data.Dataset):
                 bbox_3d_shape=self.bbox_3d_shape,
                 rot=self._rot, sigma=self._sigma,
                 train=self._train, add_dpg=self._dpg,
-                loss_type=self._loss_type)
+                loss_type=self._loss_type,
+                gpu_augment=cfg.DATASET.get('GPU_AUGMENT', False))
 
     def __getitem__(self, idx):
         # get image id
@@ -163,7 +165,7 @@ class PW3D(data.Dataset):
         for k in self.db.keys():
             label[k] = self.db[k][idx].copy()
 
-        img = cv2.cvtColor(cv2.imread(img_path), cv2.COLOR_BGR2RGB)
+        img = read_image(img_path, self._shards, idx)
 
         # transform ground truth into training label and apply data augmentation
         target = self.transformation(img, label)
@@ -176,118 +178,92 @@ class PW3D(data.Dataset):
         return len(self.db['img_path'])
 
     def load_pt(self):
-        if os.path.exists(self._ann_file + '.pt'):
-            db = joblib.load(self._ann_file + '.pt', 'r')
-        else:
-            self._save_pt()
-            db = joblib.load(self._ann_file + '.pt', 'r')
+        return load_columns(self._ann_file, self._build_db, sources=[self._ann_file], params=dict(root=self._root))
 
-        return db
+    def _build_db(self):
+        records = self._lazy_load_json()
 
-    def _save_pt(self):
-        _items, _labels = self._lazy_load_json()
-        keys = list(_labels[0].keys())
-        _db = {}
-        for k in keys:
-            _db[k] = []
+        print(f'Generating 3DPW annotations: {len(records)}...')
+        _db = build_columns(self._parse_ann, records, workers=self._cfg.DATASET.get('CACHE_WORKERS', 1))
+        _db['img_id'] = np.arange(len(_db['img_id']))
+        return _db
 
-        print(f'Generating 3DPW pt: {len(_labels)}...')
-        for obj in _labels:
-            for k in keys:
-                _db[k].append(np.array(obj[k]))
+    def _lazy_load_json(self):
+        """Load the (annotation, image) records of the json annotation file."""
+        db = COCO(self._ann_file)
+        return [(db.anns[aid], db.loadImgs(db.anns[aid]['image_id'])[0]) for aid in db.anns.keys()]
 
-        _db['img_path'] = _items
-        for k in keys:
-            _db[k] = np.stack(_db[k])
-            assert _db[k].shape[0] == len(_labels)
+    def _parse_ann(self, record):
+        """Image path and label of an annotation record, none for tiny boxes."""
+        ann, img = record
 
-        joblib.dump(_db, self._ann_file + '.pt')
+        width, height = img['width'], img['height']
 
-    def _lazy_load_json(self):
-        """Load all image paths and labels from json annotation files into buffer."""
+        sequence_name = img['sequence']
+        img_name = img['file_name']
+        abs_path = os.path.join(
+            self._root, 'imageFiles', sequence_name, img_name)
 
-        items = []
-        labels = []
+        beta = np.array(ann['smpl_param']['shape']).reshape(10)
+        theta = np.array(ann['smpl_param']['pose']).reshape(24, 3)
 
-        db = COCO(self._ann_file)
-        cnt = 0
-
-        for aid in db.anns.keys():
-            ann = db.anns[aid]
-
-            img_id = ann['image_id']
-
-            img = db.loadImgs(img_id)[0]
-            width, height = img['width'], img['height']
-
-            sequence_name = img['sequence']
-            img_name = img['file_name']
-            abs_path = os.path.join(
-                self._root, 'imageFiles', sequence_name, img_name)
-
-            beta = np.array(ann['smpl_param']['shape']).reshape(10)
-            theta = np.array(ann['smpl_param']['pose']).reshape(24, 3)
-
-            x, y, w, h = ann['bbox']
-            xmin, ymin, xmax, ymax = bbox_clip_xyxy(bbox_xywh_to_xyxy(ann['bbox']), width, height)
-            if xmin > xmax - 5 or ymin > ymax - 5:
-                continue
-
-            f = np.array(img['cam_param']['focal'], dtype=np.float32)
-            c = np.array(img['cam_param']['princpt'], dtype=np.float32)
-
-            joint_cam_17 = np.array(ann['h36m_joints'], dtype=np.float32).reshape(17, 3)
-            joint_vis_17 = np.ones((17, 3))
-            joint_img_17 = np.zeros((17, 3))
-
-            joint_relative_17 = joint_cam_17 - joint_cam_17[self.root_idx_17, :]
-
-            joint_cam = np.array(ann['smpl_joint_cam'])
-            if joint_cam.size == 24 * 3:
-                joint_cam_29 = np.zeros((29, 3))
-                joint_cam_29[:24, :] = joint_cam.reshape(24, 3)
-            else:
-                joint_cam_29 = joint_cam.reshape(29, 3)
-
-            joint_img = np.array(ann['smpl_joint_img'], dtype=np.float32).reshape(24, 3)
-            if joint_img.size == 24 * 3:
-                joint_img_29 = np.zeros((29, 3))
-                joint_img_29[:24, :] = joint_img.reshape(24, 3)
-            else:
-                joint_img_29 = joint_img.reshape(29, 3)
-
-            joint_img_29[:, 2] = joint_img_29[:, 2] - joint_img_29[self.root_idx_smpl, 2]
-
-            joint_vis_24 = np.ones((24, 3))
-            joint_vis_29 = np.zeros((29, 3))
-            joint_vis_29[:24, :] = joint_vis_24
-
-            root_cam = joint_cam_29[self.root_idx_smpl]
-
-            items.append(abs_path)
-            labels.append({
-                'bbox': (xmin, ymin, xmax, ymax),
-                'img_id': cnt,
-                'img_path': abs_path,
-                'img_name': img_name,
-                'width': width,
-                'height': height,
-                'joint_img_17': joint_img_17,
-                'joint_vis_17': joint_vis_17,
-                'joint_cam_17': joint_cam_17,
-                'joint_relative_17': joint_relative_17,
-                'joint_img_29': joint_img_29,
-                'joint_vis_29': joint_vis_29,
-                'joint_cam_29': joint_cam_29,
-                'beta': beta,
-                'theta': theta,
-                'root_cam': root_cam,
-                'f': f,
-                'c': c
-            })
-            cnt += 1
-
-        return items, labels
+        x, y, w, h = ann['bbox']
+        xmin, ymin, xmax, ymax = bbox_clip_xyxy(bbox_xywh_to_xyxy(ann['bbox']), width, height)
+        if xmin > xmax - 5 or ymin > ymax - 5:
+            return []
+
+        f = np.array(img['cam_param']['focal'], dtype=np.float32)
+        c = np.array(img['cam_param']['princpt'], dtype=np.float32)
+
+        joint_cam_17 = np.array(ann['h36m_joints'], dtype=np.float32).reshape(17, 3)
+        joint_vis_17 = np.ones((17, 3))
+        joint_img_17 = np.zeros((17, 3))
+
+        joint_relative_17 = joint_cam_17 - joint_cam_17[self.root_idx_17, :]
+
+        joint_cam = np.array(ann['smpl_joint_cam'])
+        if joint_cam.size == 24 * 3:
+            joint_cam_29 = np.zeros((29, 3))
+            joint_cam_29[:24, :] = joint_cam.reshape(24, 3)
+        else:
+            joint_cam_29 = joint_cam.reshape(29, 3)
+
+        joint_img = np.array(ann['smpl_joint_img'], dtype=np.float32).reshape(24, 3)
+        if joint_img.size == 24 * 3:
+            joint_img_29 = np.zeros((29, 3))
+            joint_img_29[:24, :] = joint_img.reshape(24, 3)
+        else:
+            joint_img_29 = joint_img.reshape(29, 3)
+
+        joint_img_29[:, 2] = joint_img_29[:, 2] - joint_img_29[self.root_idx_smpl, 2]
+
+        joint_vis_24 = np.ones((24, 3))
+        joint_vis_29 = np.zeros((29, 3))
+        joint_vis_29[:24, :] = joint_vis_24
+
+        root_cam = joint_cam_29[self.root_idx_smpl]
+
+        return [(abs_path, {
+            'bbox': (xmin, ymin, xmax, ymax),
+            # sample index, set after parsing
+            'img_id': -1,
+            'img_path': abs_path,
+            'img_name': img_name,
+            'width': width,
+            'height': height,
+            'joint_img_17': joint_img_17,
+            'joint_vis_17': joint_vis_17,
+            'joint_cam_17': joint_cam_17,
+            'joint_relative_17': joint_relative_17,
+            'joint_img_29': joint_img_29,
+            'joint_vis_29': joint_vis_29,
+            'joint_cam_29': joint_cam_29,
+            'beta': beta,
+            'theta': theta,
+            'root_cam': root_cam,
+            'f': f,
+            'c': c
+        })]
 
     @property
     def joint_pairs_17(self):
@@ -4,6 +4,8 @@ from easydict import EasyDict as edict
 from torch.nn import functional as F
 
 from hybrik.models.layers.smplx.body_models import SMPLXLayer
+from hybrik.utils.camera import refine_camera_scale
+from hybrik.utils.precision import backbone_autocast, get_amp_dtype
 
 from .builder import SPPE
 from .layers.hrnet.hrnet_25d import get_hrnet25d
@@ -61,6 +63,7 @@ class HRNetSMPLXCamKid(nn.Module):
         self.height_dim = kwargs['HEATMAP_SIZE'][0]
         self.width_dim = kwargs['HEATMAP_SIZE'][1]
         self.smpl_dtype = torch.float32
+        self.amp_dtype = get_amp_dtype(kwargs['AMP']) if 'AMP' in kwargs else None
         self.use_kid = kwargs['EXTRA']['USE_KID']
 
         self.preact = get_hrnet25d(
@@ -181,105 +184,44 @@ class HRNetSMPLXCamKid(nn.Module):
 
     def update_scale(self, pred_uvd, weight, init_scale, pred_shape_full, pred_phi, **kwargs):
         batch_size = pred_uvd.shape[0]
-        cam_depth = self.focal_length / (self.input_size * init_scale + 1e-9)
         pred_phi = pred_phi.reshape(batch_size, -1, 2)
 
-        pred_xyz = torch.zeros_like(pred_uvd)
-
         weight = weight.clamp_min(0)
 
-        if 'bboxes' in kwargs.keys():
-            bboxes = kwargs['bboxes']
-            img_center = kwargs['img_center']
-
-            cx = (bboxes[:, 0] + bboxes[:, 2]) * 0.5
-            cy = (bboxes[:, 1] + bboxes[:, 3]) * 0.5
-            w = (bboxes[:, 2] - bboxes[:, 0])
-            h = (bboxes[:, 3] - bboxes[:, 1])
-
-            cx = cx - img_center[:, 0]
-            cy = cy - img_center[:, 1]
-            cx = cx / w
-            cy = cy / h
-
-            bbox_center = torch.stack((cx, cy), dim=1).unsqueeze(dim=1)
-
-            pred_xyz[:, :, 2:] = pred_uvd[:, :, 2:].clone()  # unit: (self.depth_factor m)
-            pred_xy = ((pred_uvd[:, :, :2] + bbox_center) * self.input_size / self.focal_length) \
-                * (pred_xyz[:, :, 2:] * self.depth_factor + cam_depth)  # unit: m
-
-            pred_xyz[:, :, :2] = pred_xy / self.depth_factor  # unit: (self.depth_factor m)
-
-            camera_root = pred_xyz[:, 0, :] * self.depth_factor
-        else:
-            # copy z
-            pred_xyz[:, :, 2:] = pred_uvd[:, :, 2:].clone()  # unit: (self.depth_factor m)
-            # back-project xy
-            pred_xy = (pred_uvd[:, :, :2] * self.input_size / self.focal_length) \
-                * (pred_xyz[:, :, 2:] * self.depth_factor + cam_depth)  # unit: m
-
-            # unit: (self.depth_factor m)
-            pred_xyz[:, :, :2] = pred_xy / self.depth_factor
-
-            # unit: m
-            camera_root = pred_xyz[:, 0, :] * self.depth_factor
-
-        pred_xyz = pred_xyz - pred_xyz[:, [0]]
-
         pred_beta = pred_shape_full[:, :11]
         pred_expression = pred_shape_full[:, 11:]
-        output = self.smplx_layer.hybrik(
-            betas=pred_beta.type(self.smpl_dtype),
-            expression=pred_expression.type(self.smpl_dtype),
-            pose_skeleton=pred_xyz.type(self.smpl_dtype) * 2.2,
-            phis=pred_phi.type(self.smpl_dtype),
-            return_verts=True,
-            naive=True
-        )
-
-        num_joints = 22
-        # unit: m
-        pred_xyz55 = output.joints.float()[:, :num_joints]
-        pred_xyz55 = pred_xyz55 - pred_xyz55.reshape(batch_size, -1, 3)[:, [0], :]
-        pred_xyz55 = pred_xyz55 + camera_root.unsqueeze(dim=1)
-
-        pred_uvd55 = pred_uvd[:, :num_joints, :].clone()
-        if 'bboxes' in kwargs.keys():
-            pred_uvd55[:, :, :2] = pred_uvd55[:, :, :2] + bbox_center
-
-        bs = pred_uvd.shape[0]
-        # [B, K, 1]
-        weight_uv55 = weight[:, :num_joints, :].reshape(bs, num_joints, 1)
-
-        Ax = torch.zeros((bs, num_joints, 1), device=pred_uvd.device, dtype=pred_uvd.dtype)
-        Ay = torch.zeros((bs, num_joints, 1), device=pred_uvd.device, dtype=pred_uvd.dtype)
-
-        Ax[:, :, 0] = pred_uvd55[:, :, 0]
-        Ay[:, :, 0] = pred_uvd55[:, :, 1]
-
-        Ax = Ax * weight_uv55
-        Ay = Ay * weight_uv55
-
-        # [B, 2K, 1]
-        A = torch.cat((Ax, Ay), dim=1)
-
-        bx = (pred_xyz55[:, :, 0] - self.input_size * pred_uvd55[:, :, 0] / self.focal_length * pred_xyz55[:, :, 2]) * weight_uv55[:, :, 0]
-        by = (pred_xyz55[:, :, 1] - self.input_size * pred_uvd55[:, :, 1] / self.focal_length * pred_xyz55[:, :, 2]) * weight_uv55[:, :, 0]
 
-        # [B, 2K, 1]
-        b = torch.cat((bx, by), dim=1)[:, :, None]
-        res = torch.inverse(A.transpose(1, 2).bmm(A)).bmm(A.transpose(1, 2)).bmm(b)
-
-        scale = 1.0 / res
-
-        assert scale.shape == init_scale.shape
-
-        return scale
+        def joints_fn(pred_xyz):
+            output = self.smplx_layer.hybrik(
+                betas=pred_beta.type(self.smpl_dtype),
+                expression=pred_expression.type(self.smpl_dtype),
+                pose_skeleton=pred_xyz.type(self.smpl_dtype) * 2.2,
+                phis=pred_phi.type(self.smpl_dtype),
+                return_verts=False,
+                naive=True
+            )
+            return output.joints
+
+        return refine_camera_scale(
+            pred_uvd, weight, init_scale, joints_fn,
+            focal_length=self.focal_length, input_size=self.input_size,
+            depth_factor=self.depth_factor, num_joints=22,
+            bboxes=kwargs.get('bboxes'), img_center=kwargs.get('img_center'))
 
     def forward(self, x, flip_test=False, **kwargs):
         batch_size = x.shape[0]
 
-        out_uv, out_z, x0 = self.preact(x)
+        if flip_test:
+            # run the original and flipped images as one 2B batch
+            x = torch.cat((x, flip(x)), dim=0)
+
+        with backbone_autocast(x.device, self.amp_dtype):
+            out_uv, out_z, x0 = self.preact(x)
+        out_uv, out_z, x0 = out_uv.float(), out_z.float(), x0.float()
+
+        if flip_test:
+            flip_out_uv, flip_out_z = out_uv[batch_size:], out_z[batch_size:]
+            out_uv, out_z = out_uv[:batch_size], out_z[:batch_size]
 
         out_uv = out_uv.reshape(batch_size, self.num_joints, self.height_dim * self.width_dim)
         out_z = out_z.reshape(batch_size, self.num_joints, self.depth_dim)
@@ -288,9 +230,6 @@ class HRNetSMPLXCamKid(nn.Module):
         heatmaps_z = norm_heatmap(self.norm_type, out_z)
 
         if flip_test:
-            flip_x = flip(x)
-            flip_out_uv, flip_out_z, flip_x0 = self.preact(flip_x)
-
             # flip heatmap
             flip_out_uv = flip_out_uv.reshape(batch_size, self.num_joints, self.height_dim, self.width_dim)
             flip_out_z = flip_out_z.reshape(batch_size, self.num_joints, self.depth_dim)
@@ -340,30 +279,38 @@ class HRNetSMPLXCamKid(nn.Module):
         xc = x0
 
         pred_shape_full = self.decshape(xc)
+        pred_phi = self.decphi(xc)
+        pred_camera = self.deccam(xc)
+        sigma = self.decsigma(xc)
+
+        if flip_test:
+            x0 = x0[:batch_size]
+            pred_shape_full, flip_pred_shape = pred_shape_full[:batch_size], pred_shape_full[batch_size:]
+            pred_phi, flip_pred_phi = pred_phi[:batch_size], pred_phi[batch_size:]
+            pred_camera, flip_pred_camera = pred_camera[:batch_size], pred_camera[batch_size:]
+            sigma, flip_sigma = sigma[:batch_size], sigma[batch_size:]
+
         pred_beta = pred_shape_full[:, :11]
         pred_expression = pred_shape_full[:, 11:]
 
-        pred_phi = self.decphi(xc)
-        pred_camera = self.deccam(xc).reshape(batch_size, -1) + init_cam
+        pred_camera = pred_camera.reshape(batch_size, -1) + init_cam
 
-        sigma = self.decsigma(xc).reshape(batch_size, self.num_joints, 1).sigmoid()
+        sigma = sigma.reshape(batch_size, self.num_joints, 1).sigmoid()
 
         pred_phi = pred_phi.reshape(batch_size, -1, 2)
 
         if flip_test:
-            flip_pred_shape = self.decshape(flip_x0)
             pred_shape_full = (flip_pred_shape + pred_shape_full) / 2
 
             pred_beta = pred_shape_full[:, :11]
             pred_expression = pred_shape_full[:, 11:]
 
-            flip_pred_phi = self.decphi(flip_x0)
             flip_pred_phi = flip_pred_phi.reshape(batch_size, -1, 2)
             flip_pred_phi = self.flip_phi(flip_pred_phi)
             pred_phi = (pred_phi + flip_pred_phi) / 2
 
-            flip_pred_camera = self.deccam(flip_x0).reshape(batch_size, -1) + init_cam
-            flip_sigma = self.decsigma(flip_x0).reshape(batch_size, self.num_joints, 1).sigmoid()
+            flip_pred_camera = flip_pred_camera.reshape(batch_size, -1) + init_cam
+            flip_sigma = flip_sigma.reshape(batch_size, self.num_joints, 1).sigmoid()
             pred_camera = 2 / (1 / flip_pred_camera + 1 / pred_camera)
 
             flip_sigma = self.flip_sigma(flip_sigma)
@@ -4,6 +4,8 @@ from easydict import EasyDict as edict
 from torch.nn import functional as F
 
 from hybrik.models.layers.smplx.body_models import SMPLXLayer
+from hybrik.utils.camera import refine_camera_scale
+from hybrik.utils.precision import backbone_autocast, get_amp_dtype
 from hybrik.utils.transforms import flip_coord
 
 from .builder import SPPE
@@ -62,6 +64,7 @@ class HRNetSMPLXCamKidReg(nn.Module):
         self.height_dim = kwargs['HEATMAP_SIZE'][0]
         self.width_dim = kwargs['HEATMAP_SIZE'][1]
         self.smpl_dtype = torch.float32
+        self.amp_dtype = get_amp_dtype(kwargs['AMP']) if 'AMP' in kwargs else None
         self.use_kid = kwargs['EXTRA']['USE_KID']
 
         self.preact = get_hrnet(kwargs['HRNET_TYPE'], num_joints=70,
@@ -150,104 +153,36 @@ class HRNetSMPLXCamKidReg(nn.Module):
 
     def update_scale(self, pred_uvd, weight, init_scale, pred_shape_full, pred_phi, **kwargs):
         batch_size = pred_uvd.shape[0]
-        cam_depth = self.focal_length / (self.input_size * init_scale + 1e-9)
         pred_phi = pred_phi.reshape(batch_size, -1, 2)
 
-        pred_xyz = torch.zeros_like(pred_uvd)
-
         weight = weight.clamp_min(0)
 
-        if 'bboxes' in kwargs.keys():
-            bboxes = kwargs['bboxes']
-            img_center = kwargs['img_center']
-
-            cx = (bboxes[:, 0] + bboxes[:, 2]) * 0.5
-            cy = (bboxes[:, 1] + bboxes[:, 3]) * 0.5
-            w = (bboxes[:, 2] - bboxes[:, 0])
-            h = (bboxes[:, 3] - bboxes[:, 1])
-
-            cx = cx - img_center[:, 0]
-            cy = cy - img_center[:, 1]
-            cx = cx / w
-            cy = cy / h
-
-            bbox_center = torch.stack((cx, cy), dim=1).unsqueeze(dim=1)
-
-            pred_xyz[:, :, 2:] = pred_uvd[:, :, 2:].clone()  # unit: (self.depth_factor m)
-            pred_xy = ((pred_uvd[:, :, :2] + bbox_center) * self.input_size / self.focal_length) \
-                * (pred_xyz[:, :, 2:] * self.depth_factor + cam_depth)  # unit: m
-
-            pred_xyz[:, :, :2] = pred_xy / self.depth_factor  # unit: (self.depth_factor m)
-
-            camera_root = pred_xyz[:, 0, :] * self.depth_factor
-        else:
-            # copy z
-            pred_xyz[:, :, 2:] = pred_uvd[:, :, 2:].clone()  # unit: (self.depth_factor m)
-            # back-project xy
-            pred_xy = (pred_uvd[:, :, :2] * self.input_size / self.focal_length) \
-                * (pred_xyz[:, :, 2:] * self.depth_factor + cam_depth)  # unit: m
-
-            # unit: (self.depth_factor m)
-            pred_xyz[:, :, :2] = pred_xy / self.depth_factor
-
-            # unit: m
-            camera_root = pred_xyz[:, 0, :] * self.depth_factor
-
-        pred_xyz = pred_xyz - pred_xyz[:, [0]]
-
         pred_beta = pred_shape_full[:, :11]
         pred_expression = pred_shape_full[:, 11:]
-        output = self.smplx_layer.hybrik(
-            betas=pred_beta.type(self.smpl_dtype),
-            expression=pred_expression.type(self.smpl_dtype),
-            pose_skeleton=pred_xyz.type(self.smpl_dtype) * 2.2,
-            phis=pred_phi.type(self.smpl_dtype),
-            return_verts=True,
-            naive=True
-        )
-
-        # unit: m
-        pred_xyz55 = output.joints.float()[:, :55]
-        pred_xyz55 = pred_xyz55 - pred_xyz55.reshape(batch_size, -1, 3)[:, [0], :]
-        pred_xyz55 = pred_xyz55 + camera_root.unsqueeze(dim=1)
-
-        pred_uvd55 = pred_uvd[:, :55, :].clone()
-        if 'bboxes' in kwargs.keys():
-            pred_uvd55[:, :, :2] = pred_uvd55[:, :, :2] + bbox_center
-
-        bs = pred_uvd.shape[0]
-        # [B, K, 1]
-        weight_uv55 = weight[:, :55, :].reshape(bs, 55, 1)
-
-        Ax = torch.zeros((bs, 55, 1), device=pred_uvd.device, dtype=pred_uvd.dtype)
-        Ay = torch.zeros((bs, 55, 1), device=pred_uvd.device, dtype=pred_uvd.dtype)
-
-        Ax[:, :, 0] = pred_uvd55[:, :, 0]
-        Ay[:, :, 0] = pred_uvd55[:, :, 1]
-
-        Ax = Ax * weight_uv55
-        Ay = Ay * weight_uv55
-
-        # [B, 2K, 1]
-        A = torch.cat((Ax, Ay), dim=1)
-
-        bx = (pred_xyz55[:, :, 0] - self.input_size * pred_uvd55[:, :, 0] / self.focal_length * pred_xyz55[:, :, 2]) * weight_uv55[:, :, 0]
-        by = (pred_xyz55[:, :, 1] - self.input_size * pred_uvd55[:, :, 1] / self.focal_length * pred_xyz55[:, :, 2]) * weight_uv55[:, :, 0]
-
-        # [B, 2K, 1]
-        b = torch.cat((bx, by), dim=1)[:, :, None]
-        res = torch.inverse(A.transpose(1, 2).bmm(A)).bmm(A.transpose(1, 2)).bmm(b)
-
-        scale = 1.0 / res
-
-        assert scale.shape == init_scale.shape
 
-        return scale
+        def joints_fn(pred_xyz):
+            output = self.smplx_layer.hybrik(
+                betas=pred_beta.type(self.smpl_dtype),
+                expression=pred_expression.type(self.smpl_dtype),
+                pose_skeleton=pred_xyz.type(self.smpl_dtype) * 2.2,
+                phis=pred_phi.type(self.smpl_dtype),
+                return_verts=False,
+                naive=True
+            )
+            return output.joints
+
+        return refine_camera_scale(
+            pred_uvd, weight, init_scale, joints_fn,
+            focal_length=self.focal_length, input_size=self.input_size,
+            depth_factor=self.depth_factor, num_joints=55,
+            bboxes=kwargs.get('bboxes'), img_center=kwargs.get('img_center'))
 
     def forward(self, x, flip_test=False, **kwargs):
         batch_size, _, _, width_dim = x.shape
 
-        x0 = self.preact(x)
+        with backbone_autocast(x.device, self.amp_dtype):
+            x0 = self.preact(x)
+        x0 = x0.float()
 
         x0 = x0.view(x0.size(0), -1)
         init_cam = self.init_cam.expand(batch_size, -1)  # (B, 1,)
@@ -273,7 +208,9 @@ class HRNetSMPLXCamKidReg(nn.Module):
 
         if flip_test:
             flip_x = flip(x)
-            flip_x0 = self.preact(flip_x)
+            with backbone_autocast(x.device, self.amp_dtype):
+                flip_x0 = self.preact(flip_x)
+            flip_x0 = flip_x0.float()
 
             flip_out_coord = self.fc_coord(flip_x0).reshape(batch_size, (self.num_joints - 1), 3)
             flip_out_sigma = self.decsigma(flip_x0).sigmoid().reshape(batch_size, (self.num_joints - 1), 1)
@@ -321,16 +258,13 @@ class HRNetSMPLXCamKidReg(nn.Module):
 
         ice_step = 3
         for _ in range(ice_step):
-            try:
-                camScale = self.update_scale(
-                    pred_uvd=pred_uvd_jts,
-                    weight=1 - out_sigma * 10,
-                    init_scale=camScale,
-                    pred_shape_full=pred_shape_full,
-                    pred_phi=pred_phi,
-                    **kwargs)
-            except RuntimeError:
-                pass
+            camScale = self.update_scale(
+                pred_uvd=pred_uvd_jts,
+                weight=1 - out_sigma * 10,
+                init_scale=camScale,
+                pred_shape_full=pred_shape_full,
+                pred_phi=pred_phi,
+                **kwargs)
 
         camDepth = self.focal_length / (self.input_size * camScale + 1e-9)
 
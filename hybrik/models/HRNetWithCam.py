@@ -5,6 +5,10 @@ import torch
 import torch.nn as nn
 from torch.nn import functional as F
 
+from hybrik.utils.camera import refine_camera_scale
+from hybrik.utils.heatmap import flip_index_from_pairs, soft_argmax_3d
+from hybrik.utils.precision import backbone_autocast, get_amp_dtype
+
 from .builder import SPPE
 from .layers.smpl.SMPL import SMPL_layer
 from .layers.hrnet.hrnet import get_hrnet
@@ -61,6 +65,7 @@ class HRNetSMPLCam(nn.Module):
         self.height_dim = kwargs['HEATMAP_SIZE'][0]
         self.width_dim = kwargs['HEATMAP_SIZE'][1]
         self.smpl_dtype = torch.float32
+        self.amp_dtype = get_amp_dtype(kwargs['AMP']) if 'AMP' in kwargs else None
         self.pretrain_hrnet = kwargs['HR_PRETRAINED']
 
         self.preact = get_hrnet(kwargs['HRNET_TYPE'], num_joints=self.num_joints,
@@ -89,6 +94,10 @@ class HRNetSMPLCam(nn.Module):
                                (22, 23), (25, 26), (27, 28))
 
         self.root_idx_smpl = 0
+        self.register_buffer(
+            'flip_index_29', flip_index_from_pairs(29, self.joint_pairs_29), persistent=False)
+        # joints normalized at once by the soft-argmax, bounds the peak heatmap memory
+        self.heatmap_chunk = kwargs['HEATMAP_CHUNK'] if 'HEATMAP_CHUNK' in kwargs else 8
 
         # mean shape
         init_shape = np.load('./model_files/h36m_mean_beta.npy')
@@ -168,122 +177,14 @@ class HRNetSMPLCam(nn.Module):
             heatmaps[:, idx] = heatmaps[:, inv_idx]
 
         if shift:
-            if heatmaps.dim() == 3:
-                heatmaps[:, :, 1:] = heatmaps[:, :, 0:-1]
-            elif heatmaps.dim() == 4:
-                heatmaps[:, :, :, 1:] = heatmaps[:, :, :, 0:-1]
-            else:
-                heatmaps[:, :, :, :, 1:] = heatmaps[:, :, :, :, 0:-1]
+            # out of place, an overlapping in-place shift smears the columns
+            heatmaps = torch.cat((heatmaps[..., :1], heatmaps[..., :-1]), dim=-1)
 
         return heatmaps
 
-    def update_scale(self, pred_uvd, weight, init_scale, pred_shape, pred_phi, **kwargs):
-        cam_depth = self.focal_length / (self.input_size * init_scale + 1e-9)
-        pred_phi = pred_phi.reshape(-1, 23, 2)
-
-        pred_xyz = torch.zeros_like(pred_uvd)
-
-        if 'bboxes' in kwargs.keys():
-            bboxes = kwargs['bboxes']
-            img_center = kwargs['img_center']
-
-            cx = (bboxes[:, 0] + bboxes[:, 2]) * 0.5
-            cy = (bboxes[:, 1] + bboxes[:, 3]) * 0.5
-            w = (bboxes[:, 2] - bboxes[:, 0])
-            h = (bboxes[:, 3] - bboxes[:, 1])
-
-            cx = cx - img_center[:, 0]
-            cy = cy - img_center[:, 1]
-            cx = cx / w
-            cy = cy / h
-
-            bbox_center = torch.stack((cx, cy), dim=1).unsqueeze(dim=1)
-
-            pred_xyz[:, :, 2:] = pred_uvd[:, :, 2:].clone()  # unit: (self.depth_factor m)
-            pred_xy = ((pred_uvd[:, :, :2] + bbox_center) * self.input_size / self.focal_length) \
-                * (pred_xyz[:, :, 2:] * self.depth_factor + cam_depth)  # unit: m
-
-            pred_xyz[:, :, :2] = pred_xy / self.depth_factor  # unit: (self.depth_factor m)
-
-            camera_root = pred_xyz[:, 0, :] * self.depth_factor
-            # camera_root[:, 2] += camDepth[:, 0, 0]
-        else:
-            # copy z
-            pred_xyz[:, :, 2:] = pred_uvd[:, :, 2:].clone()  # unit: (self.depth_factor m)
-            # back-project xy
-            pred_xy = (pred_uvd[:, :, :2] * self.input_size / self.focal_length) \
-                * (pred_xyz[:, :, 2:] * self.depth_factor + cam_depth)  # unit: m
-
-            # unit: (self.depth_factor m)
-            pred_xyz[:, :, :2] = pred_xy / self.depth_factor
-
-            # unit: m
-            camera_root = pred_xyz[:, 0, :] * self.depth_factor
-            # camera_root[:, 2] += cam_depth[:, 0, 0]
-
-        pred_xyz = pred_xyz - pred_xyz[:, [0]]
-
-        output = self.smpl.hybrik(
-            pose_skeleton=pred_xyz.type(self.smpl_dtype) * self.depth_factor,  # unit: meter
-            betas=pred_shape.type(self.smpl_dtype),
-            phis=pred_phi.type(self.smpl_dtype),
-            global_orient=None,
-            return_verts=True,
-            naive=True
-        )
-
-        # unit: m
-        pred_xyz24 = output.joints.float()
-        pred_xyz24 = pred_xyz24 - pred_xyz24.reshape(-1, 24, 3)[:, [0], :]
-        pred_xyz24 = pred_xyz24 + camera_root.unsqueeze(dim=1)
-
-        pred_uvd24 = pred_uvd[:, :24, :].clone()
-        if 'bboxes' in kwargs.keys():
-            pred_uvd24[:, :, :2] = pred_uvd24[:, :, :2] + bbox_center
-
-        bs = pred_uvd.shape[0]
-        # [B, K, 1]
-        weight_uv24 = weight[:, :24, :].reshape(bs, 24, 1)
-
-        Ax = torch.zeros((bs, 24, 1), device=pred_uvd.device, dtype=pred_uvd.dtype)
-        Ay = torch.zeros((bs, 24, 1), device=pred_uvd.device, dtype=pred_uvd.dtype)
-
-        Ax[:, :, 0] = pred_uvd24[:, :, 0]
-        Ay[:, :, 0] = pred_uvd24[:, :, 1]
-
-        Ax = Ax * weight_uv24
-        Ay = Ay * weight_uv24
-
-        # [B, 2K, 1]
-        A = torch.cat((Ax, Ay), dim=1)
-
-        bx = (pred_xyz24[:, :, 0] - self.input_size * pred_uvd24[:, :, 0] / self.focal_length * pred_xyz24[:, :, 2]) * weight_uv24[:, :, 0]
-        by = (pred_xyz24[:, :, 1] - self.input_size * pred_uvd24[:, :, 1] / self.focal_length * pred_xyz24[:, :, 2]) * weight_uv24[:, :, 0]
-
-        # [B, 2K, 1]
-        b = torch.cat((bx, by), dim=1)[:, :, None]
-        res = torch.inverse(A.transpose(1, 2).bmm(A)).bmm(A.transpose(1, 2)).bmm(b)
-
-        scale = 1.0 / res
-
-        assert scale.shape == init_scale.shape
-
-        return scale
-
-    def forward(self, x, flip_test=False, **kwargs):
-        batch_size = x.shape[0]
-
-        # x0 = self.preact(x)
-        out, x0 = self.preact(x)
-        # print(out.shape)
-        out = out.reshape(batch_size, self.num_joints, self.depth_dim, self.height_dim, self.width_dim)
-
-        if flip_test:
-            flip_x = flip(x)
-            flip_out, flip_x0 = self.preact(flip_x)
-
+    def integral_heatmap(self, out, flip_out=None):
+        if flip_out is not None:
             # flip heatmap
-            flip_out = flip_out.reshape(batch_size, self.num_joints, self.depth_dim, self.height_dim, self.width_dim)
             flip_out = self.flip_heatmap(flip_out)
 
             out = out.reshape((out.shape[0], self.num_joints, -1))
@@ -299,14 +200,9 @@ class HRNetSMPLCam(nn.Module):
             heatmaps = norm_heatmap(self.norm_type, out)
 
         assert heatmaps.dim() == 3, heatmaps.shape
-        # assert hypo_heatmaps.dim() == 4, heatmaps.shape
-        # print(hypo_heatmaps.shape)
 
         maxvals, _ = torch.max(heatmaps, dim=2, keepdim=True)
 
-        # print(out.sum(dim=2, keepdim=True))
-        # heatmaps = out / out.sum(dim=2, keepdim=True)
-
         heatmaps = heatmaps.reshape((heatmaps.shape[0], self.num_joints, self.depth_dim, self.height_dim, self.width_dim))
 
         hm_x0 = heatmaps.sum((2, 3))  # (B, K, W)
@@ -314,13 +210,6 @@ class HRNetSMPLCam(nn.Module):
         hm_z0 = heatmaps.sum((3, 4))  # (B, K, D)
 
         range_tensor = torch.arange(hm_x0.shape[-1], dtype=torch.float32, device=hm_x0.device).unsqueeze(-1)
-        # hm_x = hm_x0 * range_tensor
-        # hm_y = hm_y0 * range_tensor
-        # hm_z = hm_z0 * range_tensor
-
-        # coord_x = hm_x.sum(dim=2, keepdim=True)
-        # coord_y = hm_y.sum(dim=2, keepdim=True)
-        # coord_z = hm_z.sum(dim=2, keepdim=True)
         coord_x = hm_x0.matmul(range_tensor)
         coord_y = hm_y0.matmul(range_tensor)
         coord_z = hm_z0.matmul(range_tensor)
@@ -330,7 +219,62 @@ class HRNetSMPLCam(nn.Module):
         coord_z = coord_z / float(self.depth_dim) - 0.5
 
         #  -0.5 ~ 0.5
-        pred_uvd_jts_29 = torch.cat((coord_x, coord_y, coord_z), dim=2)
+        return torch.cat((coord_x, coord_y, coord_z), dim=2), maxvals
+
+    def update_scale(self, pred_uvd, weight, init_scale, pred_shape, pred_phi, **kwargs):
+        pred_phi = pred_phi.reshape(-1, 23, 2)
+
+        def joints_fn(pred_xyz):
+            output = self.smpl.hybrik(
+                pose_skeleton=pred_xyz.type(self.smpl_dtype) * self.depth_factor,  # unit: meter
+                betas=pred_shape.type(self.smpl_dtype),
+                phis=pred_phi.type(self.smpl_dtype),
+                global_orient=None,
+                return_verts=False,
+                naive=True
+            )
+            return output.joints
+
+        return refine_camera_scale(
+            pred_uvd, weight, init_scale, joints_fn,
+            focal_length=self.focal_length, input_size=self.input_size,
+            depth_factor=self.depth_factor, num_joints=24,
+            bboxes=kwargs.get('bboxes'), img_center=kwargs.get('img_center'))
+
+    def forward_network(self, x, flip_test=False):
+        ''' Backbone, soft-argmax and regression heads, without the kinematics.
+
+            Returns
+            -------
+            output: edict
+                pred_uvd_jts_29, maxvals, delta_shape, pred_shape, pred_phi,
+                pred_camera, sigma and img_feat, flip-averaged under
+                `flip_test`.
+        '''
+        batch_size = x.shape[0]
+
+        if flip_test:
+            # run the original and flipped images as one 2B batch
+            x = torch.cat((x, flip(x)), dim=0)
+
+        # x0 = self.preact(x)
+        with backbone_autocast(x.device, self.amp_dtype):
+            out, x0 = self.preact(x)
+        out, x0 = out.float(), x0.float()
+        # print(out.shape)
+        out = out.reshape(x.shape[0], self.num_joints, self.depth_dim, self.height_dim, self.width_dim)
+
+        if flip_test:
+            out, flip_out = out[:batch_size], out[batch_size:]
+        else:
+            flip_out = None
+
+        if self.norm_type == 'softmax':
+            #  -0.5 ~ 0.5
+            pred_uvd_jts_29, maxvals = soft_argmax_3d(
+                out, flip_out, self.flip_index_29, chunk_size=self.heatmap_chunk)
+        else:
+            pred_uvd_jts_29, maxvals = self.integral_heatmap(out, flip_out)
 
         x0 = x0.view(x0.size(0), -1)
         init_shape = self.init_shape.expand(batch_size, -1)     # (B, 10,)
@@ -339,20 +283,28 @@ class HRNetSMPLCam(nn.Module):
         xc = x0
 
         delta_shape = self.decshape(xc)
-        pred_shape = delta_shape + init_shape
         pred_phi = self.decphi(xc)
-        pred_camera = self.deccam(xc).reshape(batch_size, -1) + init_cam
-        sigma = self.decsigma(xc).reshape(batch_size, 29, 1).sigmoid()
+        pred_camera = self.deccam(xc)
+        sigma = self.decsigma(xc)
+
+        if flip_test:
+            x0 = x0[:batch_size]
+            delta_shape, flip_delta_shape = delta_shape[:batch_size], delta_shape[batch_size:]
+            pred_phi, flip_pred_phi = pred_phi[:batch_size], pred_phi[batch_size:]
+            pred_camera, flip_pred_camera = pred_camera[:batch_size], pred_camera[batch_size:]
+            sigma, flip_sigma = sigma[:batch_size], sigma[batch_size:]
+
+        pred_shape = delta_shape + init_shape
+        pred_camera = pred_camera.reshape(batch_size, -1) + init_cam
+        sigma = sigma.reshape(batch_size, 29, 1).sigmoid()
 
         pred_phi = pred_phi.reshape(batch_size, 23, 2)
 
         if flip_test:
 
-            flip_delta_shape = self.decshape(flip_x0)
             flip_pred_shape = flip_delta_shape + init_shape
-            flip_pred_phi = self.decphi(flip_x0)
-            flip_pred_camera = self.deccam(flip_x0).reshape(batch_size, -1) + init_cam
-            flip_sigma = self.decsigma(flip_x0).reshape(batch_size, 29, 1).sigmoid()
+            flip_pred_camera = flip_pred_camera.reshape(batch_size, -1) + init_cam
+            flip_sigma = flip_sigma.reshape(batch_size, 29, 1).sigmoid()
 
             pred_shape = (pred_shape + flip_pred_shape) / 2
 
@@ -365,21 +317,42 @@ class HRNetSMPLCam(nn.Module):
             flip_sigma = self.flip_sigma(flip_sigma)
             sigma = (sigma + flip_sigma) / 2
 
+        return edict(
+            pred_uvd_jts_29=pred_uvd_jts_29,
+            maxvals=maxvals,
+            delta_shape=delta_shape,
+            pred_shape=pred_shape,
+            pred_phi=pred_phi,
+            pred_camera=pred_camera,
+            sigma=sigma,
+            img_feat=x0
+        )
+
+    def forward(self, x, flip_test=False, **kwargs):
+        batch_size = x.shape[0]
+
+        net_output = self.forward_network(x, flip_test=flip_test)
+        pred_uvd_jts_29 = net_output.pred_uvd_jts_29
+        maxvals = net_output.maxvals
+        delta_shape = net_output.delta_shape
+        pred_shape = net_output.pred_shape
+        pred_phi = net_output.pred_phi
+        pred_camera = net_output.pred_camera
+        sigma = net_output.sigma
+        x0 = net_output.img_feat
+
         camScale = pred_camera[:, :1].unsqueeze(1)
         # camTrans = pred_camera[:, 1:].unsqueeze(1)
 
         if not self.training:
             weight = (1 - sigma * 10).clamp_min(0)
-            try:
-                camScale = self.update_scale(
-                    pred_uvd=pred_uvd_jts_29,
-                    weight=weight,
-                    init_scale=camScale,
-                    pred_shape=pred_shape,
-                    pred_phi=pred_phi,
-                    **kwargs)
-            except RuntimeError:
-                pass
+            camScale = self.update_scale(
+                pred_uvd=pred_uvd_jts_29,
+                weight=weight,
+                init_scale=camScale,
+                pred_shape=pred_shape,
+                pred_phi=pred_phi,
+                **kwargs)
 
         camDepth = self.focal_length / (self.input_size * camScale + 1e-9)
 
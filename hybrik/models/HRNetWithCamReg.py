@@ -9,6 +9,8 @@ from .builder import SPPE
 from .layers.smpl.SMPL import SMPL_layer
 from .layers.hrnet.hrnet import get_hrnet
 
+from hybrik.utils.camera import refine_camera_scale
+from hybrik.utils.precision import backbone_autocast, get_amp_dtype
 from hybrik.utils.transforms import flip_coord
 
 
@@ -63,6 +65,7 @@ class HRNetSMPLCamReg(nn.Module):
         self.height_dim = kwargs['HEATMAP_SIZE'][0]
         self.width_dim = kwargs['HEATMAP_SIZE'][1]
         self.smpl_dtype = torch.float32
+        self.amp_dtype = get_amp_dtype(kwargs['AMP']) if 'AMP' in kwargs else None
 
         self.preact = get_hrnet(kwargs['HRNET_TYPE'], num_joints=self.num_joints,
                                 depth_dim=self.depth_dim,
@@ -135,123 +138,65 @@ class HRNetSMPLCamReg(nn.Module):
         return pred_sigma
 
     def update_scale(self, pred_uvd, weight, init_scale, pred_shape, pred_phi, **kwargs):
-        cam_depth = self.focal_length / (self.input_size * init_scale + 1e-9)
         pred_phi = pred_phi.reshape(-1, 23, 2)
 
-        pred_xyz = torch.zeros_like(pred_uvd)
-
-        if 'bboxes' in kwargs.keys():
-            bboxes = kwargs['bboxes']
-            img_center = kwargs['img_center']
-
-            cx = (bboxes[:, 0] + bboxes[:, 2]) * 0.5
-            cy = (bboxes[:, 1] + bboxes[:, 3]) * 0.5
-            w = (bboxes[:, 2] - bboxes[:, 0])
-            h = (bboxes[:, 3] - bboxes[:, 1])
-
-            cx = cx - img_center[:, 0]
-            cy = cy - img_center[:, 1]
-            cx = cx / w
-            cy = cy / h
-
-            bbox_center = torch.stack((cx, cy), dim=1).unsqueeze(dim=1)
-
-            pred_xyz[:, :, 2:] = pred_uvd[:, :, 2:].clone()  # unit: (self.depth_factor m)
-            pred_xy = ((pred_uvd[:, :, :2] + bbox_center) * self.input_size / self.focal_length) \
-                * (pred_xyz[:, :, 2:] * self.depth_factor + cam_depth)  # unit: m
-
-            pred_xyz[:, :, :2] = pred_xy / self.depth_factor  # unit: (self.depth_factor m)
-
-            camera_root = pred_xyz[:, 0, :] * self.depth_factor
-            # camera_root[:, 2] += camDepth[:, 0, 0]
-        else:
-            # copy z
-            pred_xyz[:, :, 2:] = pred_uvd[:, :, 2:].clone()  # unit: (self.depth_factor m)
-            # back-project xy
-            pred_xy = (pred_uvd[:, :, :2] * self.input_size / self.focal_length) \
-                * (pred_xyz[:, :, 2:] * self.depth_factor + cam_depth)  # unit: m
-
-            # unit: (self.depth_factor m)
-            pred_xyz[:, :, :2] = pred_xy / self.depth_factor
-
-            # unit: m
-            camera_root = pred_xyz[:, 0, :] * self.depth_factor
-            # camera_root[:, 2] += cam_depth[:, 0, 0]
-
-        pred_xyz = pred_xyz - pred_xyz[:, [0]]
-
-        output = self.smpl.hybrik(
-            pose_skeleton=pred_xyz.type(self.smpl_dtype) * self.depth_factor,  # unit: meter
-            betas=pred_shape.type(self.smpl_dtype),
-            phis=pred_phi.type(self.smpl_dtype),
-            global_orient=None,
-            return_verts=True
-        )
-
-        # unit: m
-        pred_xyz24 = output.joints.float()
-        pred_xyz24 = pred_xyz24 - pred_xyz24.reshape(-1, 24, 3)[:, [0], :]
-        pred_xyz24 = pred_xyz24 + camera_root.unsqueeze(dim=1)
-
-        pred_uvd24 = pred_uvd[:, :24, :].clone()
-        if 'bboxes' in kwargs.keys():
-            pred_uvd24[:, :, :2] = pred_uvd24[:, :, :2] + bbox_center
-
-        bs = pred_uvd.shape[0]
-        # [B, K, 1]
-        weight_uv24 = weight[:, :24, :].reshape(bs, 24, 1)
-
-        Ax = torch.zeros((bs, 24, 1), device=pred_uvd.device, dtype=pred_uvd.dtype)
-        Ay = torch.zeros((bs, 24, 1), device=pred_uvd.device, dtype=pred_uvd.dtype)
-
-        Ax[:, :, 0] = pred_uvd24[:, :, 0]
-        Ay[:, :, 0] = pred_uvd24[:, :, 1]
-
-        Ax = Ax * weight_uv24
-        Ay = Ay * weight_uv24
-
-        # [B, 2K, 1]
-        A = torch.cat((Ax, Ay), dim=1)
-
-        bx = (pred_xyz24[:, :, 0] - self.input_size * pred_uvd24[:, :, 0] / self.focal_length * pred_xyz24[:, :, 2]) * weight_uv24[:, :, 0]
-        by = (pred_xyz24[:, :, 1] - self.input_size * pred_uvd24[:, :, 1] / self.focal_length * pred_xyz24[:, :, 2]) * weight_uv24[:, :, 0]
-
-        # [B, 2K, 1]
-        b = torch.cat((bx, by), dim=1)[:, :, None]
-        res = torch.inverse(A.transpose(1, 2).bmm(A)).bmm(A.transpose(1, 2)).bmm(b)
-
-        scale = 1.0 / res
-
-        assert scale.shape == init_scale.shape
-
-        return scale
+        def joints_fn(pred_xyz):
+            output = self.smpl.hybrik(
+                pose_skeleton=pred_xyz.type(self.smpl_dtype) * self.depth_factor,  # unit: meter
+                betas=pred_shape.type(self.smpl_dtype),
+                phis=pred_phi.type(self.smpl_dtype),
+                global_orient=None,
+                return_verts=False
+            )
+            return output.joints
+
+        return refine_camera_scale(
+            pred_uvd, weight, init_scale, joints_fn,
+            focal_length=self.focal_length, input_size=self.input_size,
+            depth_factor=self.depth_factor, num_joints=24,
+            bboxes=kwargs.get('bboxes'), img_center=kwargs.get('img_center'))
 
     def forward(self, x, flip_test=False, **kwargs):
         batch_size, _, _, width_dim = x.shape
 
+        if flip_test:
+            # run the original and flipped images as one 2B batch
+            x = torch.cat((x, flip(x)), dim=0)
+
         # x0 = self.preact(x)
-        x0 = self.preact(x)
+        with backbone_autocast(x.device, self.amp_dtype):
+            x0 = self.preact(x)
+        x0 = x0.float()
 
         x0 = x0.view(x0.size(0), -1)
         init_shape = self.init_shape.expand(batch_size, -1)     # (B, 10,)
         init_cam = self.init_cam.expand(batch_size, -1)  # (B, 1,)
 
         delta_shape = self.decshape(x0)
-        pred_shape = delta_shape + init_shape
         pred_phi = self.decphi(x0)
-        pred_camera = self.deccam(x0).reshape(batch_size, -1) + init_cam
+        pred_camera = self.deccam(x0)
+        out_coord = self.fc_coord(x0)
+        out_sigma = self.decsigma(x0).sigmoid()
+
+        if flip_test:
+            x0 = x0[:batch_size]
+            delta_shape, flip_delta_shape = delta_shape[:batch_size], delta_shape[batch_size:]
+            pred_phi, flip_pred_phi = pred_phi[:batch_size], pred_phi[batch_size:]
+            pred_camera, flip_pred_camera = pred_camera[:batch_size], pred_camera[batch_size:]
+            out_coord, flip_out_coord = out_coord[:batch_size], out_coord[batch_size:]
+            out_sigma, flip_out_sigma = out_sigma[:batch_size], out_sigma[batch_size:]
+
+        pred_shape = delta_shape + init_shape
+        pred_camera = pred_camera.reshape(batch_size, -1) + init_cam
 
         pred_phi = pred_phi.reshape(batch_size, 23, 2)
 
-        out_coord = self.fc_coord(x0).reshape(batch_size, self.num_joints, 3)
-        out_sigma = self.decsigma(x0).sigmoid().reshape(batch_size, self.num_joints, 1)
+        out_coord = out_coord.reshape(batch_size, self.num_joints, 3)
+        out_sigma = out_sigma.reshape(batch_size, self.num_joints, 1)
 
         if flip_test:
-            flip_x = flip(x)
-            flip_x0 = self.preact(flip_x)
-
-            flip_out_coord = self.fc_coord(flip_x0).reshape(batch_size, self.num_joints, 3)
-            flip_out_sigma = self.decsigma(flip_x0).sigmoid().reshape(batch_size, self.num_joints, 1)
+            flip_out_coord = flip_out_coord.reshape(batch_size, self.num_joints, 3)
+            flip_out_sigma = flip_out_sigma.reshape(batch_size, self.num_joints, 1)
 
             flip_out_coord, flip_out_sigma = flip_coord((flip_out_coord, flip_out_sigma), self.joint_pairs_29, width_dim, shift=True, flatten=False)
             flip_out_coord = flip_out_coord.reshape(batch_size, self.num_joints, 3)
@@ -260,10 +205,8 @@ class HRNetSMPLCamReg(nn.Module):
             out_coord = (out_coord + flip_out_coord) / 2
             out_sigma = (out_sigma + flip_out_sigma) / 2
 
-            flip_delta_shape = self.decshape(flip_x0)
             flip_pred_shape = flip_delta_shape + init_shape
-            flip_pred_phi = self.decphi(flip_x0)
-            flip_pred_camera = self.deccam(flip_x0).reshape(batch_size, -1) + init_cam
+            flip_pred_camera = flip_pred_camera.reshape(batch_size, -1) + init_cam
 
             pred_shape = (pred_shape + flip_pred_shape) / 2
 
@@ -6,10 +6,14 @@ from .HRNetWithCam import HRNetSMPLCam
 from .HRNetWithCamReg import HRNetSMPLCamReg
 from .HRNetSMPLXCamKid import HRNetSMPLXCamKid
 from .HRNetSMPLXCamKidReg import HRNetSMPLXCamKidReg
+from .detector import (FasterRCNN, FasterRCNNMobile, FixedBox,
+                       PrecomputedBoxes, RetinaNet, SSDLite)
 from .criterion import *  # noqa: F401,F403
 
 __all__ = [
     'Simple3DPoseBaseSMPL', 'Simple3DPoseBaseSMPL24', 'Simple3DPoseBaseSMPLCam',
     'Simple3DPoseBaseSMPLCamReg',
     'HRNetSMPLCam', 'HRNetSMPLCamReg',
-    'HRNetSMPLXCamKid', 'HRNetSMPLXCamKidReg']
+    'HRNetSMPLXCamKid', 'HRNetSMPLXCamKidReg',
+    'FasterRCNN', 'FasterRCNNMobile', 'RetinaNet', 'SSDLite',
+    'PrecomputedBoxes', 'FixedBox']
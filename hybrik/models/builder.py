@@ -5,6 +5,7 @@ from hybrik.utils import Registry, build_from_cfg
 
 SPPE = Registry('sppe')
 LOSS = Registry('loss')
+DETECTOR = Registry('detector')
 
 
 def build(cfg, registry, default_args=None):
@@ -21,6 +22,10 @@ def build_sppe(cfg):
     return build(cfg, SPPE)
 
 
+def build_detector(cfg):
+    return build(cfg, DETECTOR)
+
+
 def build_loss(cfg, **kwargs):
     default_args = dict()
 
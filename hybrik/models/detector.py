@@ -0,0 +1,143 @@
+import json
+import os
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from .builder import DETECTOR
+
+
+def _detections(boxes, scores, device):
+    boxes = torch.as_tensor(boxes, dtype=torch.float32, device=device).reshape(-1, 4)
+    scores = torch.as_tensor(scores, dtype=torch.float32, device=device).reshape(-1)
+    return dict(
+        boxes=boxes,
+        scores=scores,
+        labels=torch.ones(len(boxes), dtype=torch.long, device=device))
+
+
+class TorchvisionDetector(nn.Module):
+    ''' Wrapper of a COCO detector from torchvision.models.detection.
+
+    Keyword Arguments
+    -----------------
+    WEIGHTS: str, optional
+        Local checkpoint of the detector. The torchvision COCO weights are
+        downloaded to the torch hub cache if not given.
+    '''
+    arch = None
+
+    def __init__(self, **kwargs):
+        super(TorchvisionDetector, self).__init__()
+        from torchvision.models import detection
+
+        weights = kwargs['WEIGHTS'] if 'WEIGHTS' in kwargs else None
+        build_fn = getattr(detection, self.arch)
+        if weights:
+            # no download at all, neither for the detector nor for its backbone
+            self.model = build_fn(weights=None, weights_backbone=None)
+            save_dict = torch.load(weights, map_location='cpu')
+            self.model.load_state_dict(save_dict['model'] if 'model' in save_dict else save_dict)
+        else:
+            self.model = build_fn(weights='DEFAULT')
+
+    def forward(self, imgs, frame_ids=None):
+        ''' Detect objects in a list of 3xHxW RGB images in [0, 1].
+
+        Returns a list of dicts with 'boxes' (x1, y1, x2, y2), 'scores' and
+        'labels', person is label 1. `frame_ids` is unused.
+        '''
+        return self.model(imgs)
+
+
+@DETECTOR.register_module
+class FasterRCNN(TorchvisionDetector):
+    ''' Faster R-CNN ResNet50-FPN, most accurate and slowest. '''
+    arch = 'fasterrcnn_resnet50_fpn'
+
+
+@DETECTOR.register_module
+class FasterRCNNMobile(TorchvisionDetector):
+    ''' Faster R-CNN MobileNetV3-Large-FPN. '''
+    arch = 'fasterrcnn_mobilenet_v3_large_fpn'
+
+
+@DETECTOR.register_module
+class RetinaNet(TorchvisionDetector):
+    ''' RetinaNet ResNet50-FPN, single stage. '''
+    arch = 'retinanet_resnet50_fpn'
+
+
+@DETECTOR.register_module
+class SSDLite(TorchvisionDetector):
+    ''' SSDlite320 MobileNetV3-Large, fastest, lower recall on small people. '''
+    arch = 'ssdlite320_mobilenet_v3_large'
+
+
+@DETECTOR.register_module
+class PrecomputedBoxes(nn.Module):
+    ''' Person boxes read from a file instead of running a detector.
+
+    Keyword Arguments
+    -----------------
+    BOX_FILE: str
+        Either a .json file mapping a frame id (video frame index starting at
+        1, or image file name) to a list of [x1, y1, x2, y2] or
+        [x1, y1, x2, y2, score], or a MOTChallenge style .txt file with
+        `frame, id, x, y, w, h, score, ...` rows.
+    '''
+
+    def __init__(self, **kwargs):
+        super(PrecomputedBoxes, self).__init__()
+        box_file = kwargs['BOX_FILE'] if 'BOX_FILE' in kwargs else None
+        assert box_file and os.path.exists(box_file), f'Box file {box_file} does not exist!'
+
+        self.frame_boxes = {}
+        if box_file.endswith('.json'):
+            with open(box_file, 'r') as f:
+                for frame_id, dets in json.load(f).items():
+                    dets = np.array(dets, dtype=np.float32).reshape(-1, len(dets[0]) if dets else 4)
+                    scores = dets[:, 4] if dets.shape[1] > 4 else np.ones(len(dets), dtype=np.float32)
+                    self.frame_boxes[str(frame_id)] = (dets[:, :4], scores)
+        else:
+            rows = np.loadtxt(box_file, delimiter=',', ndmin=2, dtype=np.float32)
+            boxes = np.concatenate([rows[:, 2:4], rows[:, 2:4] + rows[:, 4:6]], axis=1)
+            for frame_id in np.unique(rows[:, 0]).astype(int):
+                frame_mask = rows[:, 0] == frame_id
+                self.frame_boxes[str(frame_id)] = (boxes[frame_mask], rows[frame_mask, 6])
+
+    def forward(self, imgs, frame_ids=None):
+        assert frame_ids is not None, 'PrecomputedBoxes needs the frame ids of the images'
+        empty = (np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32))
+
+        outputs = []
+        for img, frame_id in zip(imgs, frame_ids):
+            boxes, scores = self.frame_boxes.get(str(frame_id), empty)
+            outputs.append(_detections(boxes, scores, img.device))
+        return outputs
+
+
+@DETECTOR.register_module
+class FixedBox(nn.Module):
+    ''' The same person box in every frame, for videos of a single centered subject.
+
+    Keyword Arguments
+    -----------------
+    BOX: list, optional
+        [x1, y1, x2, y2] in pixels, the full frame if not given.
+    '''
+
+    def __init__(self, **kwargs):
+        super(FixedBox, self).__init__()
+        self.box = kwargs['BOX'] if 'BOX' in kwargs else None
+
+    def forward(self, imgs, frame_ids=None):
+        outputs = []
+        for img in imgs:
+            if self.box:
+                box = self.box
+            else:
+                box = [0, 0, img.shape[2] - 1, img.shape[1] - 1]
+            outputs.append(_detections(box, [1.0], img.device))
+        return outputs
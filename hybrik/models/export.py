@@ -0,0 +1,167 @@
+import inspect
+
+import torch
+import torch.nn as nn
+
+from hybrik.utils.smpl_numpy import SMPLNumpy
+
+# outputs of the exported graph, in order
+EXPORT_OUTPUTS = (
+    'pred_uvd_jts',
+    'pred_xyz_jts_29',
+    'pred_xyz_jts_24_struct',
+    'pred_xyz_jts_17',
+    'pred_vertices',
+    'pred_theta_mats',
+    'pred_shape',
+    'pred_phi',
+    'pred_camera',
+    'cam_root',
+    'transl',
+    'maxvals',
+    'pred_sigma',
+)
+
+# outputs of the ONNX network graph, in order
+NETWORK_OUTPUTS = (
+    'pred_uvd_jts_29',
+    'maxvals',
+    'pred_shape',
+    'pred_phi',
+    'pred_camera',
+    'pred_sigma',
+)
+
+
+class HybrIKInference(nn.Module):
+    """Tensor-in / tensor-out inference wrapper of a HybrIK model.
+
+    The flip test and the outputs are fixed at construction, so the graph
+    has no Python-level branching left and can be traced or compiled.
+    `forward(img, bboxes, img_center)` returns the outputs listed in
+    `output_names` as a tuple.
+    """
+
+    def __init__(self, model, flip_test=True, output_names=EXPORT_OUTPUTS):
+        super(HybrIKInference, self).__init__()
+        self.model = model
+        self.flip_test = flip_test
+        self.output_names = tuple(output_names)
+
+    def forward(self, img, bboxes, img_center):
+        output = self.model(img, flip_test=self.flip_test, bboxes=bboxes, img_center=img_center)
+        return tuple(output[k] for k in self.output_names)
+
+    def to_dict(self, outputs):
+        ''' Name the tuple returned by an exported graph. '''
+        return dict(zip(self.output_names, outputs))
+
+
+class HybrIKNetwork(nn.Module):
+    """Image-in / tensor-out wrapper of `forward_network`.
+
+    Covers the backbone, the soft-argmax, the regression heads and the flip
+    test, i.e. everything up to the first camera estimate. The camera
+    refinement and the SMPL kinematics are left to `hybrik.utils.smpl_numpy`.
+    """
+
+    def __init__(self, model, flip_test=True):
+        super(HybrIKNetwork, self).__init__()
+        self.model = model
+        self.flip_test = flip_test
+
+    def forward(self, img):
+        output = self.model.forward_network(img, flip_test=self.flip_test)
+        return (output.pred_uvd_jts_29, output.maxvals, output.pred_shape,
+                output.pred_phi, output.pred_camera, output.sigma)
+
+
+def export_inference(model, example_inputs, mode='trace', flip_test=True, output_names=EXPORT_OUTPUTS,
+                     freeze=False):
+    ''' Export a HybrIK model for deployment.
+
+    Parameters
+    ----------
+    model: torch.nn.Module
+        Model built by `builder.build_sppe`, with weights loaded.
+    example_inputs: tuple
+        (img, bboxes, img_center) used to trace the graph.
+    mode: str, optional
+        'trace' returns a `torch.jit.ScriptModule` that can be saved with
+        `torch.jit.save` and run without the Python model code. 'compile'
+        returns the `torch.compile` module for in-process use.
+    freeze: bool, optional
+        Freeze the traced module (folds batch norms into the convolutions).
+        Faster on GPU, but no longer bit-comparable with eager mode.
+
+    Returns
+    -------
+    exported: torch.nn.Module
+        Module with the `HybrIKInference` signature.
+    '''
+    wrapper = HybrIKInference(model, flip_test=flip_test, output_names=output_names).eval()
+
+    if mode == 'trace':
+        with torch.no_grad():
+            exported = torch.jit.trace(wrapper, example_inputs, check_trace=False)
+        if freeze:
+            exported = torch.jit.freeze(exported)
+        return exported
+    elif mode == 'compile':
+        return torch.compile(wrapper, dynamic=False)
+    else:
+        raise NotImplementedError(mode)
+
+
+def export_onnx(model, onnx_path, kinematics_path, example_input, flip_test=True, opset_version=17):
+    ''' Export a HybrIK model for ONNX Runtime.
+
+    The network part goes to an ONNX graph with a dynamic batch axis. The IK
+    needs a batched eigendecomposition that has no ONNX operator, so the
+    SMPL buffers and the camera constants are saved to an .npz file for the
+    NumPy kinematics instead. Run both with `hybrik.utils.onnx_inference`.
+
+    Only `HRNetSMPLCam` is supported: the NumPy side reproduces its camera
+    refinement and SMPL kinematics. The regression (`*Reg`), ResNet
+    (`Simple3DPoseBaseSMPLCam`) and SMPL-X models post-process their outputs
+    differently and have no `forward_network`; export them with
+    `export_inference` instead.
+
+    Parameters
+    ----------
+    model: torch.nn.Module
+        `HRNetSMPLCam` built by `builder.build_sppe`, with weights loaded.
+    onnx_path: str
+        Output ONNX file.
+    kinematics_path: str
+        Output .npz file of `SMPLNumpy` and the camera constants.
+    example_input: torch.tensor Bx3xHxW
+        Image batch used to trace the graph.
+    flip_test: bool, optional
+        Bake the flip test into the graph.
+    '''
+    if not hasattr(model, 'forward_network'):
+        raise NotImplementedError(
+            f'ONNX export is only supported for HRNetSMPLCam, not {type(model).__name__}')
+
+    wrapper = HybrIKNetwork(model, flip_test=flip_test).eval()
+
+    export_kwargs = dict(
+        input_names=['img'],
+        output_names=list(NETWORK_OUTPUTS),
+        dynamic_axes={name: {0: 'batch'} for name in ('img',) + NETWORK_OUTPUTS},
+        opset_version=opset_version,
+        do_constant_folding=True)
+    if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+        # the TorchScript based exporter, dynamic_axes is not supported by dynamo
+        export_kwargs['dynamo'] = False
+
+    with torch.no_grad():
+        torch.onnx.export(wrapper, (example_input,), onnx_path, **export_kwargs)
+
+    SMPLNumpy.from_smpl_layer(model.smpl).save(
+        kinematics_path,
+        focal_length=float(model.focal_length),
+        input_size=float(model.input_size),
+        depth_factor=float(model.depth_factor),
+        flip_test=bool(flip_test))
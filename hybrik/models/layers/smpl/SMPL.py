@@ -4,7 +4,7 @@ import numpy as np
 import torch
 import torch.nn as nn
 
-from .lbs import lbs, hybrik, rotmat_to_quat, quat_to_rotmat
+from .lbs import lbs, hybrik, build_kinematic_tree, contract_joint_regressor, get_sparse_lbs_weights, rotmat_to_quat, quat_to_rotmat
 
 try:
     import cPickle as pk
@@ -64,7 +64,8 @@ class SMPL_layer(nn.Module):
                  h36m_jregressor,
                  gender='neutral',
                  dtype=torch.float32,
-                 num_joints=29):
+                 num_joints=29,
+                 sparse_skinning=False):
         ''' SMPL model layers
 
         Parameters:
@@ -74,6 +75,9 @@ class SMPL_layer(nn.Module):
             parameters are stored
         gender: str, optional
             Which gender to load
+        sparse_skinning: bool, optional
+            Skin each vertex with its 4 largest joint weights only.
+            Can be toggled later through `self.sparse_skinning`.
         '''
         super(SMPL_layer, self).__init__()
 
@@ -141,11 +145,32 @@ class SMPL_layer(nn.Module):
             self._parents_to_children(parents))
         # (24,)
         self.register_buffer('parents', parents)
+        # children lists, depth levels and leaves, shared by every forward
+        self.kintree = build_kinematic_tree(self.parents, self.children_map)
 
         # (6890, 23 + 1)
         self.register_buffer('lbs_weights',
                              to_tensor(to_np(self.smpl_data.weights), dtype=dtype))
 
+        # (6890, 4), derived from lbs_weights and not saved in checkpoints
+        self.sparse_skinning = sparse_skinning
+        lbs_topk_idx, lbs_topk_weights = get_sparse_lbs_weights(self.lbs_weights, k=4)
+        self.register_buffer('lbs_topk_idx', lbs_topk_idx, persistent=False)
+        self.register_buffer('lbs_topk_weights', lbs_topk_weights, persistent=False)
+
+        # J_regressor folded into v_template / shapedirs, (29, 3) and (29, 3, 10),
+        # rest joints + leaf vertices without building the mesh
+        J_template, J_shapedirs = contract_joint_regressor(
+            self.J_regressor, self.v_template, self.shapedirs)
+        self.register_buffer('J_template', J_template, persistent=False)
+        self.register_buffer('J_shapedirs', J_shapedirs, persistent=False)
+
+    @property
+    def sparse_weights(self):
+        if self.sparse_skinning:
+            return (self.lbs_topk_idx, self.lbs_topk_weights)
+        return None
+
     def _parents_to_children(self, parents):
         children = torch.ones_like(parents) * -1
         for i in range(self.num_joints):
@@ -202,7 +227,9 @@ class SMPL_layer(nn.Module):
         vertices, joints, rot_mats, joints_from_verts_h36m = lbs(betas, full_pose, self.v_template,
                                                                  self.shapedirs, self.posedirs,
                                                                  self.J_regressor, self.J_regressor_h36m, self.parents,
-                                                                 self.lbs_weights, pose2rot=pose2rot, dtype=self.dtype)
+                                                                 self.lbs_weights, pose2rot=pose2rot, dtype=self.dtype,
+                                                                 kintree=self.kintree, sparse_weights=self.sparse_weights,
+                                                                 J_template=self.J_template, J_shapedirs=self.J_shapedirs)
 
         if transl is not None:
             # apply translations
@@ -245,7 +272,9 @@ class SMPL_layer(nn.Module):
             transl: torch.tensor, optional, shape Bx3
                 Global Translations.
             return_verts: bool, optional
-                Return the vertices. (default=True)
+                Return the vertices. If False, only the joints and rot_mats
+                are computed and `vertices` and `joints_from_verts` are None.
+                (default=True)
 
             Returns
             -------
@@ -265,12 +294,21 @@ class SMPL_layer(nn.Module):
             self.J_regressor, self.J_regressor_h36m, self.parents, self.children_map,
             self.lbs_weights, dtype=self.dtype, train=self.training,
             leaf_thetas=leaf_thetas,
-            naive=naive)
+            naive=naive,
+            kintree=self.kintree, sparse_weights=self.sparse_weights,
+            return_verts=return_verts,
+            J_template=self.J_template, J_shapedirs=self.J_shapedirs)
 
         rot_mats = rot_mats.reshape(batch_size * 24, 3, 3)
         # rot_mats = rotmat_to_quat(rot_mats).reshape(batch_size, 24 * 4)
 
-        if transl is not None:
+        if not return_verts:
+            # joints only, vertices and joints_from_verts are None
+            if transl is not None:
+                new_joints += transl.unsqueeze(dim=1)
+            else:
+                new_joints = new_joints - new_joints[:, self.root_idx_smpl, :].unsqueeze(1).detach()
+        elif transl is not None:
             new_joints += transl.unsqueeze(dim=1)
             vertices += transl.unsqueeze(dim=1)
             joints_from_verts += transl.unsqueeze(dim=1)
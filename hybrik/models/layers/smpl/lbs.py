@@ -23,6 +23,11 @@ import numpy as np
 import torch
 import torch.nn.functional as F
 
+from hybrik.utils.kinematic_tree import build_kinematic_tree
+
+# vertices used as the extra leaf joints: head, middle fingers and big toes
+LEAF_VERTICES = [411, 2445, 5905, 3216, 6617]
+
 
 def rot_mat_to_euler(rot_mats):
     # Calculates rotation matrix to euler angles
@@ -193,7 +198,8 @@ def bones2joints(bone_dirs, bone_lens, parents):
 
 
 def lbs(betas, pose, v_template, shapedirs, posedirs, J_regressor, J_regressor_h36m, parents,
-        lbs_weights, pose2rot=True, dtype=torch.float32):
+        lbs_weights, pose2rot=True, dtype=torch.float32, kintree=None, sparse_weights=None,
+        J_template=None, J_shapedirs=None):
     ''' Performs Linear Blend Skinning with the given shape and pose parameters
 
         Parameters
@@ -222,6 +228,14 @@ def lbs(betas, pose, v_template, shapedirs, posedirs, J_regressor, J_regressor_h
             should already contain rotation matrices and have a size of
             Bx(J + 1)x9
         dtype: torch.dtype, optional
+        kintree: KinematicTree, optional
+            The precomputed topology of `parents`
+        sparse_weights: tuple, optional
+            The top-k skinning weights from `get_sparse_lbs_weights`. If
+            given, they are used instead of `lbs_weights`
+        J_template, J_shapedirs: torch.tensor, optional
+            The rest joints regressed from `v_template` and `shapedirs`, see
+            `contract_joint_regressor`
 
         Returns
         -------
@@ -241,7 +255,10 @@ def lbs(betas, pose, v_template, shapedirs, posedirs, J_regressor, J_regressor_h
 
     # Get the joints
     # NxJx3 array
-    J = vertices2joints(J_regressor, v_shaped)
+    if J_template is not None:
+        J = J_template[:24] + blend_shapes(betas, J_shapedirs[:24])
+    else:
+        J = vertices2joints(J_regressor, v_shaped)
 
     # 3. Add pose blend shapes
     # N x J x 3 x 3
@@ -266,22 +283,11 @@ def lbs(betas, pose, v_template, shapedirs, posedirs, J_regressor, J_regressor_h
 
     v_posed = pose_offsets + v_shaped
     # 4. Get the global joint location
-    J_transformed, A = batch_rigid_transform(rot_mats, J, parents[:24], dtype=dtype)
+    rigid_levs = kintree.rigid_levs if kintree is not None else None
+    J_transformed, A = batch_rigid_transform(rot_mats, J, parents[:24], dtype=dtype, rigid_levs=rigid_levs)
 
     # 5. Do skinning:
-    # W is N x V x (J + 1)
-    W = lbs_weights.unsqueeze(dim=0).expand([batch_size, -1, -1])
-    # (N x V x (J + 1)) x (N x (J + 1) x 16)
-    num_joints = J_regressor.shape[0]
-    T = torch.matmul(W, A.view(batch_size, num_joints, 16)) \
-        .view(batch_size, -1, 4, 4)
-
-    homogen_coord = torch.ones([batch_size, v_posed.shape[1], 1],
-                               dtype=dtype, device=device)
-    v_posed_homo = torch.cat([v_posed, homogen_coord], dim=2)
-    v_homo = torch.matmul(T, torch.unsqueeze(v_posed_homo, dim=-1))
-
-    verts = v_homo[:, :, :3, 0]
+    verts = batch_skinning(v_posed, A, lbs_weights, sparse_weights=sparse_weights)
 
     J_from_verts = vertices2joints(J_regressor_h36m, verts)
 
@@ -290,7 +296,9 @@ def lbs(betas, pose, v_template, shapedirs, posedirs, J_regressor, J_regressor_h
 
 def hybrik(betas, global_orient, pose_skeleton, phis,
            v_template, shapedirs, posedirs, J_regressor, J_regressor_h36m, parents, children,
-           lbs_weights, dtype=torch.float32, train=False, leaf_thetas=None, naive=False):
+           lbs_weights, dtype=torch.float32, train=False, leaf_thetas=None, naive=False,
+           kintree=None, sparse_weights=None, return_verts=True,
+           J_template=None, J_shapedirs=None):
     ''' Performs Linear Blend Skinning with the given shape and skeleton joints
 
         Parameters
@@ -323,6 +331,18 @@ def hybrik(betas, global_orient, pose_skeleton, phis,
             The linear blend skinning weights that represent how much the
             rotation matrix of each part affects each vertex
         dtype: torch.dtype, optional
+        kintree: KinematicTree, optional
+            The precomputed topology of `parents` and `children`
+        sparse_weights: tuple, optional
+            The top-k skinning weights from `get_sparse_lbs_weights`. If
+            given, they are used instead of `lbs_weights`
+        return_verts: bool, optional
+            If False, skip the pose blend shapes and skinning and return
+            None for `verts` and `J_from_verts_h36m`
+        J_template, J_shapedirs: torch.tensor, optional
+            The 24 joints and 5 leaf vertices of the rest pose as a linear
+            function of `betas`, see `contract_joint_regressor`. With them
+            and `return_verts=False` the mesh is never built.
 
         Returns
         -------
@@ -338,38 +358,49 @@ def hybrik(betas, global_orient, pose_skeleton, phis,
     device = betas.device
 
     # 1. Add shape contribution
-    v_shaped = v_template + blend_shapes(betas, shapedirs)
+    if return_verts or J_template is None:
+        v_shaped = v_template + blend_shapes(betas, shapedirs)
 
     # 2. Get the rest joints
     # NxJx3 array
-    if leaf_thetas is not None:
+    if J_template is not None:
+        rest_J = J_template + blend_shapes(betas, J_shapedirs)
+        if leaf_thetas is not None:
+            rest_J = rest_J[:, :24]
+    elif leaf_thetas is not None:
         rest_J = vertices2joints(J_regressor, v_shaped)
     else:
         rest_J = torch.zeros((v_shaped.shape[0], 29, 3), dtype=dtype, device=device)
         rest_J[:, :24] = vertices2joints(J_regressor, v_shaped)
 
-        leaf_number = [411, 2445, 5905, 3216, 6617]
-        leaf_vertices = v_shaped[:, leaf_number].clone()
+        leaf_vertices = v_shaped[:, LEAF_VERTICES].clone()
         rest_J[:, 24:] = leaf_vertices
 
+    if kintree is None:
+        kintree = build_kinematic_tree(parents, children)
+
     # 3. Get the rotation matrics
     if train or naive:
         rot_mats, rotate_rest_pose = batch_inverse_kinematics_transform_naive(
             pose_skeleton, global_orient, phis,
             rest_J.clone(), children, parents, dtype=dtype, train=train,
-            leaf_thetas=leaf_thetas)
+            leaf_thetas=leaf_thetas, kintree=kintree)
     else:
         rot_mats, rotate_rest_pose = batch_inverse_kinematics_transform(
             pose_skeleton, global_orient, phis,
             rest_J.clone(), children, parents, dtype=dtype, train=train,
-            leaf_thetas=leaf_thetas)
+            leaf_thetas=leaf_thetas, kintree=kintree)
 
     test_joints = True
     if test_joints:
-        J_transformed, A = batch_rigid_transform(rot_mats, rest_J[:, :24].clone(), parents[:24], dtype=dtype)
+        J_transformed, A = batch_rigid_transform(
+            rot_mats, rest_J[:, :24].clone(), parents[:24], dtype=dtype, rigid_levs=kintree.rigid_levs)
     else:
         J_transformed = None
 
+    if not return_verts:
+        return None, J_transformed, rot_mats, None
+
     # assert torch.mean(torch.abs(rotate_rest_pose - J_transformed)) < 1e-5
     # 4. Add pose blend shapes
     # rot_mats: N x (J + 1) x 3 x 3
@@ -381,24 +412,123 @@ def hybrik(betas, global_orient, pose_skeleton, phis,
     v_posed = pose_offsets + v_shaped
 
     # 5. Do skinning:
-    # W is N x V x (J + 1)
-    W = lbs_weights.unsqueeze(dim=0).expand([batch_size, -1, -1])
-    # (N x V x (J + 1)) x (N x (J + 1) x 16)
-    num_joints = J_regressor.shape[0]
-    T = torch.matmul(W, A.view(batch_size, num_joints, 16)) \
-        .view(batch_size, -1, 4, 4)
-
-    homogen_coord = torch.ones([batch_size, v_posed.shape[1], 1],
-                               dtype=dtype, device=device)
-    v_posed_homo = torch.cat([v_posed, homogen_coord], dim=2)
-    v_homo = torch.matmul(T, torch.unsqueeze(v_posed_homo, dim=-1))
-
-    verts = v_homo[:, :, :3, 0]
+    verts = batch_skinning(v_posed, A, lbs_weights, sparse_weights=sparse_weights)
     J_from_verts_h36m = vertices2joints(J_regressor_h36m, verts)
 
     return verts, J_transformed, rot_mats, J_from_verts_h36m
 
 
+def batch_skinning(v_posed, A, lbs_weights, sparse_weights=None):
+    ''' Poses the vertices with linear blend skinning
+
+        Only the 3x4 rotation and translation part of each joint transform is
+        blended, so neither the expanded B x V x J weights nor B x V x 4 x 4
+        transforms and homogeneous vertices are materialized.
+
+        Parameters
+        ----------
+        v_posed : torch.tensor BxVx3
+            The vertices with shape and pose blend shapes applied
+        A : torch.tensor BxJx4x4
+            The relative rigid transformations of the joints
+        lbs_weights: torch.tensor V x J
+            The linear blend skinning weights
+        sparse_weights: tuple, optional
+            ``(indices, weights)`` of shape V x K from
+            `get_sparse_lbs_weights`. If given, each vertex only blends its
+            K most influential joints. With the 24 SMPL joints the dense
+            product is usually as fast, measure before switching.
+
+        Returns
+        -------
+        verts: torch.tensor BxVx3
+            The skinned vertices
+    '''
+    batch_size, num_joints = A.shape[:2]
+    # (B, J, 12)
+    A = A[:, :, :3].reshape(batch_size, num_joints, 12)
+
+    if sparse_weights is None:
+        # (V x J) x (B x J x 12)
+        T = torch.matmul(lbs_weights, A)
+    else:
+        indices, weights = sparse_weights
+        T = 0
+        for k in range(indices.shape[1]):
+            # (B, V, 12)
+            T = T + weights[:, k, None] * torch.index_select(A, 1, indices[:, k])
+
+    T = T.view(batch_size, -1, 3, 4)
+    # (B, V, 3)
+    verts = torch.matmul(T[:, :, :, :3], v_posed.unsqueeze(dim=-1)).squeeze(dim=-1) + T[:, :, :, 3]
+
+    return verts
+
+
+def get_sparse_lbs_weights(lbs_weights, k=4):
+    ''' Keeps the k largest skinning weights of every vertex
+
+        SMPL vertices are influenced by at most 4 joints, so k=4 is exact.
+
+        Parameters
+        ----------
+        lbs_weights: torch.tensor V x J
+            The linear blend skinning weights
+        k: int, optional
+            The number of joints kept per vertex
+
+        Returns
+        -------
+        indices: torch.tensor V x k
+            The joint indices of the kept weights
+        weights: torch.tensor V x k
+            The kept weights, renormalized to sum to one
+    '''
+    weights, indices = torch.topk(lbs_weights, k, dim=1)
+    weights = weights / weights.sum(dim=1, keepdim=True)
+
+    return indices, weights
+
+
+def contract_joint_regressor(J_regressor, v_template, shapedirs, leaf_indices=LEAF_VERTICES):
+    ''' Folds the joint regressor into the template and shape blend shapes
+
+        Both the shape blend shapes and the regressor are linear, so the rest
+        joints are ``J_template + blend_shapes(betas, J_shapedirs)`` without
+        building the V x 3 shaped mesh. The leaf vertices used as extra joints
+        by hybrik are appended after the regressed joints.
+
+        Parameters
+        ----------
+        J_regressor : torch.tensor JxV
+            The regressor array that is used to calculate the joints from
+            the position of the vertices
+        v_template : torch.tensor Vx3
+            The template mesh
+        shapedirs : torch.tensor Vx3xNB
+            The tensor of PCA shape displacements
+        leaf_indices : list, optional
+            The vertices appended as leaf joints
+
+        Returns
+        -------
+        J_template : torch.tensor (J + L)x3
+            The rest joints of the template
+        J_shapedirs : torch.tensor (J + L)x3xNB
+            The rest joint displacements per shape coefficient
+    '''
+    J_template = torch.cat([
+        torch.matmul(J_regressor, v_template),
+        v_template[leaf_indices]
+    ], dim=0)
+    J_shapedirs = torch.cat([
+        torch.einsum('jv,vcl->jcl', [J_regressor, shapedirs]),
+        shapedirs[leaf_indices]
+    ], dim=0)
+
+    return J_template, J_shapedirs
+
+
 def vertices2joints(J_regressor, vertices):
     ''' Calculates the 3D joint locations from the vertices
 
@@ -490,7 +620,7 @@ def transform_mat(R, t):
                       F.pad(t, [0, 0, 0, 1], value=1)], dim=2)
 
 
-def batch_rigid_transform(rot_mats, joints, parents, dtype=torch.float32):
+def batch_rigid_transform(rot_mats, joints, parents, dtype=torch.float32, rigid_levs=None):
     """
     Applies a batch of rigid transformations to the joints
 
@@ -504,6 +634,9 @@ def batch_rigid_transform(rot_mats, joints, parents, dtype=torch.float32):
         The kinematic tree of each object
     dtype : torch.dtype, optional:
         The data type of the created tensors, the default is torch.float32
+    rigid_levs : list, optional
+        The joints grouped by tree depth (`KinematicTree.rigid_levs`). If
+        given, each level is chained in one batched matmul.
 
     Returns
     -------
@@ -522,17 +655,26 @@ def batch_rigid_transform(rot_mats, joints, parents, dtype=torch.float32):
         rot_mats.reshape(-1, 3, 3),
         rel_joints.reshape(-1, 3, 1)).reshape(-1, joints.shape[1], 4, 4)
 
-    transform_chain = [transforms_mat[:, 0]]
-    for i in range(1, parents.shape[0]):
-        # Subtract the joint location at the rest pose
-        # No need for rotation, since it's identity when at rest
-        # (B, 4, 4) x (B, 4, 4)
-        curr_res = torch.matmul(transform_chain[parents[i]],
-                                transforms_mat[:, i])
-        transform_chain.append(curr_res)
-
-    # (B, K + 1, 4, 4)
-    transforms = torch.stack(transform_chain, dim=1)
+    if rigid_levs is not None:
+        # (B, K + 1, 4, 4)
+        transforms = torch.zeros_like(transforms_mat)
+        transforms[:, 0] = transforms_mat[:, 0]
+        for indices, parent_indices in rigid_levs:
+            # (B, K, 4, 4) x (B, K, 4, 4)
+            transforms[:, indices] = torch.matmul(transforms[:, parent_indices],
+                                                  transforms_mat[:, indices])
+    else:
+        transform_chain = [transforms_mat[:, 0]]
+        for i in range(1, parents.shape[0]):
+            # Subtract the joint location at the rest pose
+            # No need for rotation, since it's identity when at rest
+            # (B, 4, 4) x (B, 4, 4)
+            curr_res = torch.matmul(transform_chain[parents[i]],
+                                    transforms_mat[:, i])
+            transform_chain.append(curr_res)
+
+        # (B, K + 1, 4, 4)
+        transforms = torch.stack(transform_chain, dim=1)
 
     # The last column of the transformations contains the posed joints
     posed_joints = transforms[:, :, :3, 3]
@@ -553,10 +695,13 @@ def batch_inverse_kinematics_transform(
         phis,
         rest_pose,
         children, parents, dtype=torch.float32, train=False,
-        leaf_thetas=None):
+        leaf_thetas=None, kintree=None):
     """
     Applies a batch of inverse kinematics transfoirm to the joints
 
+    All joints at the same depth of the kinematic tree are solved together
+    in one batched op.
+
     Parameters
     ----------
     pose_skeleton : torch.tensor BxNx3
@@ -573,6 +718,9 @@ def batch_inverse_kinematics_transform(
         The kinematic tree of each object
     dtype : torch.dtype, optional:
         The data type of the created tensors, the default is torch.float32
+    kintree : KinematicTree, optional
+        The topology from `build_kinematic_tree`, computed from `parents`
+        and `children` if not given.
 
     Returns
     -------
@@ -584,6 +732,10 @@ def batch_inverse_kinematics_transform(
     """
     batch_size = pose_skeleton.shape[0]
     device = pose_skeleton.device
+    num_joints = rest_pose.shape[1]
+
+    if kintree is None:
+        kintree = build_kinematic_tree(parents, children)
 
     rel_rest_pose = rest_pose.clone()
     rel_rest_pose[:, 1:] -= rest_pose[:, parents[1:]].clone()
@@ -602,62 +754,35 @@ def batch_inverse_kinematics_transform(
     final_pose_skeleton = torch.unsqueeze(pose_skeleton.clone(), dim=-1)
     final_pose_skeleton = final_pose_skeleton - final_pose_skeleton[:, 0:1] + rel_rest_pose[:, 0:1]
 
-    rel_rest_pose = rel_rest_pose
-    rel_pose_skeleton = rel_pose_skeleton
-    final_pose_skeleton = final_pose_skeleton
-    rotate_rest_pose = rotate_rest_pose
-
     assert phis.dim() == 3
     phis = phis / (torch.norm(phis, dim=2, keepdim=True) + 1e-8)
 
     # TODO
     if train:
         global_orient_mat = batch_get_pelvis_orient(
-            rel_pose_skeleton.clone(), rel_rest_pose.clone(), parents, children, dtype)
+            rel_pose_skeleton.clone(), rel_rest_pose.clone(), kintree.pelvis_child, dtype)
     else:
         global_orient_mat = batch_get_pelvis_orient_svd(
-            rel_pose_skeleton.clone(), rel_rest_pose.clone(), parents, children, dtype)
+            rel_pose_skeleton.clone(), rel_rest_pose.clone(), kintree.pelvis_child, dtype)
 
-    rot_mat_chain = [global_orient_mat]
-    rot_mat_local = [global_orient_mat]
-    # leaf nodes rot_mats
-    if leaf_thetas is not None:
-        leaf_cnt = 0
-        leaf_rot_mats = leaf_thetas.view([batch_size, 5, 3, 3])
-
-    for i in range(1, parents.shape[0]):
-        if children[i] == -1:
-            # leaf nodes
-            if leaf_thetas is not None:
-                rot_mat = leaf_rot_mats[:, leaf_cnt, :, :]
-                leaf_cnt += 1
-
-                rotate_rest_pose[:, i] = rotate_rest_pose[:, parents[i]] + torch.matmul(
-                    rot_mat_chain[parents[i]],
-                    rel_rest_pose[:, i]
-                )
-
-                rot_mat_chain.append(torch.matmul(
-                    rot_mat_chain[parents[i]],
-                    rot_mat))
-                rot_mat_local.append(rot_mat)
-        elif children[i] == -3:
+    rot_mat_chain = torch.zeros((batch_size, num_joints, 3, 3), dtype=dtype, device=device)
+    rot_mat_local = torch.zeros_like(rot_mat_chain)
+    rot_mat_chain[:, 0] = global_orient_mat
+    rot_mat_local[:, 0] = global_orient_mat
+
+    ident = torch.eye(3, dtype=dtype, device=device).reshape(1, 1, 3, 3)
+
+    for indices, parent_indices, child_indices in kintree.idx_levs:
+        # (B, K, 3, 1)
+        rotate_rest_pose[:, indices] = rotate_rest_pose[:, parent_indices] + torch.matmul(
+            rot_mat_chain[:, parent_indices],
+            rel_rest_pose[:, indices]
+        )
+
+        if child_indices[0] == -3:
             # three children
-            rotate_rest_pose[:, i] = rotate_rest_pose[:, parents[i]] + torch.matmul(
-                rot_mat_chain[parents[i]],
-                rel_rest_pose[:, i]
-            )
-
-            spine_child = []
-            for c in range(1, parents.shape[0]):
-                if parents[c] == i and c not in spine_child:
-                    spine_child.append(c)
-
-            # original
-            spine_child = []
-            for c in range(1, parents.shape[0]):
-                if parents[c] == i and c not in spine_child:
-                    spine_child.append(c)
+            i = indices[0]
+            spine_child = kintree.spine_child[i]
 
             children_final_loc = []
             children_rest_loc = []
@@ -669,89 +794,95 @@ def batch_inverse_kinematics_transform(
 
             rot_mat = batch_get_3children_orient_svd(
                 children_final_loc, children_rest_loc,
-                rot_mat_chain[parents[i]], spine_child, dtype)
-
-            rot_mat_chain.append(
-                torch.matmul(
-                    rot_mat_chain[parents[i]],
-                    rot_mat)
-            )
-            rot_mat_local.append(rot_mat)
-        else:
-            # (B, 3, 1)
-            rotate_rest_pose[:, i] = rotate_rest_pose[:, parents[i]] + torch.matmul(
-                rot_mat_chain[parents[i]],
-                rel_rest_pose[:, i]
-            )
-            # (B, 3, 1)
-            child_final_loc = final_pose_skeleton[:, children[i]] - rotate_rest_pose[:, i]
-
-            if not train:
-                orig_vec = rel_pose_skeleton[:, children[i]]
-                template_vec = rel_rest_pose[:, children[i]]
-                norm_t = torch.norm(template_vec, dim=1, keepdim=True)
-                orig_vec = orig_vec * norm_t / torch.norm(orig_vec, dim=1, keepdim=True)
-
-                diff = torch.norm(child_final_loc - orig_vec, dim=1, keepdim=True)
-                big_diff_idx = torch.where(diff > 15 / 1000)[0]
-
-                child_final_loc[big_diff_idx] = orig_vec[big_diff_idx]
-
-            child_final_loc = torch.matmul(
-                rot_mat_chain[parents[i]].transpose(1, 2),
-                child_final_loc)
-
-            child_rest_loc = rel_rest_pose[:, children[i]]
-            # (B, 1, 1)
-            child_final_norm = torch.norm(child_final_loc, dim=1, keepdim=True)
-            child_rest_norm = torch.norm(child_rest_loc, dim=1, keepdim=True)
-
-            child_final_norm = torch.norm(child_final_loc, dim=1, keepdim=True)
-
-            # (B, 3, 1)
-            axis = torch.cross(child_rest_loc, child_final_loc, dim=1)
-            axis_norm = torch.norm(axis, dim=1, keepdim=True)
-
-            # (B, 1, 1)
-            cos = torch.sum(child_rest_loc * child_final_loc, dim=1, keepdim=True) / (child_rest_norm * child_final_norm + 1e-8)
-            sin = axis_norm / (child_rest_norm * child_final_norm + 1e-8)
-
-            # (B, 3, 1)
-            axis = axis / (axis_norm + 1e-8)
-
-            # Convert location revolve to rot_mat by rodrigues
-            # (B, 1, 1)
-            rx, ry, rz = torch.split(axis, 1, dim=1)
-            zeros = torch.zeros((batch_size, 1, 1), dtype=dtype, device=device)
-
-            K = torch.cat([zeros, -rz, ry, rz, zeros, -rx, -ry, rx, zeros], dim=1) \
-                .view((batch_size, 3, 3))
-            ident = torch.eye(3, dtype=dtype, device=device).unsqueeze(dim=0)
-            rot_mat_loc = ident + sin * K + (1 - cos) * torch.bmm(K, K)
-
-            # Convert spin to rot_mat
-            # (B, 3, 1)
-            spin_axis = child_rest_loc / child_rest_norm
-            # (B, 1, 1)
-            rx, ry, rz = torch.split(spin_axis, 1, dim=1)
-            zeros = torch.zeros((batch_size, 1, 1), dtype=dtype, device=device)
-            K = torch.cat([zeros, -rz, ry, rz, zeros, -rx, -ry, rx, zeros], dim=1) \
-                .view((batch_size, 3, 3))
-            ident = torch.eye(3, dtype=dtype, device=device).unsqueeze(dim=0)
-            # (B, 1, 1)
-            cos, sin = torch.split(phis[:, i - 1], 1, dim=1)
-            cos = torch.unsqueeze(cos, dim=2)
-            sin = torch.unsqueeze(sin, dim=2)
-            rot_mat_spin = ident + sin * K + (1 - cos) * torch.bmm(K, K)
-            rot_mat = torch.matmul(rot_mat_loc, rot_mat_spin)
-
-            rot_mat_chain.append(torch.matmul(
-                rot_mat_chain[parents[i]],
-                rot_mat))
-            rot_mat_local.append(rot_mat)
-
-    # (B, K + 1, 3, 3)
-    rot_mats = torch.stack(rot_mat_local, dim=1)
+                rot_mat_chain[:, parent_indices[0]], spine_child, dtype)
+
+            rot_mat_chain[:, i] = torch.matmul(
+                rot_mat_chain[:, parent_indices[0]],
+                rot_mat)
+            rot_mat_local[:, i] = rot_mat
+            continue
+
+        len_indices = len(indices)
+        # (B, K, 3, 1)
+        child_final_loc = final_pose_skeleton[:, child_indices] - rotate_rest_pose[:, indices]
+
+        if not train:
+            orig_vec = rel_pose_skeleton[:, child_indices]
+            template_vec = rel_rest_pose[:, child_indices]
+            norm_t = torch.norm(template_vec, dim=2, keepdim=True)
+            orig_vec = orig_vec * norm_t / torch.norm(orig_vec, dim=2, keepdim=True)
+
+            diff = torch.norm(child_final_loc - orig_vec, dim=2, keepdim=True)
+            child_final_loc = torch.where(diff > 15 / 1000, orig_vec, child_final_loc)
+
+        child_final_loc = torch.matmul(
+            rot_mat_chain[:, parent_indices].transpose(2, 3),
+            child_final_loc)
+
+        child_rest_loc = rel_rest_pose[:, child_indices]
+        # (B, K, 1, 1)
+        child_final_norm = torch.norm(child_final_loc, dim=2, keepdim=True)
+        child_rest_norm = torch.norm(child_rest_loc, dim=2, keepdim=True)
+
+        # (B, K, 3, 1)
+        axis = torch.cross(child_rest_loc, child_final_loc, dim=2)
+        axis_norm = torch.norm(axis, dim=2, keepdim=True)
+
+        # (B, K, 1, 1)
+        cos = torch.sum(child_rest_loc * child_final_loc, dim=2, keepdim=True) / (child_rest_norm * child_final_norm + 1e-8)
+        sin = axis_norm / (child_rest_norm * child_final_norm + 1e-8)
+
+        # (B, K, 3, 1)
+        axis = axis / (axis_norm + 1e-8)
+
+        # Convert location revolve to rot_mat by rodrigues
+        # (B, K, 1, 1)
+        rx, ry, rz = torch.split(axis, 1, dim=2)
+        zeros = torch.zeros((batch_size, len_indices, 1, 1), dtype=dtype, device=device)
+
+        K = torch.cat([zeros, -rz, ry, rz, zeros, -rx, -ry, rx, zeros], dim=2) \
+            .view((batch_size, len_indices, 3, 3))
+        rot_mat_loc = ident + sin * K + (1 - cos) * torch.matmul(K, K)
+
+        # Convert spin to rot_mat
+        # (B, K, 3, 1)
+        spin_axis = child_rest_loc / child_rest_norm
+        # (B, K, 1, 1)
+        rx, ry, rz = torch.split(spin_axis, 1, dim=2)
+        K = torch.cat([zeros, -rz, ry, rz, zeros, -rx, -ry, rx, zeros], dim=2) \
+            .view((batch_size, len_indices, 3, 3))
+        # (B, K, 1, 1)
+        phi_indices = [i - 1 for i in indices]
+        cos, sin = torch.split(phis[:, phi_indices], 1, dim=2)
+        cos = torch.unsqueeze(cos, dim=3)
+        sin = torch.unsqueeze(sin, dim=3)
+        rot_mat_spin = ident + sin * K + (1 - cos) * torch.matmul(K, K)
+        rot_mat = torch.matmul(rot_mat_loc, rot_mat_spin)
+
+        rot_mat_chain[:, indices] = torch.matmul(
+            rot_mat_chain[:, parent_indices],
+            rot_mat)
+        rot_mat_local[:, indices] = rot_mat
+
+    # leaf nodes rot_mats
+    leaf_indices, leaf_parent_indices = kintree.leaf_lev
+    if leaf_thetas is not None:
+        leaf_rot_mats = leaf_thetas.view([batch_size, len(leaf_indices), 3, 3])
+
+        rotate_rest_pose[:, leaf_indices] = rotate_rest_pose[:, leaf_parent_indices] + torch.matmul(
+            rot_mat_chain[:, leaf_parent_indices],
+            rel_rest_pose[:, leaf_indices]
+        )
+
+        rot_mat_chain[:, leaf_indices] = torch.matmul(
+            rot_mat_chain[:, leaf_parent_indices],
+            leaf_rot_mats)
+        rot_mat_local[:, leaf_indices] = leaf_rot_mats
+
+        rot_mats = rot_mat_local
+    else:
+        # (B, K + 1, 3, 3)
+        rot_mats = rot_mat_local[:, [i for i in range(num_joints) if i not in leaf_indices]]
 
     return rot_mats, rotate_rest_pose.squeeze(-1)
 
@@ -761,7 +892,7 @@ def batch_inverse_kinematics_transform_naive(
         phis,
         rest_pose,
         children, parents, dtype=torch.float32, train=False,
-        leaf_thetas=None, need_detach=True):
+        leaf_thetas=None, need_detach=True, kintree=None):
     """
     Applies a batch of inverse kinematics transfoirm to the joints
 
@@ -781,6 +912,9 @@ def batch_inverse_kinematics_transform_naive(
         The kinematic tree of each object
     dtype : torch.dtype, optional:
         The data type of the created tensors, the default is torch.float32
+    kintree : KinematicTree, optional
+        The topology from `build_kinematic_tree`, computed from `parents`
+        and `children` if not given.
 
     Returns
     -------
@@ -792,6 +926,10 @@ def batch_inverse_kinematics_transform_naive(
     """
     batch_size = pose_skeleton.shape[0]
     device = pose_skeleton.device
+    num_joints = rest_pose.shape[1]
+
+    if kintree is None:
+        kintree = build_kinematic_tree(parents, children)
 
     rel_rest_pose = rest_pose.clone()
     rel_rest_pose[:, 1:] -= rest_pose[:, parents[1:]].clone()
@@ -819,7 +957,7 @@ def batch_inverse_kinematics_transform_naive(
     # TODO
     if global_orient is None:
         global_orient_mat = batch_get_pelvis_orient(
-            rel_pose_skeleton.clone(), rel_rest_pose.clone(), parents, children, dtype)
+            rel_pose_skeleton.clone(), rel_rest_pose.clone(), kintree.pelvis_child, dtype)
     else:
         global_orient_mat = global_orient
 
@@ -827,119 +965,91 @@ def batch_inverse_kinematics_transform_naive(
     # rot_mat_local = [global_orient_mat]
     # print(global_orient_mat)
 
-    rot_mat_chain = torch.zeros((batch_size, 24, 3, 3), dtype=torch.float32, device=pose_skeleton.device)
+    rot_mat_chain = torch.zeros((batch_size, num_joints, 3, 3), dtype=dtype, device=device)
     rot_mat_local = torch.zeros_like(rot_mat_chain)
     rot_mat_chain[:, 0] = global_orient_mat
     rot_mat_local[:, 0] = global_orient_mat
 
+    ident = torch.eye(3, dtype=dtype, device=device).reshape(1, 1, 3, 3)
+
+    for indices, parent_indices, child_indices in kintree.idx_levs:
+        len_indices = len(indices)
+        # (B, K, 3, 1)
+        child_final_loc = torch.matmul(
+            rot_mat_chain[:, parent_indices].transpose(2, 3),
+            rel_pose_skeleton[:, child_indices])
+
+        child_rest_loc = rel_rest_pose[:, child_indices]  # need rotation back ?
+        # (B, K, 1, 1)
+        child_final_norm = torch.norm(child_final_loc, dim=2, keepdim=True)
+        child_rest_norm = torch.norm(child_rest_loc, dim=2, keepdim=True)
+
+        # (B, K, 3, 1)
+        axis = torch.cross(child_rest_loc, child_final_loc, dim=2)
+        axis_norm = torch.norm(axis, dim=2, keepdim=True)
+
+        # (B, K, 1, 1)
+        cos = torch.sum(child_rest_loc * child_final_loc, dim=2, keepdim=True) / (child_rest_norm * child_final_norm + 1e-8)
+        sin = axis_norm / (child_rest_norm * child_final_norm + 1e-8)
+
+        # (B, K, 3, 1)
+        axis = axis / (axis_norm + 1e-8)
+
+        # Convert location revolve to rot_mat by rodrigues
+        # (B, K, 1, 1)
+        rx, ry, rz = torch.split(axis, 1, dim=2)
+        zeros = torch.zeros((batch_size, len_indices, 1, 1), dtype=dtype, device=device)
+
+        K = torch.cat([zeros, -rz, ry, rz, zeros, -rx, -ry, rx, zeros], dim=2) \
+            .view((batch_size, len_indices, 3, 3))
+        rot_mat_loc = ident + sin * K + (1 - cos) * torch.matmul(K, K)
+
+        # Convert spin to rot_mat
+        # (B, K, 3, 1)
+        spin_axis = child_rest_loc / (child_rest_norm + 1e-8)
+        # (B, K, 1, 1)
+        rx, ry, rz = torch.split(spin_axis, 1, dim=2)
+        K = torch.cat([zeros, -rz, ry, rz, zeros, -rx, -ry, rx, zeros], dim=2) \
+            .view((batch_size, len_indices, 3, 3))
+        # (B, K, 1, 1)
+        phi_indices = [item - 1 for item in indices]
+        cos, sin = torch.split(phis[:, phi_indices], 1, dim=2)
+        cos = torch.unsqueeze(cos, dim=3)
+        sin = torch.unsqueeze(sin, dim=3)
+        rot_mat_spin = ident + sin * K + (1 - cos) * torch.matmul(K, K)
+        rot_mat = torch.matmul(rot_mat_loc, rot_mat_spin)
+
+        rot_mat_chain[:, indices] = torch.matmul(
+            rot_mat_chain[:, parent_indices],
+            rot_mat
+        )
+        rot_mat_local[:, indices] = rot_mat
+
     # leaf nodes rot_mats
+    leaf_indices, leaf_parent_indices = kintree.leaf_lev
     if leaf_thetas is not None:
-        leaf_cnt = 0
-        leaf_rot_mats = leaf_thetas.view([batch_size, 5, 3, 3])
-
-    idx_levs = [
-        [0],
-        [1, 2, 3],
-        [4, 5, 6],
-        [7, 8, 9],
-        [12, 13, 14],
-        [15, 16, 17],
-        [18, 19, 10],
-        [20, 21, 11],
-        [22, 23],
-        [24, 25, 26, 27, 28]
-    ]
-    if leaf_thetas is not None:
-        idx_levs = idx_levs[:-1]
-    
-    for idx_lev in range(1, len(idx_levs)):
-        indices = idx_levs[idx_lev]
-        if idx_lev == len(idx_levs)-1:
-            # leaf nodes
-            if leaf_thetas is not None:
-                rot_mat = leaf_rot_mats[:, :, :, :]
-
-                rotate_rest_pose[:, indices] = rotate_rest_pose[:, parents[indices]] + torch.matmul(
-                    rot_mat_chain[:, parents[indices]], 
-                    rel_rest_pose[:, indices]
-                )
-
-                rot_mat_chain[:, indices] = torch.matmul(
-                    rot_mat_chain[:, parents[indices]], 
-                    rot_mat
-                )
-                rot_mat_local[:, indices] = rot_mat
-        
-        else:
-            len_indices = len(indices)
-            # (B, K, 3, 1)
-            child_final_loc = torch.matmul(
-                    rot_mat_chain[:, parents[indices]].transpose(2, 3),
-                    rel_pose_skeleton[:, children[indices]])
-
-            child_rest_loc = rel_rest_pose[:, children[indices]] # need rotation back ?
-            # (B, K, 1, 1)
-            child_final_norm = torch.norm(child_final_loc, dim=2, keepdim=True)
-            child_rest_norm = torch.norm(child_rest_loc, dim=2, keepdim=True)
-
-            # (B, K, 3, 1)
-            axis = torch.cross(child_rest_loc, child_final_loc, dim=2)
-            axis_norm = torch.norm(axis, dim=2, keepdim=True)
-
-            # (B, K, 1, 1)
-            cos = torch.sum(child_rest_loc * child_final_loc, dim=2, keepdim=True) / (child_rest_norm * child_final_norm + 1e-8)
-            sin = axis_norm / (child_rest_norm * child_final_norm + 1e-8)
-
-            # (B, K, 3, 1)
-            axis = axis / (axis_norm + 1e-8)
-
-            # Convert location revolve to rot_mat by rodrigues
-            # (B, K, 1, 1)
-            rx, ry, rz = torch.split(axis, 1, dim=2)
-            zeros = torch.zeros((batch_size, len_indices, 1, 1), dtype=dtype, device=device)
-
-            K = torch.cat([zeros, -rz, ry, rz, zeros, -rx, -ry, rx, zeros], dim=2) \
-                .view((batch_size, len_indices, 3, 3))
-            ident = torch.eye(3, dtype=dtype, device=device).reshape(1, 1, 3, 3)
-            rot_mat_loc = ident + sin * K + (1 - cos) * torch.matmul(K, K)
-
-            # Convert spin to rot_mat
-            # (B, K, 3, 1)
-            spin_axis = child_rest_loc / (child_rest_norm + 1e-8)
-            # (B, K, 1, 1)
-            rx, ry, rz = torch.split(spin_axis, 1, dim=2)
-            zeros = torch.zeros((batch_size, len_indices, 1, 1), dtype=dtype, device=device)
-            K = torch.cat([zeros, -rz, ry, rz, zeros, -rx, -ry, rx, zeros], dim=2) \
-                .view((batch_size, len_indices, 3, 3))
-            ident = torch.eye(3, dtype=dtype, device=device).reshape(1, 1, 3, 3)
-            # (B, K, 1, 1)
-            phi_indices = [item-1 for item in indices]
-            cos, sin = torch.split(phis[:, phi_indices], 1, dim=2)
-            cos = torch.unsqueeze(cos, dim=3)
-            sin = torch.unsqueeze(sin, dim=3)
-            rot_mat_spin = ident + sin * K + (1 - cos) * torch.matmul(K, K)
-            rot_mat = torch.matmul(rot_mat_loc, rot_mat_spin)
-
-            rot_mat_chain[:, indices] = torch.matmul(
-                    rot_mat_chain[:, parents[indices]], 
-                    rot_mat
-                )
-            rot_mat_local[:, indices] = rot_mat
-
-    # (B, K + 1, 3, 3)
-    # rot_mats = torch.stack(rot_mat_local, dim=1)
-    rot_mats = rot_mat_local
+        leaf_rot_mats = leaf_thetas.view([batch_size, len(leaf_indices), 3, 3])
 
-    return rot_mats, rotate_rest_pose.squeeze(-1)
+        rotate_rest_pose[:, leaf_indices] = rotate_rest_pose[:, leaf_parent_indices] + torch.matmul(
+            rot_mat_chain[:, leaf_parent_indices],
+            rel_rest_pose[:, leaf_indices]
+        )
 
+        rot_mat_chain[:, leaf_indices] = torch.matmul(
+            rot_mat_chain[:, leaf_parent_indices],
+            leaf_rot_mats
+        )
+        rot_mat_local[:, leaf_indices] = leaf_rot_mats
 
+        rot_mats = rot_mat_local
+    else:
+        # (B, K + 1, 3, 3)
+        rot_mats = rot_mat_local[:, [i for i in range(num_joints) if i not in leaf_indices]]
+
+    return rot_mats, rotate_rest_pose.squeeze(-1)
 
-def batch_get_pelvis_orient_svd(rel_pose_skeleton, rel_rest_pose, parents, children, dtype):
-    pelvis_child = [int(children[0])]
-    for i in range(1, parents.shape[0]):
-        if parents[i] == 0 and i not in pelvis_child:
-            pelvis_child.append(i)
 
+def batch_get_pelvis_orient_svd(rel_pose_skeleton, rel_rest_pose, pelvis_child, dtype):
     rest_mat = []
     target_mat = []
     for child in pelvis_child:
@@ -950,44 +1060,26 @@ def batch_get_pelvis_orient_svd(rel_pose_skeleton, rel_rest_pose, parents, child
     target_mat = torch.cat(target_mat, dim=2)
     S = rest_mat.bmm(target_mat.transpose(1, 2))
 
-    mask_zero = S.sum(dim=(1, 2))
+    mask_zero = S.sum(dim=(1, 2)) == 0
 
-    S_non_zero = S[mask_zero != 0].reshape(-1, 3, 3)
-
-    # U, _, V = torch.svd(S_non_zero)
-    device = S_non_zero.device
-    U, _, V = torch.svd(S_non_zero.cpu())
-    U = U.to(device=device)
-    V = V.to(device=device)
-
-    rot_mat = torch.zeros_like(S)
-    rot_mat[mask_zero == 0] = torch.eye(3, device=S.device)
-
-    # rot_mat_non_zero = torch.bmm(V, U.transpose(1, 2))
-    det_u_v = torch.det(torch.bmm(V, U.transpose(1, 2)))
-    det_modify_mat = torch.eye(3, device=U.device).unsqueeze(0).expand(U.shape[0], -1, -1).clone()
-    det_modify_mat[:, 2, 2] = det_u_v
-    rot_mat_non_zero = torch.bmm(torch.bmm(V, det_modify_mat), U.transpose(1, 2))
-
-    rot_mat[mask_zero != 0] = rot_mat_non_zero
-
-    assert torch.sum(torch.isnan(rot_mat)) == 0, ('rot_mat', rot_mat)
+    rot_mat = batch_procrustes_rotmat(S, dtype)
+    # identity for empty skeletons, without a data-dependent index
+    ident = torch.eye(3, dtype=rot_mat.dtype, device=S.device).unsqueeze(dim=0)
+    rot_mat = torch.where(mask_zero[:, None, None], ident, rot_mat)
 
     return rot_mat
 
 
-def batch_get_pelvis_orient(rel_pose_skeleton, rel_rest_pose, parents, children, dtype):
+def batch_get_pelvis_orient(rel_pose_skeleton, rel_rest_pose, pelvis_child, dtype):
     batch_size = rel_pose_skeleton.shape[0]
     device = rel_pose_skeleton.device
 
-    assert children[0] == 3
-    pelvis_child = [int(children[0])]
-    for i in range(1, parents.shape[0]):
-        if parents[i] == 0 and i not in pelvis_child:
-            pelvis_child.append(i)
+    # the first child of the pelvis is the spine
+    spine_child = pelvis_child[0]
+    assert spine_child == 3
 
-    spine_final_loc = rel_pose_skeleton[:, int(children[0])].clone()
-    spine_rest_loc = rel_rest_pose[:, int(children[0])].clone()
+    spine_final_loc = rel_pose_skeleton[:, spine_child].clone()
+    spine_rest_loc = rel_rest_pose[:, spine_child].clone()
     spine_norm = torch.norm(spine_final_loc, dim=1, keepdim=True)
     spine_norm = spine_final_loc / (spine_norm + 1e-8)
 
@@ -1003,9 +1095,7 @@ def batch_get_pelvis_orient(rel_pose_skeleton, rel_rest_pose, parents, children,
                      ) == 0, ('rot_mat_spine', rot_mat_spine)
     center_final_loc = 0
     center_rest_loc = 0
-    for child in pelvis_child:
-        if child == int(children[0]):
-            continue
+    for child in pelvis_child[1:]:
         center_final_loc = center_final_loc + rel_pose_skeleton[:, child].clone()
         center_rest_loc = center_rest_loc + rel_rest_pose[:, child].clone()
     center_final_loc = center_final_loc / (len(pelvis_child) - 1)
@@ -1071,22 +1161,58 @@ def batch_get_3children_orient_svd(rel_pose_skeleton, rel_rest_pose, rot_mat_cha
     target_mat = torch.cat(target_mat, dim=2)
     S = rest_mat.bmm(target_mat.transpose(1, 2))
 
-    # U, _, V = torch.svd(S)
-    device = S.device
-    U, _, V = torch.svd(S.cpu())
-    U = U.to(device=device)
-    V = V.to(device=device)
-
-    # rot_mat = torch.bmm(V, U.transpose(1, 2))
-    det_u_v = torch.det(torch.bmm(V, U.transpose(1, 2)))
-    det_modify_mat = torch.eye(3, device=U.device).unsqueeze(0).expand(U.shape[0], -1, -1).clone()
-    det_modify_mat[:, 2, 2] = det_u_v
-    rot_mat = torch.bmm(torch.bmm(V, det_modify_mat), U.transpose(1, 2))
+    rot_mat = batch_procrustes_rotmat(S, dtype)
 
-    assert torch.sum(torch.isnan(rot_mat)) == 0, ('3children rot_mat', rot_mat)
     return rot_mat
 
 
+def batch_procrustes_rotmat(S, dtype=torch.float32):
+    ''' Solves the 3x3 orthogonal Procrustes problem on the device of `S`
+
+        Horn's quaternion method: the best rotation is the eigenvector of the
+        largest eigenvalue of a symmetric 4x4 matrix built from `S`. Unlike
+        ``torch.svd`` on 3x3 inputs, this batches well on any device, so no
+        CPU round-trip is needed. Reflections are excluded by construction,
+        which matches the det-corrected SVD solution.
+
+        Parameters
+        ----------
+        S : torch.tensor Bx3x3
+            The covariance ``rest @ target^T`` of the matched vectors
+
+        Returns
+        -------
+        rot_mat : torch.tensor Bx3x3
+            The rotation that best maps the rest vectors onto the targets
+    '''
+    batch_size = S.shape[0]
+
+    Sxx, Sxy, Sxz = S[:, 0, 0], S[:, 0, 1], S[:, 0, 2]
+    Syx, Syy, Syz = S[:, 1, 0], S[:, 1, 1], S[:, 1, 2]
+    Szx, Szy, Szz = S[:, 2, 0], S[:, 2, 1], S[:, 2, 2]
+
+    # (B, 4, 4)
+    N = torch.stack([
+        Sxx + Syy + Szz, Syz - Szy, Szx - Sxz, Sxy - Syx,
+        Syz - Szy, Sxx - Syy - Szz, Sxy + Syx, Szx + Sxz,
+        Szx - Sxz, Sxy + Syx, -Sxx + Syy - Szz, Syz + Szy,
+        Sxy - Syx, Szx + Sxz, Syz + Szy, -Sxx - Syy + Szz
+    ], dim=1).view(batch_size, 4, 4)
+
+    # eigenvalues are in ascending order; the 4x4 solve is cheap enough to
+    # run in float64, which keeps it at least as accurate as a float32 SVD
+    _, eigvecs = torch.linalg.eigh(N.double())
+    w, x, y, z = torch.unbind(eigvecs[:, :, -1], dim=1)
+
+    rot_mat = torch.stack([
+        1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y),
+        2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x),
+        2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)
+    ], dim=1).view(batch_size, 3, 3)
+
+    return rot_mat.to(dtype)
+
+
 def vectors2rotmat(vec_rest, vec_final, dtype):
     batch_size = vec_final.shape[0]
     device = vec_final.device
@@ -27,7 +27,8 @@ import torch.nn as nn
 from easydict import EasyDict as edict
 
 from .lbs import (
-    lbs, vertices2landmarks, find_dynamic_lmk_idx_and_bcoords, blend_shapes, hybrik, lbs_get_twist, mat2quat)
+    lbs, vertices2landmarks, find_dynamic_lmk_idx_and_bcoords, blend_shapes, hybrik, lbs_get_twist, mat2quat,
+    contract_joint_regressor)
 
 from .vertex_ids import vertex_ids as VERTEX_IDS
 from .utils import (
@@ -1137,6 +1138,16 @@ class SMPLXLayer(SMPLX):
         self.register_buffer('extended_parents', extended_parents)
         self.register_buffer('children_map', children_map)
 
+        # J_regressor folded into v_template and the shape / expression blend
+        # shapes: rest joints + leaf vertices without building the mesh.
+        # Derived from the model file, so not saved in checkpoints.
+        J_template, J_shapedirs = contract_joint_regressor(
+            self.J_regressor, self.v_template,
+            torch.cat([self.shapedirs, self.expr_dirs], dim=-1),
+            [int(idx) for idx in self.LEAF_INDICES])
+        self.register_buffer('J_template', J_template, persistent=False)
+        self.register_buffer('J_shapedirs', J_shapedirs, persistent=False)
+
         left_hand_components = torch.from_numpy(self.np_left_hand_components)
         right_hand_components = torch.from_numpy(self.np_right_hand_components)
 
@@ -1371,7 +1382,28 @@ class SMPLXLayer(SMPLX):
             use_hand_pca=use_hand_pca,
             lhand_filter_matrix=self.lhand_filter_matrix,
             rhand_filter_matrix=self.rhand_filter_matrix,
-            naive=naive)
+            naive=naive,
+            J_template=self.J_template, J_shapedirs=self.J_shapedirs,
+            return_verts=return_verts)
+
+        if not return_verts:
+            # joints-only pass: the kinematic joints, without vertex-based
+            # extra joints and landmarks
+            if transl is not None:
+                joints = joints + transl.unsqueeze(dim=1)
+            elif root_align:
+                joints = joints - joints[:, [0], :]
+
+            theta_quat = mat2quat(full_pose.reshape(-1, 3, 3)).reshape(batch_size, -1)
+
+            output = {
+                'vertices': None,
+                'joints': joints,
+                'joints_55': joints,
+                'rot_mats': full_pose,
+                'theta_quat': theta_quat
+            }
+            return edict(output)
 
         lmk_faces_idx = self.lmk_faces_idx.unsqueeze(
             dim=0).expand(batch_size, -1).contiguous()
@@ -257,7 +257,10 @@ def hybrik(
     use_hand_pca: bool = False,
     lhand_filter_matrix: Tensor = None,
     rhand_filter_matrix: Tensor = None,
-    naive=False
+    naive=False,
+    J_template: Tensor = None,
+    J_shapedirs: Tensor = None,
+    return_verts: bool = True
 ):
 
     # parents should add leaf joints
@@ -266,11 +269,17 @@ def hybrik(
     num_theta = phis.shape[1] + 1
 
     # Add shape contribution
-    v_shaped = v_template + blend_shapes(betas, shapedirs)
+    if return_verts or J_template is None:
+        v_shaped = v_template + blend_shapes(betas, shapedirs)
 
     # Get the joints
     # NxJx3 array
-    if leaf_thetas is not None:
+    if J_template is not None:
+        # J_regressor already folded into the template and blend shapes
+        rest_J = J_template + blend_shapes(betas, J_shapedirs)
+        if leaf_thetas is not None:
+            rest_J = rest_J[:, :J_regressor.shape[0]]
+    elif leaf_thetas is not None:
         rest_J = vertices2joints(J_regressor, v_shaped)
     else:
         rest_J_inner = vertices2joints(J_regressor, v_shaped)
@@ -307,6 +316,9 @@ def hybrik(
     else:
         J_transformed = None
 
+    if not return_verts:
+        return None, J_transformed, rot_mats
+
     ident = torch.eye(3, dtype=dtype, device=device)
     pose_feature = (rot_mats[:, 1:] - ident).view([batch_size, -1])
     pose_offsets = torch.matmul(pose_feature, posedirs) \
@@ -1117,6 +1129,44 @@ def rotmat_to_aa(rotmat):
     return aa, axis, angle
 
 
+def contract_joint_regressor(
+    J_regressor: Tensor,
+    v_template: Tensor,
+    shapedirs: Tensor,
+    leaf_indices: List[int]
+) -> Tuple[Tensor, Tensor]:
+    ''' Folds the joint regressor into the template and shape blend shapes
+    Parameters
+    ----------
+    J_regressor : torch.tensor JxV
+        The regressor array that is used to calculate the joints from the
+        position of the vertices
+    v_template : torch.tensor Vx3
+        The template mesh
+    shapedirs : torch.tensor Vx3xNB
+        The shape (and expression) blend shapes
+    leaf_indices : list
+        The vertices appended as leaf joints
+    Returns
+    -------
+    J_template : torch.tensor (J + L)x3
+        The rest joints of the template
+    J_shapedirs : torch.tensor (J + L)x3xNB
+        The rest joint displacements, so that the rest joints are
+        ``J_template + blend_shapes(betas, J_shapedirs)``
+    '''
+
+    J_template = torch.cat([
+        torch.matmul(J_regressor, v_template),
+        v_template[leaf_indices]
+    ], dim=0)
+    J_shapedirs = torch.cat([
+        torch.einsum('jv,vcl->jcl', [J_regressor, shapedirs]),
+        shapedirs[leaf_indices]
+    ], dim=0)
+    return J_template, J_shapedirs
+
+
 def vertices2joints(J_regressor: Tensor, vertices: Tensor) -> Tensor:
     ''' Calculates the 3D joint locations from the vertices
     Parameters
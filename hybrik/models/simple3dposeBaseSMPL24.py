@@ -10,6 +10,8 @@ import torch
 import torch.nn as nn
 from torch.nn import functional as F
 
+from hybrik.utils.precision import backbone_autocast, get_amp_dtype
+
 from .builder import SPPE
 from .layers.Resnet import ResNet
 from .layers.smpl.SMPL import SMPL_layer
@@ -48,6 +50,7 @@ class Simple3DPoseBaseSMPL24(nn.Module):
         self.height_dim = kwargs['HEATMAP_SIZE'][0]
         self.width_dim = kwargs['HEATMAP_SIZE'][1]
         self.smpl_dtype = torch.float32
+        self.amp_dtype = get_amp_dtype(kwargs['AMP']) if 'AMP' in kwargs else None
 
         backbone = ResNet
 
@@ -239,9 +242,11 @@ class Simple3DPoseBaseSMPL24(nn.Module):
     def forward(self, x, trans_inv, intrinsic_param, joint_root, depth_factor, flip_item=None, flip_output=False):
         batch_size = x.shape[0]
 
-        x0 = self.preact(x)
-        out = self.deconv_layers(x0)
-        out = self.final_layer(out)
+        with backbone_autocast(x.device, self.amp_dtype):
+            x0 = self.preact(x)
+            out = self.deconv_layers(x0)
+            out = self.final_layer(out)
+        x0, out = x0.float(), out.float()
 
         out = out.reshape((out.shape[0], self.num_joints, -1))
         out = norm_heatmap(self.norm_type, out)
@@ -4,6 +4,9 @@ import torch.nn as nn
 from easydict import EasyDict as edict
 from torch.nn import functional as F
 
+from hybrik.utils.heatmap import flip_index_from_pairs, soft_argmax_3d
+from hybrik.utils.precision import backbone_autocast, get_amp_dtype
+
 from .builder import SPPE
 from .layers.Resnet import ResNet
 from .layers.smpl.SMPL import SMPL_layer
@@ -40,6 +43,7 @@ class Simple3DPoseBaseSMPLCam(nn.Module):
         self.height_dim = kwargs['HEATMAP_SIZE'][0]
         self.width_dim = kwargs['HEATMAP_SIZE'][1]
         self.smpl_dtype = torch.float32
+        self.amp_dtype = get_amp_dtype(kwargs['AMP']) if 'AMP' in kwargs else None
 
         backbone = ResNet
 
@@ -88,6 +92,10 @@ class Simple3DPoseBaseSMPLCam(nn.Module):
 
         self.leaf_pairs = ((0, 1), (3, 4))
         self.root_idx_smpl = 0
+        self.register_buffer(
+            'flip_index_29', flip_index_from_pairs(29, self.joint_pairs_29), persistent=False)
+        # joints normalized at once by the soft-argmax, bounds the peak heatmap memory
+        self.heatmap_chunk = kwargs['HEATMAP_CHUNK'] if 'HEATMAP_CHUNK' in kwargs else 8
 
         # mean shape
         init_shape = np.load('./model_files/h36m_mean_beta.npy')
@@ -161,41 +169,14 @@ class Simple3DPoseBaseSMPLCam(nn.Module):
             heatmaps[:, idx] = heatmaps[:, inv_idx]
 
         if shift:
-            if heatmaps.dim() == 3:
-                heatmaps[:, :, 1:] = heatmaps[:, :, 0:-1]
-            elif heatmaps.dim() == 4:
-                heatmaps[:, :, :, 1:] = heatmaps[:, :, :, 0:-1]
-            else:
-                heatmaps[:, :, :, :, 1:] = heatmaps[:, :, :, :, 0:-1]
+            # out of place, an overlapping in-place shift smears the columns
+            heatmaps = torch.cat((heatmaps[..., :1], heatmaps[..., :-1]), dim=-1)
 
         return heatmaps
 
-    def flip_phi(self, pred_phi):
-        pred_phi[:, :, 1] = -1 * pred_phi[:, :, 1]
-
-        for pair in self.joint_pairs_24:
-            dim0, dim1 = pair
-            idx = torch.Tensor((dim0 - 1, dim1 - 1)).long()
-            inv_idx = torch.Tensor((dim1 - 1, dim0 - 1)).long()
-            pred_phi[:, idx] = pred_phi[:, inv_idx]
-
-        return pred_phi
-
-    def forward(self, x, flip_test=False, **kwargs):
-        batch_size = x.shape[0]
-
-        x0 = self.preact(x)
-        out = self.deconv_layers(x0)
-        out = self.final_layer(out)
-
-        if flip_test:
-            flip_x = flip(x)
-            flip_x0 = self.preact(flip_x)
-            flip_out = self.deconv_layers(flip_x0)
-            flip_out = self.final_layer(flip_out)
-
+    def integral_heatmap(self, out, flip_out=None):
+        if flip_out is not None:
             # flip heatmap
-            flip_out = flip_out.reshape(batch_size, self.num_joints, self.depth_dim, self.height_dim, self.width_dim)
             flip_out = self.flip_heatmap(flip_out)
 
             out = out.reshape((out.shape[0], self.num_joints, -1))
@@ -216,25 +197,61 @@ class Simple3DPoseBaseSMPLCam(nn.Module):
 
         heatmaps = heatmaps.reshape((heatmaps.shape[0], self.num_joints, self.depth_dim, self.height_dim, self.width_dim))
 
-        hm_x0 = heatmaps.sum((2, 3))
-        hm_y0 = heatmaps.sum((2, 4))
-        hm_z0 = heatmaps.sum((3, 4))
+        hm_x0 = heatmaps.sum((2, 3))  # (B, K, W)
+        hm_y0 = heatmaps.sum((2, 4))  # (B, K, H)
+        hm_z0 = heatmaps.sum((3, 4))  # (B, K, D)
 
-        range_tensor = torch.arange(hm_x0.shape[-1], dtype=torch.float32, device=hm_x0.device)
-        hm_x = hm_x0 * range_tensor
-        hm_y = hm_y0 * range_tensor
-        hm_z = hm_z0 * range_tensor
-
-        coord_x = hm_x.sum(dim=2, keepdim=True)
-        coord_y = hm_y.sum(dim=2, keepdim=True)
-        coord_z = hm_z.sum(dim=2, keepdim=True)
+        range_tensor = torch.arange(hm_x0.shape[-1], dtype=torch.float32, device=hm_x0.device).unsqueeze(-1)
+        coord_x = hm_x0.matmul(range_tensor)
+        coord_y = hm_y0.matmul(range_tensor)
+        coord_z = hm_z0.matmul(range_tensor)
 
         coord_x = coord_x / float(self.width_dim) - 0.5
         coord_y = coord_y / float(self.height_dim) - 0.5
         coord_z = coord_z / float(self.depth_dim) - 0.5
 
         #  -0.5 ~ 0.5
-        pred_uvd_jts_29 = torch.cat((coord_x, coord_y, coord_z), dim=2)
+        return torch.cat((coord_x, coord_y, coord_z), dim=2), maxvals
+
+    def flip_phi(self, pred_phi):
+        pred_phi[:, :, 1] = -1 * pred_phi[:, :, 1]
+
+        for pair in self.joint_pairs_24:
+            dim0, dim1 = pair
+            idx = torch.Tensor((dim0 - 1, dim1 - 1)).long()
+            inv_idx = torch.Tensor((dim1 - 1, dim0 - 1)).long()
+            pred_phi[:, idx] = pred_phi[:, inv_idx]
+
+        return pred_phi
+
+    def forward(self, x, flip_test=False, **kwargs):
+        batch_size = x.shape[0]
+
+        with backbone_autocast(x.device, self.amp_dtype):
+            x0 = self.preact(x)
+            out = self.deconv_layers(x0)
+            out = self.final_layer(out)
+        x0, out = x0.float(), out.float()
+
+        out = out.reshape(batch_size, self.num_joints, self.depth_dim, self.height_dim, self.width_dim)
+
+        if flip_test:
+            flip_x = flip(x)
+            with backbone_autocast(x.device, self.amp_dtype):
+                flip_x0 = self.preact(flip_x)
+                flip_out = self.deconv_layers(flip_x0)
+                flip_out = self.final_layer(flip_out)
+            flip_x0, flip_out = flip_x0.float(), flip_out.float()
+            flip_out = flip_out.reshape(batch_size, self.num_joints, self.depth_dim, self.height_dim, self.width_dim)
+        else:
+            flip_out = None
+
+        if self.norm_type == 'softmax':
+            #  -0.5 ~ 0.5
+            pred_uvd_jts_29, maxvals = soft_argmax_3d(
+                out, flip_out, self.flip_index_29, chunk_size=self.heatmap_chunk)
+        else:
+            pred_uvd_jts_29, maxvals = self.integral_heatmap(out, flip_out)
 
         x0 = self.avg_pool(x0)
         x0 = x0.view(x0.size(0), -1)
@@ -8,6 +8,7 @@ from .builder import SPPE
 from .layers.Resnet import ResNet
 from .layers.smpl.SMPL import SMPL_layer
 
+from hybrik.utils.precision import backbone_autocast, get_amp_dtype
 from hybrik.utils.transforms import flip_coord
 
 
@@ -42,6 +43,7 @@ class Simple3DPoseBaseSMPLCamReg(nn.Module):
         self.height_dim = kwargs['HEATMAP_SIZE'][0]
         self.width_dim = kwargs['HEATMAP_SIZE'][1]
         self.smpl_dtype = torch.float32
+        self.amp_dtype = get_amp_dtype(kwargs['AMP']) if 'AMP' in kwargs else None
 
         backbone = ResNet
 
@@ -151,7 +153,9 @@ class Simple3DPoseBaseSMPLCamReg(nn.Module):
     def forward(self, x, flip_test=False, **kwargs):
         batch_size, _, _, width_dim = x.shape
 
-        x0 = self.preact(x)
+        with backbone_autocast(x.device, self.amp_dtype):
+            x0 = self.preact(x)
+        x0 = x0.float()
 
         x0 = self.avg_pool(x0)
         x0 = x0.view(x0.size(0), -1)
@@ -170,7 +174,9 @@ class Simple3DPoseBaseSMPLCamReg(nn.Module):
 
         if flip_test:
             flip_x = flip(x)
-            flip_x0 = self.preact(flip_x)
+            with backbone_autocast(x.device, self.amp_dtype):
+                flip_x0 = self.preact(flip_x)
+            flip_x0 = flip_x0.float()
             flip_x0 = self.avg_pool(flip_x0)
             flip_x0 = flip_x0.view(flip_x0.size(0), -1)
 
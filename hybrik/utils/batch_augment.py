@@ -0,0 +1,151 @@
+import math
+
+import cv2
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+# the per-sample normalization of the presets
+PIXEL_MEAN = (0.406, 0.457, 0.480)
+PIXEL_STD = (0.225, 0.224, 0.229)
+
+
+def light_crop_size(input_size):
+    ''' Size of the light crops of a transform, as (height, width).
+
+    The crop holds the input window at any rotation, plus a pixel for the
+    bilinear neighbours. Unrotated windows sit on its pixel grid.
+    '''
+    inp_h, inp_w = input_size
+    size = int(math.ceil(math.hypot(inp_h, inp_w))) + 2
+    return size + (size - inp_h) % 2, size + (size - inp_w) % 2
+
+
+def light_crop(src, trans, input_size, flip=False, occlusion=None):
+    ''' Unrotated crop around the input window of a sample, resampled to the input scale.
+
+    The rotation, occlusion fill and color jitter are left to `batch_augment`
+    on the training device. A horizontal flip is folded into the crop warp
+    instead of copying the mirrored image.
+
+    Parameters
+    ----------
+    src: numpy.ndarray
+        Unflipped image with shape: `(H, W, 3)`.
+    trans: numpy.ndarray
+        2x3 affine from the (flipped) image to the input window, as in the presets.
+    input_size: tuple
+        Input image size, as (height, width).
+    flip: bool, optional
+        Whether `trans` is defined on the mirrored image.
+    occlusion: list, optional
+        Occluded pixels (xmin, ymin, xmax, ymax) of the unflipped image.
+
+    Returns
+    -------
+    patch: numpy.ndarray
+        uint8 crop with shape: `(crop_h, crop_w, 3)`.
+    aug: dict
+        `patch_trans_inv` from the input window to the crop, the crop
+        `occlusion_box` (empty without occlusion).
+    '''
+    inp_h, inp_w = input_size
+    crop_h, crop_w = light_crop_size(input_size)
+
+    # similarity of the presets, only its scale and center are kept
+    scale = math.sqrt(abs(np.linalg.det(trans[:, :2])))
+    trans_inv = cv2.invertAffineTransform(trans)
+    center = trans_inv.dot([inp_w * 0.5, inp_h * 0.5, 1])
+
+    to_patch = np.array([
+        [scale, 0, crop_w * 0.5 - scale * center[0]],
+        [0, scale, crop_h * 0.5 - scale * center[1]],
+        [0, 0, 1]])
+    if flip:
+        mirror = np.array([[-1, 0, src.shape[1] - 1], [0, 1, 0], [0, 0, 1]])
+        src_to_patch = to_patch.dot(mirror)
+    else:
+        src_to_patch = to_patch
+
+    patch = cv2.warpAffine(src, src_to_patch[:2], (crop_w, crop_h), flags=cv2.INTER_LINEAR)
+
+    occlusion_box = np.zeros(4, dtype=np.float32)
+    if occlusion is not None:
+        # pixel [xmin, xmax) covers [xmin - 0.5, xmax - 0.5)
+        corners = np.array([
+            [occlusion[0] - 0.5, occlusion[1] - 0.5, 1],
+            [occlusion[2] - 0.5, occlusion[3] - 0.5, 1]]).dot(src_to_patch[:2].T)
+        occlusion_box[:2] = corners.min(axis=0)
+        occlusion_box[2:] = corners.max(axis=0)
+
+    aug = {
+        'patch_trans_inv': torch.from_numpy(to_patch[:2].dot(np.vstack([trans_inv, [0, 0, 1]]))).float(),
+        'occlusion_box': torch.from_numpy(occlusion_box),
+    }
+    return patch, aug
+
+
+def _pixel_to_grid(width, height, device):
+    # pixel centers to [-1, 1] coordinates of `align_corners=False`
+    return torch.tensor([
+        [2. / width, 0, 1. / width - 1],
+        [0, 2. / height, 1. / height - 1],
+        [0, 0, 1]], device=device)
+
+
+def batch_augment(inps, labels, input_size):
+    ''' Finish the augmentation of a batch of light crops on its device.
+
+    Fills the occlusion boxes with uniform noise, warps the crops to the
+    input window with `grid_sample`, applies the color jitter and normalizes
+    the images like the presets. The augmentation keys are popped from `labels`.
+
+    Parameters
+    ----------
+    inps: torch.Tensor
+        uint8 light crops with shape: `(B, 3, crop_h, crop_w)`.
+    labels: dict
+        Batch labels with `patch_trans_inv`, `occlusion_box` and `color_factor`.
+    input_size: tuple
+        Input image size, as (height, width).
+
+    Returns
+    -------
+    torch.Tensor
+        Normalized images with shape: `(B, 3, inp_h, inp_w)`.
+    '''
+    patch_trans_inv = labels.pop('patch_trans_inv').float()
+    occlusion_box = labels.pop('occlusion_box').float()
+    color_factor = labels.pop('color_factor').float()
+
+    patches = inps.float()
+    batch_size, _, crop_h, crop_w = patches.shape
+    inp_h, inp_w = input_size
+    device = patches.device
+
+    # synthetic occlusion, truncated like the uint8 fill of the presets
+    ys = torch.arange(crop_h, device=device, dtype=torch.float32).view(1, -1, 1)
+    xs = torch.arange(crop_w, device=device, dtype=torch.float32).view(1, 1, -1)
+    x0, y0, x1, y1 = [occlusion_box[:, i].view(-1, 1, 1) for i in range(4)]
+    mask = (xs >= x0) & (xs < x1) & (ys >= y0) & (ys < y1)
+    noise = torch.floor(torch.rand_like(patches) * 255)
+    patches = torch.where(mask.unsqueeze(1), noise, patches)
+
+    # input pixels -> crop pixels -> grid coordinates
+    last_row = torch.tensor([0, 0, 1.], device=device).expand(batch_size, 1, 3)
+    theta = torch.cat([patch_trans_inv, last_row], dim=1)
+    theta = _pixel_to_grid(crop_w, crop_h, device).matmul(theta).matmul(
+        torch.inverse(_pixel_to_grid(inp_w, inp_h, device)))
+    grid = F.affine_grid(theta[:, :2], (batch_size, 3, inp_h, inp_w), align_corners=False)
+    img = F.grid_sample(patches, grid, mode='bilinear', padding_mode='zeros', align_corners=False)
+    img = torch.round(img)
+
+    img = torch.floor(torch.clamp(img * color_factor.view(-1, 3, 1, 1), 0, 255))
+
+    # im_to_torch only rescales images brighter than 1
+    bright = img.flatten(1).max(dim=1)[0] > 1
+    img = torch.where(bright.view(-1, 1, 1, 1), img / 255, img)
+
+    mean = torch.tensor(PIXEL_MEAN, device=device).view(1, 3, 1, 1)
+    std = torch.tensor(PIXEL_STD, device=device).view(1, 3, 1, 1)
+    return (img - mean) / std
@@ -9,9 +9,9 @@ def bbox_iou(bbox_a, bbox_b, offset=0):
 
     Parameters
     ----------
-    bbox_a : numpy.ndarray
+    bbox_a : numpy.ndarray or torch.Tensor
         An ndarray with shape :math:`(N, 4)`.
-    bbox_b : numpy.ndarray
+    bbox_b : numpy.ndarray or torch.Tensor
         An ndarray with shape :math:`(M, 4)`.
     offset : float or int, default is 0
         The ``offset`` is used to control the whether the width(or height) is computed as
@@ -20,20 +20,28 @@ def bbox_iou(bbox_a, bbox_b, offset=0):
 
     Returns
     -------
-    numpy.ndarray
+    numpy.ndarray or torch.Tensor
         An ndarray with shape :math:`(N, M)` indicates IOU between each pairs of
-        bounding boxes in `bbox_a` and `bbox_b`.
+        bounding boxes in `bbox_a` and `bbox_b`. Tensors are returned for tensor
+        inputs, on the device of the inputs.
 
     """
     if bbox_a.shape[1] < 4 or bbox_b.shape[1] < 4:
         raise IndexError("Bounding boxes axis 1 must have at least length 4")
 
-    tl = np.maximum(bbox_a[:, None, :2], bbox_b[:, :2])
-    br = np.minimum(bbox_a[:, None, 2:4], bbox_b[:, 2:4])
+    if isinstance(bbox_a, np.ndarray):
+        bbox_a, bbox_b = torch.from_numpy(bbox_a), torch.from_numpy(np.asarray(bbox_b))
+        if not torch.promote_types(bbox_a.dtype, bbox_b.dtype).is_floating_point:
+            # integer pixel boxes, keep numpy's float64 division
+            bbox_a, bbox_b = bbox_a.double(), bbox_b.double()
+        return bbox_iou(bbox_a, bbox_b, offset).numpy()
 
-    area_i = np.prod(br - tl + offset, axis=2) * (tl < br).all(axis=2)
-    area_a = np.prod(bbox_a[:, 2:4] - bbox_a[:, :2] + offset, axis=1)
-    area_b = np.prod(bbox_b[:, 2:4] - bbox_b[:, :2] + offset, axis=1)
+    tl = torch.max(bbox_a[:, None, :2], bbox_b[:, :2])
+    br = torch.min(bbox_a[:, None, 2:4], bbox_b[:, 2:4])
+
+    area_i = torch.prod((br - tl + offset).clamp(min=0), dim=2)
+    area_a = torch.prod(bbox_a[:, 2:4] - bbox_a[:, :2] + offset, dim=1)
+    area_b = torch.prod(bbox_b[:, 2:4] - bbox_b[:, :2] + offset, dim=1)
     return area_i / (area_a[:, None] + area_b - area_i)
 
 
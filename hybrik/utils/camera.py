@@ -0,0 +1,140 @@
+import torch
+
+
+def bbox_center_offset(bboxes, img_center):
+    ''' Offset of the bbox center from the image center, normalized by the bbox size.
+
+    Parameters
+    ----------
+    bboxes: torch.tensor Bx4
+        Boxes in (x1, y1, x2, y2) format.
+    img_center: torch.tensor Bx2
+        Image centers.
+
+    Returns
+    -------
+    bbox_center: torch.tensor Bx1x2
+    '''
+    cx = (bboxes[:, 0] + bboxes[:, 2]) * 0.5
+    cy = (bboxes[:, 1] + bboxes[:, 3]) * 0.5
+    w = (bboxes[:, 2] - bboxes[:, 0])
+    h = (bboxes[:, 3] - bboxes[:, 1])
+
+    cx = (cx - img_center[:, 0]) / w
+    cy = (cy - img_center[:, 1]) / h
+
+    return torch.stack((cx, cy), dim=1).unsqueeze(dim=1)
+
+
+def back_project_uvd(pred_uvd, cam_depth, focal_length, input_size, depth_factor, bbox_center=None):
+    ''' Back-project normalized uvd joints to camera space.
+
+    Parameters
+    ----------
+    pred_uvd: torch.tensor BxKx3
+        Normalized uv and root-relative depth (unit: depth_factor m).
+    cam_depth: torch.tensor Bx1x1
+        Root depth (unit: m).
+    bbox_center: torch.tensor Bx1x2, optional
+        Output of `bbox_center_offset`, added to uv before back-projection.
+
+    Returns
+    -------
+    pred_xyz: torch.tensor BxKx3
+        Camera-space joints (unit: depth_factor m).
+    '''
+    pred_uv = pred_uvd[:, :, :2]
+    if bbox_center is not None:
+        pred_uv = pred_uv + bbox_center
+
+    pred_z = pred_uvd[:, :, 2:]
+    pred_xy = (pred_uv * input_size / focal_length) * (pred_z * depth_factor + cam_depth)  # unit: m
+
+    return torch.cat((pred_xy / depth_factor, pred_z), dim=2)
+
+
+def solve_camera_scale(pred_uv, pred_xyz, weight, init_scale, focal_length, input_size, eps=1e-9):
+    ''' Closed-form weighted least-squares solve of the camera scale.
+
+    Finds the root depth d = 1 / scale minimizing
+    sum_k w_k^2 || uv_k * d - (xy_k - input_size / focal_length * uv_k * z_k) ||^2,
+    which has the analytic solution d = sum(w^2 * uv * b) / sum(w^2 * uv^2).
+    Samples whose system is degenerate (all weights zero, uv at the image
+    center) or whose solution is not a finite positive depth keep `init_scale`.
+
+    Parameters
+    ----------
+    pred_uv: torch.tensor BxKx2
+        Normalized uv, including the bbox center offset.
+    pred_xyz: torch.tensor BxKx3
+        Joints from the kinematic pass, translated to the back-projected root (unit: m).
+    weight: torch.tensor BxKx1
+        Per-joint confidence.
+    init_scale: torch.tensor Bx1x1
+        Current camera scale.
+
+    Returns
+    -------
+    scale: torch.tensor Bx1x1
+    '''
+    A = pred_uv * weight
+    b = (pred_xyz[:, :, :2] - input_size / focal_length * pred_uv * pred_xyz[:, :, 2:]) * weight
+
+    num = (A * b).sum(dim=(1, 2))
+    denom = (A * A).sum(dim=(1, 2))
+
+    res = num / denom.clamp_min(eps)
+    valid = (denom > eps) & torch.isfinite(res) & (res > 0)
+
+    scale = torch.where(
+        valid, 1.0 / torch.where(valid, res, torch.ones_like(res)), init_scale.reshape(-1).to(res.dtype))
+
+    return scale.reshape(init_scale.shape).type_as(init_scale)
+
+
+def refine_camera_scale(pred_uvd, weight, init_scale, joints_fn, focal_length, input_size, depth_factor,
+                        num_joints, bboxes=None, img_center=None):
+    ''' Refine the camera scale against the joints of a kinematic pass.
+
+    The uvd joints are back-projected with the current scale, `joints_fn` maps
+    the root-relative skeleton to model joints, and the scale is re-solved in
+    closed form from their reprojection.
+
+    Parameters
+    ----------
+    pred_uvd: torch.tensor BxKx3
+        Normalized uvd joints.
+    weight: torch.tensor BxKx1
+        Per-joint confidence, only the first `num_joints` are used.
+    init_scale: torch.tensor Bx1x1
+        Current camera scale.
+    joints_fn: callable
+        Takes the root-relative skeleton (unit: depth_factor m) and returns
+        at least `num_joints` joints (unit: m).
+    bboxes, img_center: torch.tensor, optional
+        When given, uv is offset by the bbox center.
+
+    Returns
+    -------
+    scale: torch.tensor Bx1x1
+    '''
+    cam_depth = focal_length / (input_size * init_scale + 1e-9)
+
+    bbox_center = None
+    if bboxes is not None:
+        bbox_center = bbox_center_offset(bboxes, img_center)
+
+    pred_xyz = back_project_uvd(pred_uvd, cam_depth, focal_length, input_size, depth_factor, bbox_center)
+
+    # unit: m
+    camera_root = pred_xyz[:, [0], :] * depth_factor
+
+    joints = joints_fn(pred_xyz - pred_xyz[:, [0]])[:, :num_joints].float()
+    joints = joints - joints[:, [0], :] + camera_root
+
+    pred_uv = pred_uvd[:, :num_joints, :2]
+    if bbox_center is not None:
+        pred_uv = pred_uv + bbox_center
+
+    return solve_camera_scale(
+        pred_uv, joints, weight[:, :num_joints], init_scale, focal_length, input_size)
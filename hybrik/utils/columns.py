@@ -0,0 +1,334 @@
+import hashlib
+import json
+import math
+import multiprocessing as mp
+import os
+import shutil
+import uuid
+
+import numpy as np
+from tqdm import tqdm
+
+COLUMNS_META = 'meta.json'
+SOURCES_MEMO = 'sources.json'
+
+
+def columns_dir_of(ann_prefix):
+    ''' Columnar annotations of a dataset split live next to its annotation file. '''
+    return ann_prefix + '_columns'
+
+
+def _is_string_column(column):
+    if column.dtype.kind in 'US':
+        return True
+    return column.dtype == object and all(isinstance(v, (str, np.str_)) for v in column)
+
+
+def save_columns(db, store_dir):
+    ''' Write an annotation dict as one file per key.
+
+    Numeric keys are saved as .npy arrays, string keys (`img_path`) as a
+    utf-8 blob with per-sample offsets. Anything else falls back to a pickled
+    .npy loaded eagerly. The store is written to a temporary directory and
+    renamed into place, concurrent writers (e.g. DDP ranks) keep the first one.
+
+    Parameters
+    ----------
+    db: dict
+        Annotation arrays with the sample index as first dimension.
+    store_dir: str
+        Output directory.
+    '''
+    num_samples = len(db['img_path'])
+    tmp_dir = f'{store_dir}.tmp-{uuid.uuid4().hex[:8]}'
+    os.makedirs(tmp_dir)
+
+    kinds = {}
+    for k, v in db.items():
+        column = np.asarray(v) if not isinstance(v, list) else np.array(v, dtype=object)
+        assert len(column) == num_samples, f'{k} has {len(column)} rows for {num_samples} samples'
+
+        if _is_string_column(column):
+            encoded = [str(s).encode('utf-8') for s in column]
+            offsets = np.zeros(num_samples + 1, dtype=np.int64)
+            np.cumsum([len(s) for s in encoded], out=offsets[1:])
+            np.save(os.path.join(tmp_dir, f'{k}.str.npy'), np.frombuffer(b''.join(encoded), dtype=np.uint8))
+            np.save(os.path.join(tmp_dir, f'{k}.off.npy'), offsets)
+            kinds[k] = 'str'
+        elif column.dtype == object:
+            np.save(os.path.join(tmp_dir, f'{k}.npy'), column, allow_pickle=True)
+            kinds[k] = 'object'
+        else:
+            np.save(os.path.join(tmp_dir, f'{k}.npy'), np.ascontiguousarray(column))
+            kinds[k] = 'array'
+
+    # written last, a directory without it is an interrupted run
+    with open(os.path.join(tmp_dir, COLUMNS_META), 'w') as f:
+        json.dump({'num_samples': num_samples, 'keys': list(kinds.keys()), 'kinds': kinds}, f)
+
+    try:
+        os.rename(tmp_dir, store_dir)
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not os.path.exists(os.path.join(store_dir, COLUMNS_META)):
+            raise
+
+
+def _file_digest(path, memo):
+    stat = os.stat(path)
+    entry = memo.get(os.path.abspath(path))
+    if entry is not None and entry[:2] == [stat.st_size, stat.st_mtime_ns]:
+        return entry[2]
+
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 24), b''):
+            digest.update(chunk)
+    memo[os.path.abspath(path)] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+    return digest.hexdigest()
+
+
+def cache_key(root, sources=(), params=None):
+    ''' Content hash of the annotation sources and the parsing parameters.
+
+    File digests are memoized in `<root>/sources.json` by size and mtime, so
+    large annotation files are only hashed again after they change.
+
+    Parameters
+    ----------
+    root: str
+        Columns directory of the split.
+    sources: list, optional
+        Annotation files the cache is built from.
+    params: dict, optional
+        JSON serializable settings that change the parsed annotations.
+
+    Returns
+    -------
+    key: str
+    '''
+    memo_path = os.path.join(root, SOURCES_MEMO)
+    memo = {}
+    if os.path.exists(memo_path):
+        with open(memo_path, 'r') as f:
+            memo = json.load(f)
+
+    old_memo = json.dumps(memo, sort_keys=True)
+    digest = hashlib.sha1(json.dumps(params or {}, sort_keys=True).encode('utf-8'))
+    for path in sources:
+        digest.update(_file_digest(path, memo).encode('utf-8'))
+
+    if json.dumps(memo, sort_keys=True) != old_memo:
+        os.makedirs(root, exist_ok=True)
+        tmp_path = f'{memo_path}.tmp-{uuid.uuid4().hex[:8]}'
+        with open(tmp_path, 'w') as f:
+            json.dump(memo, f)
+        os.replace(tmp_path, memo_path)
+    return digest.hexdigest()[:16]
+
+
+def _cached_versions(root):
+    if not os.path.isdir(root):
+        return []
+    return [d for d in os.listdir(root) if os.path.exists(os.path.join(root, d, COLUMNS_META))]
+
+
+def load_columns(ann_prefix, build_fn=None, sources=(), params=None):
+    ''' Open the columnar annotations of a dataset split, building them if they are out of date.
+
+    Each version is stored as `<ann_prefix>_columns/<key>/` with `key` from
+    `cache_key`, the other versions are removed after a rebuild.
+
+    Parameters
+    ----------
+    ann_prefix: str
+        Annotation file without extension.
+    build_fn: callable, optional
+        Returns the annotation dict. Without it, the legacy `<ann_prefix>.pt`
+        joblib file is converted and should be listed in `sources`. With it,
+        a legacy .pt file is ignored: nothing records which sources and
+        settings it was built from.
+    sources: list, optional
+        Annotation files the cache is built from.
+    params: dict, optional
+        Settings of `build_fn` that change its output.
+
+    Returns
+    -------
+    store: ColumnStore
+    '''
+    root = columns_dir_of(ann_prefix)
+    key = cache_key(root, sources, params)
+    store_dir = os.path.join(root, key)
+    if os.path.exists(os.path.join(store_dir, COLUMNS_META)):
+        return ColumnStore(store_dir)
+
+    stale = _cached_versions(root)
+    if build_fn is None:
+        import joblib
+        assert os.path.exists(ann_prefix + '.pt'), f'Annotation file {ann_prefix}.pt does not exist!'
+        print(f'Converting {ann_prefix}.pt to {store_dir}...')
+        db = joblib.load(ann_prefix + '.pt')
+    else:
+        print(f'Building {store_dir}...')
+        db = build_fn()
+    save_columns(db, store_dir)
+    del db
+
+    # readers of an old version keep their mappings until they exit
+    for version in stale:
+        if version != key:
+            shutil.rmtree(os.path.join(root, version), ignore_errors=True)
+
+    return ColumnStore(store_dir)
+
+
+def stack_labels(items, labels):
+    ''' Stack per-sample labels into arrays, `items` become the `img_path` column. '''
+    db = {}
+    for k in labels[0].keys():
+        db[k] = np.stack([np.array(obj[k]) for obj in labels])
+    db['img_path'] = np.array(items)
+    return db
+
+
+_PARSE_JOB = None
+
+
+def _parse_span(span):
+    parse_fn, records = _PARSE_JOB
+    items, labels = [], []
+    for record in records[span[0]:span[1]]:
+        for item, label in parse_fn(record):
+            items.append(item)
+            labels.append(label)
+    return len(labels), (stack_labels(items, labels) if labels else None)
+
+
+def build_columns(parse_fn, records, workers=1, initializer=None):
+    ''' Parse annotation records into stacked columns, in parallel worker processes.
+
+    Workers are forked and inherit `parse_fn` and `records`, only index
+    ranges are sent to them and each returns its samples already stacked.
+
+    Parameters
+    ----------
+    parse_fn: callable
+        Maps a record to a list of (img_path, label dict) samples.
+    records: list
+        Raw annotation records.
+    workers: int, optional
+        Number of processes, parse in this process if 1.
+    initializer: callable, optional
+        Called once in every worker.
+
+    Returns
+    -------
+    db: dict
+        Stacked labels of all samples in record order.
+    '''
+    global _PARSE_JOB
+    _PARSE_JOB = (parse_fn, records)
+
+    num_spans = 1 if workers <= 1 else workers * 8
+    span_size = max(int(math.ceil(len(records) / num_spans)), 1)
+    spans = [(i, i + span_size) for i in range(0, len(records), span_size)]
+
+    try:
+        if workers <= 1:
+            chunks = [_parse_span(span) for span in tqdm(spans, dynamic_ncols=True)]
+        else:
+            with mp.get_context('fork').Pool(workers, initializer=initializer) as pool:
+                chunks = list(tqdm(pool.imap(_parse_span, spans), total=len(spans), dynamic_ncols=True))
+    finally:
+        _PARSE_JOB = None
+
+    chunks = [chunk for num_samples, chunk in chunks if num_samples > 0]
+    assert chunks, 'No valid samples in the annotations'
+    return {k: np.concatenate([chunk[k] for chunk in chunks]) for k in chunks[0].keys()}
+
+
+class StringColumn(object):
+    ''' Read-only string array backed by a utf-8 blob and offsets. '''
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        # np.str_ like the unicode arrays of the joblib databases, it has .copy()
+        return np.str_(self.data[start:end].tobytes().decode('utf-8'))
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+
+class ColumnStore(object):
+    ''' Dict-like view of the annotations written by `save_columns`.
+
+    Each key is memory-mapped on first access, so DataLoader workers share
+    the pages through the OS page cache instead of holding private copies.
+    Pickling (spawned workers) only carries the directory, the receiving
+    process maps the files again.
+
+    Parameters
+    ----------
+    store_dir: str
+        Directory written by `save_columns`.
+    '''
+
+    def __init__(self, store_dir):
+        meta_path = os.path.join(store_dir, COLUMNS_META)
+        assert os.path.exists(meta_path), f'Annotation store {meta_path} does not exist!'
+        self.store_dir = store_dir
+
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        self.num_samples = meta['num_samples']
+        self._keys = meta['keys']
+        self._kinds = meta['kinds']
+        self._columns = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_columns'] = {}
+        return state
+
+    def _open(self, k):
+        path = os.path.join(self.store_dir, k)
+        kind = self._kinds[k]
+        if kind == 'str':
+            return StringColumn(
+                np.load(path + '.str.npy', mmap_mode='r').view(np.ndarray),
+                np.load(path + '.off.npy', mmap_mode='r').view(np.ndarray))
+        elif kind == 'object':
+            return np.load(path + '.npy', allow_pickle=True)
+        # plain ndarray views index faster than np.memmap
+        return np.load(path + '.npy', mmap_mode='r').view(np.ndarray)
+
+    def __getitem__(self, k):
+        if k not in self._columns:
+            if k not in self._kinds:
+                raise KeyError(k)
+            self._columns[k] = self._open(k)
+        return self._columns[k]
+
+    def __contains__(self, k):
+        return k in self._kinds
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def keys(self):
+        return list(self._keys)
+
+    def items(self):
+        return [(k, self[k]) for k in self._keys]
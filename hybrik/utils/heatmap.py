@@ -0,0 +1,84 @@
+import torch
+from torch.nn import functional as F
+
+
+def _flip_heatmap_logits(logits, flip_index, shift=True):
+    logits = logits[:, flip_index].flip(dims=(4,))
+    if shift:
+        logits = torch.cat((logits[..., :1], logits[..., :-1]), dim=4)
+    return logits
+
+
+def soft_argmax_3d(logits, flip_logits=None, flip_index=None, shift=True, chunk_size=None):
+    ''' Integral soft-argmax of 3D heatmap logits, computed a few joints at a time.
+
+    Equivalent to a global softmax over each joint volume followed by the
+    x / y / z marginals, but the normalized volume only ever exists for
+    `chunk_size` joints. With `flip_logits`, the flipped volumes are
+    re-ordered, mirrored and averaged with the originals chunk by chunk
+    as well, instead of building a flipped copy of the whole tensor.
+
+    Parameters
+    ----------
+    logits: torch.tensor BxKxDxHxW
+        Raw heatmap logits.
+    flip_logits: torch.tensor BxKxDxHxW, optional
+        Logits of the horizontally flipped image, before flipping back.
+    flip_index: torch.tensor K, optional
+        Left/right joint permutation applied to `flip_logits`.
+    shift: bool, optional
+        Shift the flipped volumes by one pixel along W.
+    chunk_size: int, optional
+        Number of joints normalized at once. All joints if None.
+
+    Returns
+    -------
+    coord: torch.tensor BxKx3
+        Normalized uvd in -0.5 ~ 0.5.
+    maxvals: torch.tensor BxKx1
+        Peak value of each normalized volume.
+    '''
+    batch_size, num_joints, depth_dim, height_dim, width_dim = logits.shape
+    if chunk_size is None or chunk_size <= 0:
+        chunk_size = num_joints
+
+    hm_x0, hm_y0, hm_z0, maxvals = [], [], [], []
+    for start in range(0, num_joints, chunk_size):
+        end = min(start + chunk_size, num_joints)
+        heatmaps = F.softmax(logits[:, start:end].reshape(batch_size, end - start, -1), dim=2)
+
+        if flip_logits is not None:
+            flip_chunk = _flip_heatmap_logits(flip_logits, flip_index[start:end], shift)
+            flip_heatmaps = F.softmax(flip_chunk.reshape(batch_size, end - start, -1), dim=2)
+            heatmaps = (heatmaps + flip_heatmaps) / 2
+
+        maxvals.append(heatmaps.max(dim=2, keepdim=True)[0])
+
+        heatmaps = heatmaps.reshape(batch_size, end - start, depth_dim, height_dim, width_dim)
+        hm_z0.append(heatmaps.sum((3, 4)))  # (B, k, D)
+        hm_xy = heatmaps.sum(2)             # (B, k, H, W)
+        hm_x0.append(hm_xy.sum(2))          # (B, k, W)
+        hm_y0.append(hm_xy.sum(3))          # (B, k, H)
+
+    hm_x0 = torch.cat(hm_x0, dim=1)
+    hm_y0 = torch.cat(hm_y0, dim=1)
+    hm_z0 = torch.cat(hm_z0, dim=1)
+    maxvals = torch.cat(maxvals, dim=1)
+
+    coord_x = hm_x0.matmul(torch.arange(width_dim, dtype=hm_x0.dtype, device=hm_x0.device).unsqueeze(-1))
+    coord_y = hm_y0.matmul(torch.arange(height_dim, dtype=hm_y0.dtype, device=hm_y0.device).unsqueeze(-1))
+    coord_z = hm_z0.matmul(torch.arange(depth_dim, dtype=hm_z0.dtype, device=hm_z0.device).unsqueeze(-1))
+
+    coord_x = coord_x / float(width_dim) - 0.5
+    coord_y = coord_y / float(height_dim) - 0.5
+    coord_z = coord_z / float(depth_dim) - 0.5
+
+    return torch.cat((coord_x, coord_y, coord_z), dim=2), maxvals
+
+
+def flip_index_from_pairs(num_joints, joint_pairs):
+    ''' Left/right joint permutation as an index tensor. '''
+    flip_index = list(range(num_joints))
+    for dim0, dim1 in joint_pairs:
+        flip_index[dim0], flip_index[dim1] = dim1, dim0
+    return torch.tensor(flip_index, dtype=torch.long)
@@ -0,0 +1,74 @@
+from collections import namedtuple
+
+KinematicTree = namedtuple('KinematicTree',
+                           ['parents', 'children', 'idx_levs', 'leaf_lev',
+                            'rigid_levs', 'pelvis_child', 'spine_child'])
+
+
+def build_kinematic_tree(parents, children, num_body_joints=24):
+    """
+    Precomputes the topology of a kinematic tree as plain python ints
+
+    Parameters
+    ----------
+    parents : sequence of int, J
+        The kinematic tree of each object
+    children : sequence of int, J
+        The kinematic children of each joint, -1 for leaf joints and
+        -3 for joints with three children
+    num_body_joints : int, optional
+        The number of joints posed by `batch_rigid_transform`
+
+    Returns
+    -------
+    kintree: KinematicTree
+        parents, children: tuple of int
+        idx_levs: list of ``(indices, parent_indices, child_indices)``,
+            one per tree depth, covering every non-root joint that has a
+            child. A joint only depends on joints of earlier levels. Joints
+            with three children get a level of their own with
+            ``child_indices == [-3]``.
+        leaf_lev: ``(indices, parent_indices)`` of the leaf joints.
+        rigid_levs: list of ``(indices, parent_indices)``, one per tree
+            depth, covering the first `num_body_joints` joints.
+        pelvis_child: the children of the root, ``children[0]`` first.
+        spine_child: dict from each joint with three children to its
+            children.
+    """
+    parents = tuple(int(p) for p in parents)
+    children = tuple(int(c) for c in children)
+    num_joints = len(parents)
+
+    depth = [0] * num_joints
+    for i in range(1, num_joints):
+        assert parents[i] < i, 'parents must be topologically sorted'
+        depth[i] = depth[parents[i]] + 1
+
+    idx_levs = []
+    rigid_levs = []
+    for d in range(1, max(depth) + 1):
+        indices = [i for i in range(1, num_joints) if depth[i] == d and children[i] >= 0]
+        if len(indices) > 0:
+            idx_levs.append((indices, [parents[i] for i in indices], [children[i] for i in indices]))
+        for i in range(1, num_joints):
+            if depth[i] == d and children[i] == -3:
+                idx_levs.append(([i], [parents[i]], [-3]))
+
+        indices = [i for i in range(1, min(num_joints, num_body_joints)) if depth[i] == d]
+        if len(indices) > 0:
+            rigid_levs.append((indices, [parents[i] for i in indices]))
+
+    leaf_indices = [i for i in range(1, num_joints) if children[i] == -1]
+    leaf_lev = (leaf_indices, [parents[i] for i in leaf_indices])
+
+    pelvis_child = [children[0]] + [
+        i for i in range(1, num_joints) if parents[i] == 0 and i != children[0]]
+
+    spine_child = {
+        i: [c for c in range(1, num_joints) if parents[c] == i]
+        for i in range(num_joints) if children[i] == -3}
+
+    return KinematicTree(
+        parents=parents, children=children,
+        idx_levs=idx_levs, leaf_lev=leaf_lev, rigid_levs=rigid_levs,
+        pelvis_child=pelvis_child, spine_child=spine_child)
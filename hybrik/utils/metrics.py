@@ -1,5 +1,7 @@
 import numpy as np
 
+from .pose_utils import reconstruction_error
+
 
 class NullWriter(object):
     def write(self, arg):
@@ -31,6 +33,39 @@ class DataLogger(object):
         self.avg = self.sum / self.cnt
 
 
+class PrecisionParity(object):
+    """MPJPE / PA-MPJPE (mm) of predictions against a reference run of the same model.
+
+    Joints are in units of `depth_factor` meters, like the xyz outputs of the models.
+    """
+
+    def __init__(self, root_idx=0, depth_factor=1.0):
+        self.root_idx = root_idx
+        self.depth_factor = depth_factor
+        self.mpjpe = DataLogger()
+        self.pa_mpjpe = DataLogger()
+
+    def update(self, pred_jts, ref_jts):
+        # restore coordinates to meters
+        pred_jts = pred_jts * self.depth_factor
+        ref_jts = ref_jts * self.depth_factor
+        pred_jts = pred_jts - pred_jts[:, [self.root_idx]]
+        ref_jts = ref_jts - ref_jts[:, [self.root_idx]]
+        pred_jts_pa = reconstruction_error(pred_jts.copy(), ref_jts.copy())
+
+        n = pred_jts.shape[0]
+        self.mpjpe.update(np.mean(np.sqrt(np.sum((pred_jts - ref_jts) ** 2, 2))) * 1000, n)
+        self.pa_mpjpe.update(np.mean(np.sqrt(np.sum((pred_jts_pa - ref_jts) ** 2, 2))) * 1000, n)
+
+    def state(self):
+        return [self.mpjpe.sum, self.pa_mpjpe.sum, self.mpjpe.cnt]
+
+    def summary(self, state=None):
+        mpjpe_sum, pa_mpjpe_sum, cnt = self.state() if state is None else state
+        cnt = max(cnt, 1)
+        return f'MPJPE delta: {mpjpe_sum / cnt:.3f} mm | PA-MPJPE delta: {pa_mpjpe_sum / cnt:.3f} mm ({int(cnt)} samples)'
+
+
 def calc_coord_accuracy(pred_jts, labels, label_masks, hm_shape, norm='softmax', num_joints=None, root_idx=None):
     """Calculate integral coordinates accuracy."""
     coords = pred_jts.detach().cpu().numpy()
@@ -0,0 +1,176 @@
+import numpy as np
+
+from .smpl_numpy import SMPLNumpy
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+
+def bbox_center_offset(bboxes, img_center):
+    ''' NumPy version of `hybrik.utils.camera.bbox_center_offset`, Bx1x2. '''
+    wh = bboxes[:, 2:] - bboxes[:, :2]
+    center = (bboxes[:, :2] + bboxes[:, 2:]) * 0.5
+    return ((center - img_center) / wh)[:, None, :]
+
+
+def back_project_uvd(pred_uvd, cam_depth, focal_length, input_size, depth_factor, bbox_center=None):
+    ''' NumPy version of `hybrik.utils.camera.back_project_uvd`. '''
+    pred_uv = pred_uvd[:, :, :2]
+    if bbox_center is not None:
+        pred_uv = pred_uv + bbox_center
+
+    pred_z = pred_uvd[:, :, 2:]
+    pred_xy = (pred_uv * input_size / focal_length) * (pred_z * depth_factor + cam_depth)  # unit: m
+
+    return np.concatenate((pred_xy / depth_factor, pred_z), axis=2)
+
+
+def solve_camera_scale(pred_uv, pred_xyz, weight, init_scale, focal_length, input_size, eps=1e-9):
+    ''' NumPy version of `hybrik.utils.camera.solve_camera_scale`. '''
+    A = pred_uv * weight
+    b = (pred_xyz[:, :, :2] - input_size / focal_length * pred_uv * pred_xyz[:, :, 2:]) * weight
+
+    num = (A * b).sum(axis=(1, 2))
+    denom = (A * A).sum(axis=(1, 2))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        res = num / np.maximum(denom, eps)
+    valid = (denom > eps) & np.isfinite(res) & (res > 0)
+
+    scale = np.where(valid, 1.0 / np.where(valid, res, 1.0), init_scale.reshape(-1))
+
+    return scale.reshape(init_scale.shape).astype(init_scale.dtype)
+
+
+class HybrIKOnnx(object):
+    ''' HybrIK inference with ONNX Runtime and NumPy, without PyTorch.
+
+    Runs the graph written by `hybrik.models.export.export_onnx`, then the
+    camera refinement and the SMPL kinematics of `HRNetSMPLCam.forward` in
+    NumPy. The outputs match `hybrik.models.export.EXPORT_OUTPUTS`.
+
+    Parameters
+    ----------
+    onnx_path: str
+        The network graph.
+    kinematics_path: str
+        The .npz file saved next to it.
+    providers: list, optional
+        ONNX Runtime execution providers.
+    num_threads: int, optional
+        Intra-op threads of the session, ONNX Runtime's default if None.
+    '''
+
+    def __init__(self, onnx_path, kinematics_path, providers=('CPUExecutionProvider',), num_threads=None):
+        if ort is None:
+            raise ImportError('onnxruntime is required, pip install onnxruntime')
+
+        options = ort.SessionOptions()
+        if num_threads is not None:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(onnx_path, sess_options=options, providers=list(providers))
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_names = [o.name for o in self.session.get_outputs()]
+
+        self.smpl = SMPLNumpy.load(kinematics_path)
+        with np.load(kinematics_path) as data:
+            self.focal_length = float(data['focal_length'])
+            self.input_size = float(data['input_size'])
+            self.depth_factor = float(data['depth_factor'])
+            self.flip_test = bool(data['flip_test'])
+
+    def run_network(self, img):
+        outputs = self.session.run(self.output_names, {self.input_name: np.ascontiguousarray(img, dtype=np.float32)})
+        return dict(zip(self.output_names, outputs))
+
+    def update_scale(self, pred_uvd, weight, init_scale, pred_shape, pred_phi, bboxes=None, img_center=None):
+        cam_depth = self.focal_length / (self.input_size * init_scale + 1e-9)
+
+        bbox_center = None
+        if bboxes is not None:
+            bbox_center = bbox_center_offset(bboxes, img_center)
+
+        pred_xyz = back_project_uvd(
+            pred_uvd, cam_depth, self.focal_length, self.input_size, self.depth_factor, bbox_center)
+
+        # unit: m
+        camera_root = pred_xyz[:, [0], :] * self.depth_factor
+
+        joints = self.smpl.hybrik(
+            (pred_xyz - pred_xyz[:, [0]]) * self.depth_factor, pred_shape, pred_phi,
+            return_verts=False, naive=True)['joints'][:, :24]
+        joints = joints - joints[:, [0], :] + camera_root
+
+        pred_uv = pred_uvd[:, :24, :2]
+        if bbox_center is not None:
+            pred_uv = pred_uv + bbox_center
+
+        return solve_camera_scale(
+            pred_uv, joints, weight[:, :24], init_scale, self.focal_length, self.input_size)
+
+    def __call__(self, img, bboxes=None, img_center=None):
+        ''' Run the full pipeline.
+
+            Parameters
+            ----------
+            img: np.ndarray Bx3xHxW
+                Normalized crops, as fed to the PyTorch model.
+            bboxes: np.ndarray Bx4, optional
+                Boxes in (x1, y1, x2, y2) format.
+            img_center: np.ndarray Bx2, optional
+                Image centers, required with `bboxes`.
+
+            Returns
+            -------
+            output: dict
+        '''
+        net = self.run_network(img)
+        pred_uvd_jts_29 = net['pred_uvd_jts_29']
+        pred_shape = net['pred_shape']
+        pred_phi = net['pred_phi']
+        pred_camera = net['pred_camera']
+        sigma = net['pred_sigma']
+        batch_size = pred_uvd_jts_29.shape[0]
+
+        if bboxes is not None:
+            bboxes = np.asarray(bboxes, dtype=np.float32)
+            img_center = np.asarray(img_center, dtype=np.float32)
+
+        weight = np.clip(1 - sigma * 10, 0, None)
+        cam_scale = self.update_scale(
+            pred_uvd_jts_29, weight, pred_camera[:, :1, None], pred_shape, pred_phi,
+            bboxes=bboxes, img_center=img_center)
+        cam_depth = self.focal_length / (self.input_size * cam_scale + 1e-9)
+
+        bbox_center = None
+        if bboxes is not None:
+            bbox_center = bbox_center_offset(bboxes, img_center)
+        pred_xyz_jts_29 = back_project_uvd(
+            pred_uvd_jts_29, cam_depth, self.focal_length, self.input_size, self.depth_factor, bbox_center)
+
+        camera_root = pred_xyz_jts_29[:, 0, :] * self.depth_factor
+        camera_root[:, 2] += cam_depth[:, 0, 0]
+
+        pred_xyz_jts_29 = pred_xyz_jts_29 - pred_xyz_jts_29[:, [0]]
+
+        output = self.smpl.hybrik(pred_xyz_jts_29 * self.depth_factor, pred_shape, pred_phi, return_verts=True)
+        joints = output['joints']
+
+        return dict(
+            pred_uvd_jts=pred_uvd_jts_29.reshape(batch_size, -1),
+            pred_xyz_jts_29=pred_xyz_jts_29.reshape(batch_size, -1),
+            pred_xyz_jts_24_struct=(joints / self.depth_factor).reshape(batch_size, 72),
+            pred_xyz_jts_17=(output['joints_from_verts'] / self.depth_factor).reshape(batch_size, 17 * 3),
+            pred_vertices=output['vertices'],
+            pred_theta_mats=output['rot_mats'].reshape(batch_size, 24 * 9),
+            pred_shape=pred_shape,
+            pred_phi=pred_phi,
+            pred_camera=pred_camera,
+            cam_scale=cam_scale[:, 0],
+            cam_root=camera_root,
+            transl=camera_root - joints[:, 0, :],
+            maxvals=net['maxvals'],
+            pred_sigma=sigma,
+        )
@@ -0,0 +1,42 @@
+import contextlib
+
+import torch
+
+AMP_DTYPES = {
+    'fp16': torch.float16,
+    'bf16': torch.bfloat16,
+}
+
+
+def get_amp_dtype(name):
+    ''' Map a precision name to the autocast dtype.
+
+    The models keep the result as `amp_dtype`, the autocast dtype of their
+    backbone; the kinematics always run in fp32, see `backbone_autocast`.
+
+    Parameters
+    ----------
+    name: str or None
+        'fp16' or 'bf16'. None, 'fp32' and 'none' disable mixed precision.
+
+    Returns
+    -------
+    dtype: torch.dtype or None
+    '''
+    if name is None or name in ('fp32', 'none'):
+        return None
+    if name not in AMP_DTYPES:
+        raise ValueError(f'Unknown precision {name}, expected one of fp32, {", ".join(AMP_DTYPES)}')
+    return AMP_DTYPES[name]
+
+
+def backbone_autocast(device, dtype):
+    ''' Autocast context for the backbone and heatmap head.
+
+    Everything after the backbone (soft-argmax, camera refinement and the
+    SMPL kinematics) runs outside of it in fp32. A no-op when `dtype` is None.
+    Use bf16 on CPU, older torch releases only autocast bf16 there.
+    '''
+    if dtype is None:
+        return contextlib.nullcontext()
+    return torch.autocast(device_type=device.type, dtype=dtype)
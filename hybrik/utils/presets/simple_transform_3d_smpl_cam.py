@@ -5,8 +5,9 @@ import cv2
 import numpy as np
 import torch
 
+from ..batch_augment import light_crop
 from ..bbox import _box_to_center_scale, _center_scale_to_box
-from ..transforms import (addDPG, affine_transform, flip_joints_3d, flip_thetas, flip_xyz_joints_3d,
+from ..transforms import (addDPG, affine_transform_joints_3d, flip_joints_3d, flip_thetas, flip_xyz_joints_3d,
                           get_affine_transform, im_to_torch, batch_rodrigues_numpy, flip_twist,
                           rotate_xyz_jts, rot_aa, flip_cam_xyz_joints_3d)
 from ..pose_utils import get_intrinsic_metrix
@@ -100,12 +101,15 @@ class SimpleTransform3DSMPLCam(object):
         Ratation augmentation.
     train: bool
         True for training trasformation.
+    gpu_augment: bool
+        Output uint8 light crops and leave occlusion, rotation, flipping of the
+        pixels and color jitter to `batch_augment` on the training device.
     """
 
     def __init__(self, dataset, scale_factor, color_factor, occlusion, add_dpg,
                  input_size, output_size, depth_dim, bbox_3d_shape,
                  rot, sigma, train, loss_type='MSELoss', scale_mult=1.25, focal_length=1000, two_d=False,
-                 root_idx=0):
+                 root_idx=0, gpu_augment=False):
         if two_d:
             self._joint_pairs = dataset.joint_pairs
         else:
@@ -124,6 +128,7 @@ class SimpleTransform3DSMPLCam(object):
 
         self._sigma = sigma
         self._train = train
+        self._gpu_augment = gpu_augment and train
         self._loss_type = loss_type
         self._aspect_ratio = float(input_size[1]) / input_size[0]  # w / h
         self._feat_stride = np.array(input_size) / np.array(output_size)
@@ -175,15 +180,12 @@ class SimpleTransform3DSMPLCam(object):
         return img, bbox, img_center
 
     def _integral_target_generator(self, joints_3d, num_joints, patch_height, patch_width):
-        target_weight = np.ones((num_joints, 3), dtype=np.float32)
-        target_weight[:, 0] = joints_3d[:, 0, 1]
-        target_weight[:, 1] = joints_3d[:, 0, 1]
-        target_weight[:, 2] = joints_3d[:, 0, 1]
+        target_weight = np.repeat(joints_3d[:num_joints, :1, 1], 3, axis=1).astype(np.float32)
 
-        target = np.zeros((num_joints, 3), dtype=np.float32)
-        target[:, 0] = joints_3d[:, 0, 0] / patch_width - 0.5
-        target[:, 1] = joints_3d[:, 1, 0] / patch_height - 0.5
-        target[:, 2] = joints_3d[:, 2, 0] / self.bbox_3d_shape[0]
+        # same per-column arithmetic (and dtype) as dividing by the python scalars
+        norm = np.array([patch_width, patch_height, self.bbox_3d_shape[0]], dtype=joints_3d.dtype)
+        shift = np.array([0.5, 0.5, 0], dtype=joints_3d.dtype)
+        target = (joints_3d[:num_joints, :, 0] / norm - shift).astype(np.float32)
 
         # target_weight[target[:, 0] > 0.5] = 0
         # target_weight[target[:, 0] < -0.5] = 0
@@ -198,15 +200,12 @@ class SimpleTransform3DSMPLCam(object):
 
     def _integral_uvd_target_generator(self, joints_3d, num_joints, patch_height, patch_width):
 
-        target_weight = np.ones((num_joints, 3), dtype=np.float32)
-        target_weight[:, 0] = joints_3d[:, 0, 1]
-        target_weight[:, 1] = joints_3d[:, 0, 1]
-        target_weight[:, 2] = joints_3d[:, 0, 1]
+        target_weight = np.repeat(joints_3d[:num_joints, :1, 1], 3, axis=1).astype(np.float32)
 
-        target = np.zeros((num_joints, 3), dtype=np.float32)
-        target[:, 0] = joints_3d[:, 0, 0] / patch_width - 0.5
-        target[:, 1] = joints_3d[:, 1, 0] / patch_height - 0.5
-        target[:, 2] = joints_3d[:, 2, 0] / self.bbox_3d_shape[2]
+        # same per-column arithmetic (and dtype) as dividing by the python scalars
+        norm = np.array([patch_width, patch_height, self.bbox_3d_shape[2]], dtype=joints_3d.dtype)
+        shift = np.array([0.5, 0.5, 0], dtype=joints_3d.dtype)
+        target = (joints_3d[:num_joints, :, 0] / norm - shift).astype(np.float32)
 
         # target_weight[target[:, 0] > 0.5] = 0
         # target_weight[target[:, 0] < -0.5] = 0
@@ -220,15 +219,10 @@ class SimpleTransform3DSMPLCam(object):
         return target, target_weight
 
     def _integral_xyz_target_generator(self, joints_3d, joints_3d_vis, num_joints):
-        target_weight = np.ones((num_joints, 3), dtype=np.float32)
-        target_weight[:, 0] = joints_3d_vis[:, 0]
-        target_weight[:, 1] = joints_3d_vis[:, 1]
-        target_weight[:, 2] = joints_3d_vis[:, 2]
+        target_weight = joints_3d_vis[:num_joints, :3].astype(np.float32)
 
-        target = np.zeros((num_joints, 3), dtype=np.float32)
-        target[:, 0] = joints_3d[:, 0] / self.bbox_3d_shape[0]
-        target[:, 1] = joints_3d[:, 1] / self.bbox_3d_shape[1]
-        target[:, 2] = joints_3d[:, 2] / self.bbox_3d_shape[2]
+        norm = np.array(self.bbox_3d_shape[:3], dtype=joints_3d.dtype)
+        target = (joints_3d[:num_joints, :3] / norm).astype(np.float32)
 
         # if self.bbox_3d_shape[0] < 1000:
         #     print(self.bbox_3d_shape, target)
@@ -289,6 +283,7 @@ class SimpleTransform3DSMPLCam(object):
             else:
                 r = 0
 
+            occlusion = None
             if self._train and self._occlusion:
                 while True:
                     area_min = 0.0
@@ -309,18 +304,24 @@ class SimpleTransform3DSMPLCam(object):
                         synth_ymin = int(synth_ymin)
                         synth_w = int(synth_w)
                         synth_h = int(synth_h)
-                        src[synth_ymin:synth_ymin + synth_h, synth_xmin:synth_xmin + synth_w, :] = np.random.rand(synth_h, synth_w, 3) * 255
+                        if self._gpu_augment:
+                            occlusion = [synth_xmin, synth_ymin, synth_xmin + synth_w, synth_ymin + synth_h]
+                        else:
+                            src[synth_ymin:synth_ymin + synth_h, synth_xmin:synth_xmin + synth_w, :] = np.random.rand(synth_h, synth_w, 3) * 255
                         break
             
             joint_cam = joint_cam.reshape(-1 , 3)
             joints_xyz = joint_cam - joint_cam[[self.root_idx]].copy() # the root index of mpii_3d is 4 !!!
 
             joints = gt_joints
+            flipped = False
             if random.random() > 0.5 and self._train:
                 # src, fliped = random_flip_image(src, px=0.5, py=0)
                 # if fliped[0]:
                 assert src.shape[2] == 3
-                src = src[:, ::-1, :]
+                flipped = True
+                if not self._gpu_augment:
+                    src = src[:, ::-1, :]
 
                 joints = flip_joints_3d(joints, imgwidth, self._joint_pairs)
                 joints_xyz = flip_xyz_joints_3d(joints_xyz, self._joint_pairs)
@@ -330,12 +331,13 @@ class SimpleTransform3DSMPLCam(object):
 
             inp_h, inp_w = input_size
             trans = get_affine_transform(center, scale, r, [inp_w, inp_h])
-            img = cv2.warpAffine(src, trans, (int(inp_w), int(inp_h)), flags=cv2.INTER_LINEAR)
+            if self._gpu_augment:
+                img, gpu_aug = light_crop(src, trans, input_size, flipped, occlusion)
+            else:
+                img = cv2.warpAffine(src, trans, (int(inp_w), int(inp_h)), flags=cv2.INTER_LINEAR)
 
             # deal with joints visibility
-            for i in range(self.num_joints):
-                if joints[i, 0, 1] > 0.0:
-                    joints[i, 0:2, 0] = affine_transform(joints[i, 0:2, 0], trans)
+            affine_transform_joints_3d(joints, trans)
 
             trans_inv = get_affine_transform(center, scale, r, [inp_w, inp_h], inv=True).astype(np.float32)
             intrinsic_param = get_intrinsic_metrix(label['f'], label['c'], inv=True).astype(np.float32) if 'f' in label.keys() else np.zeros((3, 3)).astype(np.float32)
@@ -427,6 +429,7 @@ class SimpleTransform3DSMPLCam(object):
             else:
                 r = 0
 
+            occlusion = None
             if self._train and self._occlusion:
                 while True:
                     area_min = 0.0
@@ -447,7 +450,10 @@ class SimpleTransform3DSMPLCam(object):
                         synth_ymin = int(synth_ymin)
                         synth_w = int(synth_w)
                         synth_h = int(synth_h)
-                        src[synth_ymin:synth_ymin + synth_h, synth_xmin:synth_xmin + synth_w, :] = np.random.rand(synth_h, synth_w, 3) * 255
+                        if self._gpu_augment:
+                            occlusion = [synth_xmin, synth_ymin, synth_xmin + synth_w, synth_ymin + synth_h]
+                        else:
+                            src[synth_ymin:synth_ymin + synth_h, synth_xmin:synth_xmin + synth_w, :] = np.random.rand(synth_h, synth_w, 3) * 255
                         break
 
             joints_17_uvd = gt_joints_17
@@ -456,9 +462,12 @@ class SimpleTransform3DSMPLCam(object):
             joint_cam_17_xyz = joint_cam_17
             joints_cam_24_xyz = joint_cam_29[:24]
 
+            flipped = False
             if random.random() > 0.75 and self._train:
                 assert src.shape[2] == 3
-                src = src[:, ::-1, :]
+                flipped = True
+                if not self._gpu_augment:
+                    src = src[:, ::-1, :]
 
                 joints_17_uvd = flip_joints_3d(joints_17_uvd, imgwidth, self._joint_pairs_17)
                 joints_29_uvd = flip_joints_3d(joints_29_uvd, imgwidth, self._joint_pairs_29)
@@ -487,16 +496,14 @@ class SimpleTransform3DSMPLCam(object):
             joint_root = label['root_cam'].astype(np.float32) if 'root_cam' in label.keys() else np.zeros((3)).astype(np.float32)
             depth_factor = np.array([self.bbox_3d_shape[2]]).astype(np.float32) if self.bbox_3d_shape else np.zeros((1)).astype(np.float32)
 
-            img = cv2.warpAffine(src, trans, (int(inp_w), int(inp_h)), flags=cv2.INTER_LINEAR)
+            if self._gpu_augment:
+                img, gpu_aug = light_crop(src, trans, input_size, flipped, occlusion)
+            else:
+                img = cv2.warpAffine(src, trans, (int(inp_w), int(inp_h)), flags=cv2.INTER_LINEAR)
             # affine transform
-            for i in range(17):
-                if joints_17_uvd[i, 0, 1] > 0.0:
-                    joints_17_uvd[i, 0:2, 0] = affine_transform(joints_17_uvd[i, 0:2, 0], trans)
+            affine_transform_joints_3d(joints_17_uvd, trans)
+            affine_transform_joints_3d(joints_29_uvd, trans)
 
-            for i in range(29):
-                if joints_29_uvd[i, 0, 1] > 0.0:
-                    joints_29_uvd[i, 0:2, 0] = affine_transform(joints_29_uvd[i, 0:2, 0], trans)
-            
             target_smpl_weight = torch.ones(1).float()
             # theta_24_weights = np.ones((24, 4))
             # theta_24_weights = theta_24_weights.reshape(24 * 4)
@@ -533,20 +540,26 @@ class SimpleTransform3DSMPLCam(object):
         if self._train:
             c_high = 1 + self._color_factor
             c_low = 1 - self._color_factor
-            img[:, :, 0] = np.clip(img[:, :, 0] * random.uniform(c_low, c_high), 0, 255)
-            img[:, :, 1] = np.clip(img[:, :, 1] * random.uniform(c_low, c_high), 0, 255)
-            img[:, :, 2] = np.clip(img[:, :, 2] * random.uniform(c_low, c_high), 0, 255)
+            if self._gpu_augment:
+                gpu_aug['color_factor'] = torch.Tensor([random.uniform(c_low, c_high) for _ in range(3)])
+            else:
+                img[:, :, 0] = np.clip(img[:, :, 0] * random.uniform(c_low, c_high), 0, 255)
+                img[:, :, 1] = np.clip(img[:, :, 1] * random.uniform(c_low, c_high), 0, 255)
+                img[:, :, 2] = np.clip(img[:, :, 2] * random.uniform(c_low, c_high), 0, 255)
 
-        img = im_to_torch(img)
-        # mean
-        img[0].add_(-0.406)
-        img[1].add_(-0.457)
-        img[2].add_(-0.480)
+        if self._gpu_augment:
+            img = torch.from_numpy(img.transpose(2, 0, 1).copy())
+        else:
+            img = im_to_torch(img)
+            # mean
+            img[0].add_(-0.406)
+            img[1].add_(-0.457)
+            img[2].add_(-0.480)
 
-        # std
-        img[0].div_(0.225)
-        img[1].div_(0.224)
-        img[2].div_(0.229)
+            # std
+            img[0].div_(0.225)
+            img[1].div_(0.224)
+            img[2].div_(0.229)
 
         img_center = np.array([float(imgwidth) * 0.5, float(imght) * 0.5])
 
@@ -602,6 +615,9 @@ class SimpleTransform3DSMPLCam(object):
                 'camera_error': cam_error,
                 'img_center': torch.from_numpy(img_center).float()
             }
+
+        if self._gpu_augment:
+            output.update(gpu_aug)
         return output
 
     def half_body_transform(self, joints, joints_vis):
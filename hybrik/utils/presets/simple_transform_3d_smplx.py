@@ -6,7 +6,7 @@ import numpy as np
 import torch
 
 from ..bbox import _box_to_center_scale, _center_scale_to_box
-from ..transforms import (addDPG, affine_transform, flip_joints_3d, flip_thetas,
+from ..transforms import (addDPG, affine_transform_joints_3d, flip_joints_3d, flip_thetas,
                           get_affine_transform, im_to_torch, batch_rodrigues_numpy, flip_twist,
                           rotmat_to_quat_numpy, rotate_xyz_jts, rot_aa, flip_cam_xyz_joints_3d)
 from ..pose_utils import get_intrinsic_metrix
@@ -251,16 +251,12 @@ class SimpleTransform3DSMPLX(object):
 
     def _integral_uvd_target_generator(self, joints_3d, patch_height, patch_width):
 
-        num_joints = len(joints_3d)
-        target_weight = np.ones((num_joints, 3), dtype=np.float32)
-        target_weight[:, 0] = joints_3d[:, 0, 1]
-        target_weight[:, 1] = joints_3d[:, 1, 1]
-        target_weight[:, 2] = joints_3d[:, 2, 1]
+        target_weight = joints_3d[:, :, 1].astype(np.float32)
 
-        target = np.zeros((num_joints, 3), dtype=np.float32)
-        target[:, 0] = joints_3d[:, 0, 0] / patch_width - 0.5
-        target[:, 1] = joints_3d[:, 1, 0] / patch_height - 0.5
-        target[:, 2] = joints_3d[:, 2, 0] / self.bbox_3d_shape[2]
+        # same per-column arithmetic (and dtype) as dividing by the python scalars
+        norm = np.array([patch_width, patch_height, self.bbox_3d_shape[2]], dtype=joints_3d.dtype)
+        shift = np.array([0.5, 0.5, 0], dtype=joints_3d.dtype)
+        target = (joints_3d[:, :, 0] / norm - shift).astype(np.float32)
 
         # target_weight[target[:, 0] > 0.5] = 0
         # target_weight[target[:, 0] < -0.5] = 0
@@ -274,16 +270,10 @@ class SimpleTransform3DSMPLX(object):
         return target, target_weight
 
     def _integral_xyz_target_generator(self, joints_3d, joints_3d_vis):
-        num_joints = len(joints_3d)
-        target_weight = np.ones((num_joints, 3), dtype=np.float32)
-        target_weight[:, 0] = joints_3d_vis[:, 0]
-        target_weight[:, 1] = joints_3d_vis[:, 1]
-        target_weight[:, 2] = joints_3d_vis[:, 2]
+        target_weight = joints_3d_vis[:, :3].astype(np.float32)
 
-        target = np.zeros((num_joints, 3), dtype=np.float32)
-        target[:, 0] = joints_3d[:, 0] / self.bbox_3d_shape[0]
-        target[:, 1] = joints_3d[:, 1] / self.bbox_3d_shape[1]
-        target[:, 2] = joints_3d[:, 2] / self.bbox_3d_shape[2]
+        norm = np.array(self.bbox_3d_shape[:3], dtype=joints_3d.dtype)
+        target = (joints_3d[:, :3] / norm).astype(np.float32)
 
         # if self.bbox_3d_shape[0] < 1000:
         #     print(self.bbox_3d_shape, target)
@@ -421,9 +411,7 @@ class SimpleTransform3DSMPLX(object):
 
         img = cv2.warpAffine(src, trans, (int(inp_w), int(inp_h)), flags=cv2.INTER_LINEAR)
         # affine transform
-        for i in range(len(joints_uvd)):
-            if joints_uvd[i, 0, 1] > 0.0:
-                joints_uvd[i, 0:2, 0] = affine_transform(joints_uvd[i, 0:2, 0], trans)
+        affine_transform_joints_3d(joints_uvd, trans)
 
         target_smpl_weight = torch.ones(1).float()
         theta_weights = np.ones(theta_quat.shape)
@@ -5,6 +5,7 @@ import cv2
 import numpy as np
 import torch
 
+from ..batch_augment import light_crop
 from ..bbox import _box_to_center_scale, _center_scale_to_box
 from ..transforms import (addDPG, affine_transform, flip_joints_3d,
                           get_affine_transform, im_to_torch)
@@ -42,11 +43,14 @@ class SimpleTransformCam(object):
         Ratation augmentation.
     train: bool
         True for training trasformation.
+    gpu_augment: bool
+        Output uint8 light crops and leave occlusion, rotation, flipping of the
+        pixels and color jitter to `batch_augment` on the training device.
     """
 
     def __init__(self, dataset, scale_factor, color_factor, occlusion, add_dpg,
                  input_size, output_size, rot, sigma,
-                 train, loss_type='MSELoss', dict_output=False, bbox_3d_shape=0):
+                 train, loss_type='MSELoss', dict_output=False, bbox_3d_shape=0, gpu_augment=False):
         self._joint_pairs = dataset.joint_pairs
         self._scale_factor = scale_factor
         self._color_factor = color_factor
@@ -59,6 +63,7 @@ class SimpleTransformCam(object):
 
         self._sigma = sigma
         self._train = train
+        self._gpu_augment = gpu_augment and train
         self._loss_type = loss_type
         self._aspect_ratio = float(input_size[1]) / input_size[0]  # w / h
         self._feat_stride = np.array(input_size) / np.array(output_size)
@@ -202,6 +207,7 @@ class SimpleTransformCam(object):
         else:
             r = 0
 
+        occlusion = None
         if self._train and self._occlusion and bbox is not None:
             while True:
                 area_min = 0.0
@@ -222,22 +228,31 @@ class SimpleTransformCam(object):
                     synth_ymin = int(synth_ymin)
                     synth_w = int(synth_w)
                     synth_h = int(synth_h)
-                    src[synth_ymin:synth_ymin + synth_h, synth_xmin:synth_xmin + synth_w, :] = np.random.rand(synth_h, synth_w, 3) * 255
+                    if self._gpu_augment:
+                        occlusion = [synth_xmin, synth_ymin, synth_xmin + synth_w, synth_ymin + synth_h]
+                    else:
+                        src[synth_ymin:synth_ymin + synth_h, synth_xmin:synth_xmin + synth_w, :] = np.random.rand(synth_h, synth_w, 3) * 255
                     break
 
         joints = gt_joints
+        flipped = False
         if random.random() > 0.5 and self._train:
             # src, fliped = random_flip_image(src, px=0.5, py=0)
             # if fliped[0]:
             assert src.shape[2] == 3
-            src = src[:, ::-1, :]
+            flipped = True
+            if not self._gpu_augment:
+                src = src[:, ::-1, :]
 
             joints = flip_joints_3d(joints, imgwidth, self._joint_pairs)
             center[0] = imgwidth - center[0] - 1
 
         inp_h, inp_w = input_size
         trans = get_affine_transform(center, scale, r, [inp_w, inp_h])
-        img = cv2.warpAffine(src, trans, (int(inp_w), int(inp_h)), flags=cv2.INTER_LINEAR)
+        if self._gpu_augment:
+            img, gpu_aug = light_crop(src, trans, input_size, flipped, occlusion)
+        else:
+            img = cv2.warpAffine(src, trans, (int(inp_w), int(inp_h)), flags=cv2.INTER_LINEAR)
 
         trans_inv = get_affine_transform(center, scale, r, [inp_w, inp_h], inv=True).astype(np.float32)
         intrinsic_param = np.zeros((3, 3)).astype(np.float32)
@@ -261,22 +276,28 @@ class SimpleTransformCam(object):
         if self._train:
             c_high = 1 + self._color_factor
             c_low = 1 - self._color_factor
-            img[:, :, 0] = np.clip(img[:, :, 0] * random.uniform(c_low, c_high), 0, 255)
-            img[:, :, 1] = np.clip(img[:, :, 1] * random.uniform(c_low, c_high), 0, 255)
-            img[:, :, 2] = np.clip(img[:, :, 2] * random.uniform(c_low, c_high), 0, 255)
+            if self._gpu_augment:
+                gpu_aug['color_factor'] = torch.Tensor([random.uniform(c_low, c_high) for _ in range(3)])
+            else:
+                img[:, :, 0] = np.clip(img[:, :, 0] * random.uniform(c_low, c_high), 0, 255)
+                img[:, :, 1] = np.clip(img[:, :, 1] * random.uniform(c_low, c_high), 0, 255)
+                img[:, :, 2] = np.clip(img[:, :, 2] * random.uniform(c_low, c_high), 0, 255)
 
         cam_scale, cam_trans = 1, np.zeros(2)
 
-        img = im_to_torch(img)
-        # mean
-        img[0].add_(-0.406)
-        img[1].add_(-0.457)
-        img[2].add_(-0.480)
+        if self._gpu_augment:
+            img = torch.from_numpy(img.transpose(2, 0, 1).copy())
+        else:
+            img = im_to_torch(img)
+            # mean
+            img[0].add_(-0.406)
+            img[1].add_(-0.457)
+            img[2].add_(-0.480)
 
-        # std
-        img[0].div_(0.225)
-        img[1].div_(0.224)
-        img[2].div_(0.229)
+            # std
+            img[0].div_(0.225)
+            img[1].div_(0.224)
+            img[2].div_(0.229)
 
         img_center = np.array([float(imgwidth) * 0.5, float(imght) * 0.5])
 
@@ -298,6 +319,8 @@ class SimpleTransformCam(object):
             'camera_error': 0.0
         }
 
+        if self._gpu_augment:
+            output.update(gpu_aug)
         return output
 
     def half_body_transform(self, joints, joints_vis):
@@ -0,0 +1,84 @@
+import torch
+
+try:
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+except ImportError:
+    get_default_qconfig_mapping = convert_fx = prepare_fx = None
+
+INT8_BACKENDS = ('x86', 'fbgemm', 'qnnpack')
+
+
+def _check_int8_support(model, backend):
+    if prepare_fx is None:
+        raise ImportError('INT8 quantization needs torch.ao.quantization (PyTorch >= 1.13)')
+    if backend not in INT8_BACKENDS:
+        raise ValueError(f'Unknown quantization backend {backend}, expected one of {", ".join(INT8_BACKENDS)}')
+    if not hasattr(model, 'preact'):
+        raise NotImplementedError(f'INT8 quantization is not supported for {type(model).__name__}')
+
+
+def prepare_backbone_int8(model, example_input, backend='x86'):
+    ''' Insert calibration observers into the backbone for post-training INT8 quantization.
+
+    Only `model.preact` is quantized, the regression heads, the soft-argmax
+    and the kinematics keep running in fp32 on its dequantized outputs.
+    The quantized kernels are CPU only, keep the model on CPU.
+
+    Parameters
+    ----------
+    model: torch.nn.Module
+        Model built by `builder.build_sppe`, in eval mode on CPU.
+    example_input: torch.tensor Bx3xHxW
+        Image batch used to trace the backbone.
+    backend: str, optional
+        'x86' or 'fbgemm' on x86 CPUs, 'qnnpack' on ARM.
+
+    Returns
+    -------
+    model: torch.nn.Module
+        The same model, run it on calibration images and pass it to
+        `convert_backbone_int8`.
+    '''
+    _check_int8_support(model, backend)
+    torch.backends.quantized.engine = backend
+
+    model.preact = prepare_fx(model.preact.eval(), get_default_qconfig_mapping(backend), (example_input,))
+    model.int8_backend = backend
+    return model
+
+
+def convert_backbone_int8(model):
+    ''' Replace the observed backbone by its INT8 version. '''
+    model.preact = convert_fx(model.preact)
+    return model
+
+
+def save_backbone_int8(model, path):
+    ''' Save a converted model with the quantization backend it was calibrated for. '''
+    torch.save({'model': model.state_dict(), 'int8_backend': model.int8_backend}, path)
+
+
+def load_backbone_int8(model, path, example_input):
+    ''' Load a model saved by `save_backbone_int8`.
+
+    Parameters
+    ----------
+    model: torch.nn.Module
+        Freshly built fp32 model of the same config.
+    path: str
+        The calibrated checkpoint.
+    example_input: torch.tensor Bx3xHxW
+        Image batch used to trace the backbone.
+
+    Returns
+    -------
+    model: torch.nn.Module
+    '''
+    save_dict = torch.load(path, map_location='cpu')
+
+    model.eval()
+    prepare_backbone_int8(model, example_input, backend=save_dict['int8_backend'])
+    convert_backbone_int8(model)
+    model.load_state_dict(save_dict['model'])
+    return model
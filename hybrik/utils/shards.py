@@ -0,0 +1,238 @@
+import math
+import os
+
+import cv2
+import numpy as np
+
+from .bbox import _box_to_center_scale
+
+SHARD_ENCODINGS = ('jpg', 'png', 'raw')
+
+
+def crop_box(bbox, img_w, img_h, aspect_ratio, scale_mult=1.25, scale_factor=0.3, pad=1.2):
+    ''' Image region a training transform can sample around a person box.
+
+    The region covers the transform crop enlarged by the largest scale jitter
+    and any rotation, times `pad` for the remaining jitter (half body, bbox shift).
+
+    Parameters
+    ----------
+    bbox: list
+        Person box in (x1, y1, x2, y2) format.
+    img_w: int
+        Image width.
+    img_h: int
+        Image height.
+    aspect_ratio: float
+        Input width / height of the transform.
+    scale_mult: float, optional
+        `scale_mult` of the transform.
+    scale_factor: float, optional
+        Scale jitter of the transform, `cfg.DATASET.SCALE_FACTOR`.
+    pad: float, optional
+        Extra margin.
+
+    Returns
+    -------
+    crop: list
+        (x0, y0, x1, y1) integer pixel region, clipped to the image.
+    '''
+    xmin, ymin, xmax, ymax = bbox
+    center, scale = _box_to_center_scale(
+        xmin, ymin, xmax - xmin, ymax - ymin, aspect_ratio, scale_mult=scale_mult)
+    radius = 0.5 * math.hypot(scale[0], scale[1]) * (1 + scale_factor) * pad
+
+    x0 = min(max(int(math.floor(center[0] - radius)), 0), img_w - 1)
+    y0 = min(max(int(math.floor(center[1] - radius)), 0), img_h - 1)
+    x1 = max(min(int(math.ceil(center[0] + radius)) + 1, img_w), x0 + 1)
+    y1 = max(min(int(math.ceil(center[1] + radius)) + 1, img_h), y0 + 1)
+    return [x0, y0, x1, y1]
+
+
+def shard_dir_of(ann_prefix):
+    ''' Shards of a dataset split live next to its annotation cache. '''
+    return ann_prefix + '_shards'
+
+
+def open_shards(cfg, ann_prefix, num_samples):
+    ''' Crop shards of a dataset split if `cfg.DATASET.USE_SHARDS` is set, else None. '''
+    if not cfg.DATASET.get('USE_SHARDS', False):
+        return None
+
+    shards = CropShardReader(shard_dir_of(ann_prefix))
+    assert len(shards) == num_samples, \
+        f'{shards.shard_dir} has {len(shards)} crops for {num_samples} samples, pack it again'
+    return shards
+
+
+def read_image(img_path, shards=None, idx=None):
+    ''' RGB image of a sample, from the crop shards if the dataset has them. '''
+    if shards is not None:
+        return shards[idx]
+    return cv2.cvtColor(cv2.imread(img_path), cv2.COLOR_BGR2RGB)
+
+
+class CropShardWriter(object):
+    ''' Write person crops into chunked shard files.
+
+    Layout of `shard_dir`: `shard-XXXXX.bin` files with the encoded crops
+    back to back, and `index.npz` with the crop box, full image size and
+    byte range of every sample. The index is written last, a directory
+    without it is an interrupted run.
+
+    Parameters
+    ----------
+    shard_dir: str
+        Output directory.
+    encoding: str, optional
+        'jpg', 'png' (lossless) or 'raw' (decoded RGB bytes, largest, no decoding).
+    samples_per_shard: int, optional
+        Number of crops per shard file.
+    jpg_quality: int, optional
+        JPEG quality of 'jpg' shards.
+    '''
+
+    def __init__(self, shard_dir, encoding='jpg', samples_per_shard=4096, jpg_quality=95):
+        assert encoding in SHARD_ENCODINGS, encoding
+        self.shard_dir = shard_dir
+        self.encoding = encoding
+        self.samples_per_shard = samples_per_shard
+        self.jpg_quality = jpg_quality
+
+        os.makedirs(shard_dir, exist_ok=True)
+        index_path = os.path.join(shard_dir, 'index.npz')
+        if os.path.exists(index_path):
+            os.remove(index_path)
+
+        self._file = None
+        self._index = {k: [] for k in ('crop_box', 'img_size', 'shard', 'offset', 'length', 'img_path')}
+
+    def encode(self, img, crop):
+        ''' Crop an RGB image and encode it, may run in worker processes. '''
+        x0, y0, x1, y1 = crop
+        patch = np.ascontiguousarray(img[y0:y1, x0:x1])
+        if self.encoding == 'raw':
+            return patch.tobytes()
+
+        params = [cv2.IMWRITE_JPEG_QUALITY, self.jpg_quality] if self.encoding == 'jpg' else []
+        ok, buf = cv2.imencode('.' + self.encoding, cv2.cvtColor(patch, cv2.COLOR_RGB2BGR), params)
+        assert ok, 'Failed to encode crop'
+        return buf.tobytes()
+
+    def write(self, data, crop, img_size, img_path=''):
+        ''' Append an encoded crop.
+
+        Parameters
+        ----------
+        data: bytes
+            Output of `encode`.
+        crop: list
+            (x0, y0, x1, y1) region of the crop in the image.
+        img_size: tuple
+            (height, width) of the full image.
+        img_path: str, optional
+            Source image, kept to check the shards match the annotations.
+        '''
+        num_samples = len(self._index['shard'])
+        shard_idx = num_samples // self.samples_per_shard
+        if num_samples % self.samples_per_shard == 0:
+            self._open_shard(shard_idx)
+
+        self._index['crop_box'].append(crop)
+        self._index['img_size'].append(img_size)
+        self._index['shard'].append(shard_idx)
+        self._index['offset'].append(self._file.tell())
+        self._index['length'].append(len(data))
+        self._index['img_path'].append(img_path)
+        self._file.write(data)
+
+    def _open_shard(self, shard_idx):
+        if self._file is not None:
+            self._file.close()
+        self._file = open(os.path.join(self.shard_dir, f'shard-{shard_idx:05d}.bin'), 'wb')
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+        np.savez(
+            os.path.join(self.shard_dir, 'index.npz'),
+            encoding=np.array(self.encoding),
+            crop_box=np.array(self._index['crop_box'], dtype=np.int32).reshape(-1, 4),
+            img_size=np.array(self._index['img_size'], dtype=np.int32).reshape(-1, 2),
+            shard=np.array(self._index['shard'], dtype=np.int32),
+            offset=np.array(self._index['offset'], dtype=np.int64),
+            length=np.array(self._index['length'], dtype=np.int64),
+            img_path=np.array(self._index['img_path']))
+
+
+class CropShardReader(object):
+    ''' Read images packed by `CropShardWriter`.
+
+    Each sample is returned as an RGB image of the original size with the
+    stored crop pasted at its place and zeros elsewhere, so the dataset
+    transforms and their outputs (bbox, trans_inv, img_center) are the same
+    as with the full image as long as the augmentation stays inside the crop.
+    Shard files are opened lazily in each DataLoader worker.
+
+    Parameters
+    ----------
+    shard_dir: str
+        Directory written by `CropShardWriter`.
+    '''
+
+    def __init__(self, shard_dir):
+        index_path = os.path.join(shard_dir, 'index.npz')
+        assert os.path.exists(index_path), f'Shard index {index_path} does not exist!'
+        self.shard_dir = shard_dir
+
+        with np.load(index_path) as index:
+            self.encoding = str(index['encoding'])
+            self.crop_box = index['crop_box']
+            self.img_size = index['img_size']
+            self.shard = index['shard']
+            self.offset = index['offset']
+            self.length = index['length']
+            self.img_path = index['img_path']
+
+        self._fds = {}
+
+    def __len__(self):
+        return len(self.shard)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # descriptors do not survive pickling to spawned workers
+        state['_fds'] = {}
+        return state
+
+    def _read(self, idx):
+        # pread does not move the file offset, forked workers can share descriptors
+        shard_idx = int(self.shard[idx])
+        if shard_idx not in self._fds:
+            self._fds[shard_idx] = os.open(
+                os.path.join(self.shard_dir, f'shard-{shard_idx:05d}.bin'), os.O_RDONLY)
+        return os.pread(self._fds[shard_idx], int(self.length[idx]), int(self.offset[idx]))
+
+    def read_crop(self, idx):
+        ''' The stored RGB crop and its (x0, y0, x1, y1) region. '''
+        x0, y0, x1, y1 = self.crop_box[idx]
+        data = self._read(idx)
+        if self.encoding == 'raw':
+            patch = np.frombuffer(data, dtype=np.uint8).reshape(y1 - y0, x1 - x0, 3)
+        else:
+            patch = cv2.cvtColor(cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB)
+        return patch, self.crop_box[idx]
+
+    def __getitem__(self, idx):
+        patch, (x0, y0, x1, y1) = self.read_crop(idx)
+
+        # untouched pages of the zero canvas are never allocated
+        img = np.zeros((self.img_size[idx][0], self.img_size[idx][1], 3), dtype=np.uint8)
+        img[y0:y1, x0:x1] = patch
+        return img
+
+    def __del__(self):
+        for fd in self._fds.values():
+            os.close(fd)
@@ -0,0 +1,352 @@
+import numpy as np
+
+from .kinematic_tree import build_kinematic_tree
+
+# arrays of `SMPLNumpy`, as saved by `SMPLNumpy.save`
+SMPL_NUMPY_KEYS = (
+    'J_template', 'J_shapedirs', 'v_template', 'shapedirs', 'posedirs',
+    'lbs_weights', 'J_regressor_h36m', 'parents', 'children',
+)
+
+
+def _matvec(mat, vec):
+    return np.matmul(mat, vec[..., None])[..., 0]
+
+
+def _skew(vec):
+    rx, ry, rz = vec[..., 0], vec[..., 1], vec[..., 2]
+    zeros = np.zeros_like(rx)
+    return np.stack([zeros, -rz, ry, rz, zeros, -rx, -ry, rx, zeros], axis=-1).reshape(vec.shape[:-1] + (3, 3))
+
+
+def _rodrigues(axis, cos, sin):
+    K = _skew(axis)
+    ident = np.eye(3, dtype=axis.dtype)
+    return ident + sin[..., None] * K + (1 - cos[..., None]) * np.matmul(K, K)
+
+
+def _norm(vec):
+    return np.linalg.norm(vec, axis=-1, keepdims=True)
+
+
+def vectors2rotmat(vec_rest, vec_final):
+    ''' Rotation taking the direction of `vec_rest` onto `vec_final`, ...x3 each. '''
+    axis = np.cross(vec_rest, vec_final)
+    axis_norm = _norm(axis)
+    denom = _norm(vec_rest) * _norm(vec_final) + 1e-8
+
+    cos = np.sum(vec_rest * vec_final, axis=-1, keepdims=True) / denom
+    sin = axis_norm / denom
+
+    return _rodrigues(axis / (axis_norm + 1e-8), cos, sin)
+
+
+def procrustes_rotmat(S):
+    ''' Horn's quaternion solution of the 3x3 Procrustes problem, see `batch_procrustes_rotmat`.
+
+    Parameters
+    ----------
+    S: np.ndarray Bx3x3
+        The covariance ``rest^T @ target`` of the matched vectors.
+
+    Returns
+    -------
+    rot_mat: np.ndarray Bx3x3
+    '''
+    S = S.astype(np.float64)
+    Sxx, Sxy, Sxz = S[:, 0, 0], S[:, 0, 1], S[:, 0, 2]
+    Syx, Syy, Syz = S[:, 1, 0], S[:, 1, 1], S[:, 1, 2]
+    Szx, Szy, Szz = S[:, 2, 0], S[:, 2, 1], S[:, 2, 2]
+
+    N = np.stack([
+        Sxx + Syy + Szz, Syz - Szy, Szx - Sxz, Sxy - Syx,
+        Syz - Szy, Sxx - Syy - Szz, Sxy + Syx, Szx + Sxz,
+        Szx - Sxz, Sxy + Syx, -Sxx + Syy - Szz, Syz + Szy,
+        Sxy - Syx, Szx + Sxz, Syz + Szy, -Sxx - Syy + Szz
+    ], axis=1).reshape(-1, 4, 4)
+
+    # eigenvalues are in ascending order
+    _, eigvecs = np.linalg.eigh(N)
+    w, x, y, z = np.moveaxis(eigvecs[:, :, -1], 1, 0)
+
+    return np.stack([
+        1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y),
+        2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x),
+        2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)
+    ], axis=1).reshape(-1, 3, 3)
+
+
+def blend_shapes(betas, shape_disps):
+    ''' Per vertex displacement of the blend shapes, BxNB and Vx3xNB to BxVx3. '''
+    return np.einsum('bl,mkl->bmk', betas, shape_disps)
+
+
+def get_pelvis_orient(rel_pose_skeleton, rel_rest_pose, pelvis_child):
+    ''' Root rotation from the spine bone and the hip center, see `batch_get_pelvis_orient`. '''
+    spine_child = pelvis_child[0]
+
+    spine_final_loc = rel_pose_skeleton[:, spine_child]
+    spine_rest_loc = rel_rest_pose[:, spine_child]
+    spine_norm = spine_final_loc / (_norm(spine_final_loc) + 1e-8)
+
+    rot_mat_spine = vectors2rotmat(spine_rest_loc, spine_final_loc)
+
+    center_final_loc = rel_pose_skeleton[:, pelvis_child[1:]].mean(axis=1)
+    center_rest_loc = rel_rest_pose[:, pelvis_child[1:]].mean(axis=1)
+    center_rest_loc = _matvec(rot_mat_spine, center_rest_loc)
+
+    center_final_loc = center_final_loc - np.sum(center_final_loc * spine_norm, axis=-1, keepdims=True) * spine_norm
+    center_rest_loc = center_rest_loc - np.sum(center_rest_loc * spine_norm, axis=-1, keepdims=True) * spine_norm
+
+    rot_mat_center = vectors2rotmat(center_rest_loc, center_final_loc)
+
+    return np.matmul(rot_mat_center, rot_mat_spine)
+
+
+def get_pelvis_orient_svd(rel_pose_skeleton, rel_rest_pose, pelvis_child):
+    ''' Root rotation fitted to all root children, see `batch_get_pelvis_orient_svd`. '''
+    S = np.einsum('bni,bnj->bij', rel_rest_pose[:, pelvis_child], rel_pose_skeleton[:, pelvis_child])
+
+    rot_mat = procrustes_rotmat(S)
+    mask_zero = S.sum(axis=(1, 2)) == 0
+
+    return np.where(mask_zero[:, None, None], np.eye(3), rot_mat).astype(rel_pose_skeleton.dtype)
+
+
+def inverse_kinematics(pose_skeleton, phis, rest_pose, kintree, naive=False):
+    ''' Rotations of a skeleton given the joint locations and twist angles.
+
+    Level-batched port of `batch_inverse_kinematics_transform` and, with
+    `naive`, of `batch_inverse_kinematics_transform_naive`, for inference.
+
+    Parameters
+    ----------
+    pose_skeleton: np.ndarray BxJx3
+        Root-relative joint locations.
+    phis: np.ndarray Bx(J-1)x2
+        The rotation on bone axis parameters.
+    rest_pose: np.ndarray BxJx3
+        Joint locations of the rest pose.
+    kintree: KinematicTree
+
+    Returns
+    -------
+    rot_mats: np.ndarray BxKx3x3
+        Local rotations of the non-leaf joints.
+    '''
+    batch_size, num_joints = pose_skeleton.shape[:2]
+    parents = list(kintree.parents)
+
+    rel_rest_pose = rest_pose.copy()
+    rel_rest_pose[:, 1:] -= rest_pose[:, parents[1:]]
+
+    rotate_rest_pose = np.zeros_like(rel_rest_pose)
+    rotate_rest_pose[:, 0] = rel_rest_pose[:, 0]
+
+    rel_pose_skeleton = pose_skeleton.copy()
+    rel_pose_skeleton[:, 1:] -= pose_skeleton[:, parents[1:]]
+    rel_pose_skeleton[:, 0] = rel_rest_pose[:, 0]
+
+    final_pose_skeleton = pose_skeleton - pose_skeleton[:, 0:1] + rel_rest_pose[:, 0:1]
+
+    phis = phis / (_norm(phis) + 1e-8)
+
+    if naive:
+        global_orient_mat = get_pelvis_orient(rel_pose_skeleton, rel_rest_pose, kintree.pelvis_child)
+    else:
+        global_orient_mat = get_pelvis_orient_svd(rel_pose_skeleton, rel_rest_pose, kintree.pelvis_child)
+
+    rot_mat_chain = np.zeros((batch_size, num_joints, 3, 3), dtype=pose_skeleton.dtype)
+    rot_mat_local = np.zeros_like(rot_mat_chain)
+    rot_mat_chain[:, 0] = global_orient_mat
+    rot_mat_local[:, 0] = global_orient_mat
+
+    for indices, parent_indices, child_indices in kintree.idx_levs:
+        parent_rot = rot_mat_chain[:, parent_indices]
+        parent_rot_t = np.swapaxes(parent_rot, -1, -2)
+
+        if naive:
+            child_final_loc = rel_pose_skeleton[:, child_indices]
+        else:
+            rotate_rest_pose[:, indices] = rotate_rest_pose[:, parent_indices] + _matvec(
+                parent_rot, rel_rest_pose[:, indices])
+
+            if child_indices[0] == -3:
+                # three children
+                i = indices[0]
+                spine_child = kintree.spine_child[i]
+                children_final_loc = _matvec(
+                    parent_rot_t, final_pose_skeleton[:, spine_child] - rotate_rest_pose[:, [i]])
+
+                S = np.einsum('bni,bnj->bij', rel_rest_pose[:, spine_child], children_final_loc)
+                rot_mat = procrustes_rotmat(S).astype(pose_skeleton.dtype)
+
+                rot_mat_chain[:, i] = np.matmul(parent_rot[:, 0], rot_mat)
+                rot_mat_local[:, i] = rot_mat
+                continue
+
+            child_final_loc = final_pose_skeleton[:, child_indices] - rotate_rest_pose[:, indices]
+
+            orig_vec = rel_pose_skeleton[:, child_indices]
+            template_vec = rel_rest_pose[:, child_indices]
+            orig_vec = orig_vec * _norm(template_vec) / _norm(orig_vec)
+
+            diff = _norm(child_final_loc - orig_vec)
+            child_final_loc = np.where(diff > 15 / 1000, orig_vec, child_final_loc)
+
+        child_final_loc = _matvec(parent_rot_t, child_final_loc)
+        child_rest_loc = rel_rest_pose[:, child_indices]
+        child_rest_norm = _norm(child_rest_loc)
+
+        rot_mat_loc = vectors2rotmat(child_rest_loc, child_final_loc)
+
+        # twist around the rest bone
+        spin_axis = child_rest_loc / (child_rest_norm + 1e-8) if naive else child_rest_loc / child_rest_norm
+        phi = phis[:, [i - 1 for i in indices]]
+        rot_mat_spin = _rodrigues(spin_axis, phi[..., :1], phi[..., 1:])
+        rot_mat = np.matmul(rot_mat_loc, rot_mat_spin)
+
+        rot_mat_chain[:, indices] = np.matmul(parent_rot, rot_mat)
+        rot_mat_local[:, indices] = rot_mat
+
+    leaf_indices = kintree.leaf_lev[0]
+    return rot_mat_local[:, [i for i in range(num_joints) if i not in leaf_indices]]
+
+
+def rigid_transform(rot_mats, joints, kintree):
+    ''' Forward kinematics, see `batch_rigid_transform`.
+
+    Returns
+    -------
+    posed_joints: np.ndarray BxJx3
+    rel_transforms: np.ndarray BxJx3x4
+        The 3x4 part of the transforms relative to the rest pose.
+    '''
+    num_joints = joints.shape[1]
+    parents = list(kintree.parents[:num_joints])
+
+    rel_joints = joints.copy()
+    rel_joints[:, 1:] -= joints[:, parents[1:]]
+
+    transforms_mat = np.zeros(joints.shape[:2] + (4, 4), dtype=joints.dtype)
+    transforms_mat[..., :3, :3] = rot_mats
+    transforms_mat[..., :3, 3] = rel_joints
+    transforms_mat[..., 3, 3] = 1
+
+    transforms = np.zeros_like(transforms_mat)
+    transforms[:, 0] = transforms_mat[:, 0]
+    for indices, parent_indices in kintree.rigid_levs:
+        transforms[:, indices] = np.matmul(transforms[:, parent_indices], transforms_mat[:, indices])
+
+    posed_joints = transforms[:, :, :3, 3]
+
+    rel_transforms = transforms[:, :, :3].copy()
+    rel_transforms[..., 3] -= _matvec(transforms[:, :, :3, :3], joints)
+
+    return posed_joints, rel_transforms
+
+
+class SMPLNumpy(object):
+    ''' NumPy implementation of `SMPL_layer.hybrik` for inference without PyTorch.
+
+    Uses the rest joints folded into the shape blend shapes
+    (`contract_joint_regressor`) and matches `SMPL_layer.hybrik` in eval
+    mode without `transl`, including the root alignment of the outputs.
+
+    Parameters
+    ----------
+    J_template: np.ndarray (J + L)x3
+    J_shapedirs: np.ndarray (J + L)x3xNB
+    v_template: np.ndarray Vx3
+    shapedirs: np.ndarray Vx3xNB
+    posedirs: np.ndarray Px(V * 3)
+    lbs_weights: np.ndarray VxJ
+    J_regressor_h36m: np.ndarray 17xV
+    parents, children: np.ndarray J + L
+        `SMPL_layer.parents` and `SMPL_layer.children_map`.
+    '''
+    root_idx_17 = 0
+    root_idx_smpl = 0
+
+    def __init__(self, J_template, J_shapedirs, v_template, shapedirs, posedirs,
+                 lbs_weights, J_regressor_h36m, parents, children):
+        self.J_template = np.asarray(J_template, dtype=np.float32)
+        self.J_shapedirs = np.asarray(J_shapedirs, dtype=np.float32)
+        self.v_template = np.asarray(v_template, dtype=np.float32)
+        self.shapedirs = np.asarray(shapedirs, dtype=np.float32)
+        self.posedirs = np.asarray(posedirs, dtype=np.float32)
+        self.lbs_weights = np.asarray(lbs_weights, dtype=np.float32)
+        self.J_regressor_h36m = np.asarray(J_regressor_h36m, dtype=np.float32)
+        self.parents = np.asarray(parents, dtype=np.int64)
+        self.children = np.asarray(children, dtype=np.int64)
+
+        self.kintree = build_kinematic_tree(self.parents, self.children)
+        self.num_body_joints = self.lbs_weights.shape[1]
+
+    @classmethod
+    def from_smpl_layer(cls, smpl):
+        ''' Copy the buffers of a `SMPL_layer`. '''
+        return cls(**{
+            k: getattr(smpl, k if k != 'children' else 'children_map').detach().cpu().numpy()
+            for k in SMPL_NUMPY_KEYS})
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(**{k: data[k] for k in SMPL_NUMPY_KEYS})
+
+    def arrays(self):
+        return {k: getattr(self, k) for k in SMPL_NUMPY_KEYS}
+
+    def save(self, path, **extra):
+        ''' Save the arrays, and `extra` entries, to an .npz file. '''
+        np.savez(path, **self.arrays(), **extra)
+
+    def hybrik(self, pose_skeleton, betas, phis, return_verts=True, naive=False):
+        ''' Inverse pass for the SMPL model
+
+            Parameters
+            ----------
+            pose_skeleton: np.ndarray BxJx3
+                Joint locations (unit: m).
+            betas: np.ndarray Bx10
+            phis: np.ndarray Bx(J-1)x2
+            return_verts: bool, optional
+                If False, `vertices` and `joints_from_verts` are None.
+            naive: bool, optional
+                Use the naive IK, as in the camera refinement.
+
+            Returns
+            -------
+            output: dict
+                vertices BxVx3, joints Bx24x3, rot_mats (B*24)x3x3 and
+                joints_from_verts Bx17x3, root aligned.
+        '''
+        pose_skeleton = np.asarray(pose_skeleton, dtype=np.float32).reshape(pose_skeleton.shape[0], -1, 3)
+        betas = np.asarray(betas, dtype=np.float32)
+        phis = np.asarray(phis, dtype=np.float32)
+        batch_size = pose_skeleton.shape[0]
+
+        rest_J = self.J_template + blend_shapes(betas, self.J_shapedirs)
+        rot_mats = inverse_kinematics(pose_skeleton, phis, rest_J, self.kintree, naive=naive)
+        joints, A = rigid_transform(rot_mats, rest_J[:, :self.num_body_joints], self.kintree)
+
+        vertices = joints_from_verts = None
+        if return_verts:
+            v_shaped = self.v_template + blend_shapes(betas, self.shapedirs)
+
+            pose_feature = (rot_mats[:, 1:] - np.eye(3, dtype=np.float32)).reshape(batch_size, -1)
+            v_posed = v_shaped + np.matmul(pose_feature, self.posedirs).reshape(batch_size, -1, 3)
+
+            # blend the 3x4 joint transforms, (V x J) x (B x J x 12)
+            T = np.matmul(self.lbs_weights, A.reshape(batch_size, -1, 12)).reshape(batch_size, -1, 3, 4)
+            vertices = _matvec(T[..., :3], v_posed) + T[..., 3]
+            joints_from_verts = np.einsum('bik,ji->bjk', vertices, self.J_regressor_h36m)
+
+            vertices = vertices - joints_from_verts[:, [self.root_idx_17]]
+            joints_from_verts = joints_from_verts - joints_from_verts[:, [self.root_idx_17]]
+        joints = joints - joints[:, [self.root_idx_smpl]]
+
+        return dict(
+            vertices=vertices, joints=joints, rot_mats=rot_mats.reshape(-1, 3, 3),
+            joints_from_verts=joints_from_verts)
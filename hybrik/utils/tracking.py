@@ -0,0 +1,90 @@
+import torch
+from scipy.optimize import linear_sum_assignment
+
+from .bbox import bbox_iou
+
+
+def match_boxes(track_boxes, det_boxes, iou_thrd=0.3):
+    ''' One-to-one assignment of detections to tracks maximizing the total IoU.
+
+    Parameters
+    ----------
+    track_boxes: torch.tensor Tx4
+        Last boxes of the tracks in (x1, y1, x2, y2) format.
+    det_boxes: torch.tensor Nx4
+        Detections of the current frame in (x1, y1, x2, y2) format.
+    iou_thrd: float, optional
+        Pairs overlapping less are never matched.
+
+    Returns
+    -------
+    track_idx: torch.LongTensor K
+    det_idx: torch.LongTensor K
+        Matched pairs, `track_boxes[track_idx[k]]` continues as `det_boxes[det_idx[k]]`.
+    '''
+    if len(track_boxes) == 0 or len(det_boxes) == 0:
+        empty = torch.zeros(0, dtype=torch.long)
+        return empty, empty
+
+    iou = bbox_iou(track_boxes, det_boxes, offset=1).cpu()
+    track_idx, det_idx = linear_sum_assignment(iou.numpy(), maximize=True)
+    track_idx, det_idx = torch.from_numpy(track_idx), torch.from_numpy(det_idx)
+
+    keep = iou[track_idx, det_idx] >= iou_thrd
+    return track_idx[keep], det_idx[keep]
+
+
+class BoxTracker(object):
+    ''' Keep person identities across frames by IoU matching.
+
+    Parameters
+    ----------
+    iou_thrd: float, optional
+        Minimum IoU between a track and a detection to continue the track.
+    max_age: int, optional
+        Drop a track after this many consecutive frames without a match.
+    '''
+
+    def __init__(self, iou_thrd=0.3, max_age=5):
+        self.iou_thrd = iou_thrd
+        self.max_age = max_age
+
+        self.boxes = torch.zeros(0, 4)
+        self.ids = torch.zeros(0, dtype=torch.long)
+        self.ages = torch.zeros(0, dtype=torch.long)
+        self.next_id = 0
+
+    def update(self, det_boxes):
+        ''' Assign track ids to the detections of a new frame.
+
+        Parameters
+        ----------
+        det_boxes: list or torch.tensor Nx4
+            Detections in (x1, y1, x2, y2) format.
+
+        Returns
+        -------
+        track_ids: list
+            Track id of every detection, new ids for unmatched detections.
+        '''
+        det_boxes = torch.as_tensor(det_boxes, dtype=torch.float32).reshape(-1, 4).cpu()
+        track_idx, det_idx = match_boxes(self.boxes, det_boxes, self.iou_thrd)
+
+        det_ids = torch.full((len(det_boxes),), -1, dtype=torch.long)
+        det_ids[det_idx] = self.ids[track_idx]
+
+        self.boxes[track_idx] = det_boxes[det_idx]
+        self.ages += 1
+        self.ages[track_idx] = 0
+
+        new = det_ids < 0
+        num_new = int(new.sum())
+        det_ids[new] = torch.arange(self.next_id, self.next_id + num_new)
+        self.next_id += num_new
+
+        alive = self.ages <= self.max_age
+        self.boxes = torch.cat([self.boxes[alive], det_boxes[new]], dim=0)
+        self.ids = torch.cat([self.ids[alive], det_ids[new]], dim=0)
+        self.ages = torch.cat([self.ages[alive], torch.zeros(num_new, dtype=torch.long)], dim=0)
+
+        return det_ids.tolist()
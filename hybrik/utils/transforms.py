@@ -1,6 +1,7 @@
 """Pose related transforrmation functions."""
 
 import random
+from functools import lru_cache
 
 import cv2
 import numpy as np
@@ -896,6 +897,40 @@ def flip_refine_coord(preds, joint_pairs, width_dim, shift=False):
     return pred_jts, refine_jts, pred_scores
 
 
+def flip_index(joint_pairs, num_joints, offset=0):
+    """Index array that swaps the left-right joint pairs, `joints[flip_index(...)]`.
+
+    The swaps are applied in order to `arange(num_joints)`, so indexing gives
+    the same rows as swapping the pairs one by one. Cached per pair list.
+
+    Parameters
+    ----------
+    joint_pairs : list
+        List of joint pairs.
+    num_joints : int
+        Number of joints.
+    offset : int
+        Subtracted from the pair indices.
+
+    Returns
+    -------
+    numpy.ndarray
+        Read-only index array with shape (num_joints,)
+
+    """
+    return _flip_index(tuple(tuple(pair) for pair in joint_pairs), num_joints, offset)
+
+
+@lru_cache(maxsize=None)
+def _flip_index(joint_pairs, num_joints, offset):
+    index = np.arange(num_joints)
+    for pair in joint_pairs:
+        idx0, idx1 = pair[0] - offset, pair[1] - offset
+        index[idx0], index[idx1] = index[idx1], index[idx0]
+    index.flags.writeable = False
+    return index
+
+
 def flip_joints_3d(joints_3d, width, joint_pairs):
     """Flip 3d joints.
 
@@ -914,15 +949,10 @@ def flip_joints_3d(joints_3d, width, joint_pairs):
         Flipped 3d joints with shape (num_joints, 3, 2)
 
     """
-    joints = joints_3d.copy()
+    # change left-right parts
+    joints = joints_3d[flip_index(joint_pairs, len(joints_3d))]
     # flip horizontally
     joints[:, 0, 0] = width - joints[:, 0, 0] - 1
-    # change left-right parts
-    for pair in joint_pairs:
-        joints[pair[0], :, 0], joints[pair[1], :, 0] = \
-            joints[pair[1], :, 0], joints[pair[0], :, 0].copy()
-        joints[pair[0], :, 1], joints[pair[1], :, 1] = \
-            joints[pair[1], :, 1], joints[pair[0], :, 1].copy()
 
     joints[:, :, 0] *= joints[:, :, 1]
     return joints
@@ -946,12 +976,10 @@ def flip_xyz_joints_3d(joints_3d, joint_pairs):
     """
     assert joints_3d.ndim in (2, 3)
 
-    joints = joints_3d.copy()
+    # change left-right parts
+    joints = joints_3d[flip_index(joint_pairs, len(joints_3d))]
     # flip horizontally
     joints[:, 0] = -1 * joints[:, 0]
-    # change left-right parts
-    for pair in joint_pairs:
-        joints[pair[0], :], joints[pair[1], :] = joints[pair[1], :], joints[pair[0], :].copy()
 
     return joints
 
@@ -973,16 +1001,14 @@ def flip_cam_xyz_joints_3d(joints_3d, joint_pairs):
 
     """
     root_jts = joints_3d[:1].copy()
-    joints = (joints_3d - root_jts)
     assert joints_3d.ndim in (2, 3)
 
+    # change left-right parts
+    joints = joints_3d[flip_index(joint_pairs, len(joints_3d))] - root_jts
+
     # flip horizontally
     joints[:, 0] = -1 * joints[:, 0]
 
-    # change left-right parts
-    for pair in joint_pairs:
-        joints[pair[0], :], joints[pair[1], :] = joints[pair[1], :], joints[pair[0], :].copy()
-
     return joints + root_jts
 
 
@@ -1002,35 +1028,23 @@ def flip_thetas(thetas, theta_pairs):
         Flipped thetas with shape (num_thetas, 3)
 
     """
-    thetas_flip = thetas.copy()
-    # reflect horizontally
-    thetas_flip[:, 1] = -1 * thetas_flip[:, 1]
-    thetas_flip[:, 2] = -1 * thetas_flip[:, 2]
-    # thetas_flip[:, 0] = -1 * thetas_flip[:, 0]
     # change left-right parts
-    for pair in theta_pairs:
-        thetas_flip[pair[0], :], thetas_flip[pair[1], :] = \
-            thetas_flip[pair[1], :], thetas_flip[pair[0], :].copy()
+    thetas_flip = thetas[flip_index(theta_pairs, len(thetas))]
+    # reflect horizontally
+    thetas_flip[:, 1:3] = -1 * thetas_flip[:, 1:3]
 
     return thetas_flip
 
 
 def flip_twist(twist_phi, twist_weight, twist_pairs):
-    # twist_flip = -1 * twist_phi.copy() # 23 x 2
-    twist_flip = np.zeros_like(twist_phi)
-    weight_flip = twist_weight.copy()
-
-    twist_flip[:, 0] = twist_phi[:, 0].copy() # cos
-    twist_flip[:, 1] = -1 * twist_phi[:, 1].copy() # sin
-    for pair in twist_pairs:
-        idx0 = pair[0] - 1
-        idx1 = pair[1] - 1
-        twist_flip[idx0, :], twist_flip[idx1, :] = \
-            twist_flip[idx1, :], twist_flip[idx0, :].copy()
-        
-        weight_flip[idx0, :], weight_flip[idx1, :] = \
-            weight_flip[idx1, :], weight_flip[idx0, :].copy()
-    
+    # twist angles start at joint 1
+    index = flip_index(twist_pairs, len(twist_phi), offset=1)
+    twist_flip = twist_phi[index]
+    weight_flip = twist_weight[index]
+
+    # cos stays, sin changes sign
+    twist_flip[:, 1] = -1 * twist_flip[:, 1]
+
     return twist_flip, weight_flip
 
 
@@ -1385,6 +1399,28 @@ def affine_transform(pt, t):
     return new_pt[:2]
 
 
+def affine_transform_joints_3d(joints_3d, t):
+    """Apply `affine_transform` to the image coordinates of the visible joints, in place.
+
+    Parameters
+    ----------
+    joints_3d : numpy.ndarray
+        Joints in shape (num_joints, 3, 2)
+    t : numpy.ndarray
+        2x3 affine matrix.
+
+    Returns
+    -------
+    numpy.ndarray
+        `joints_3d`
+
+    """
+    vis = joints_3d[:, 0, 1] > 0.0
+    pts = joints_3d[vis, 0:2, 0].astype(np.float64)
+    joints_3d[vis, 0:2, 0] = pts[:, :1] * t[:, 0] + pts[:, 1:] * t[:, 1] + t[:, 2]
+    return joints_3d
+
+
 def get_func_heatmap_to_coord(cfg):
     if cfg.TEST.get('HEATMAP2COORD') == 'coord':
         return heatmap_to_coord
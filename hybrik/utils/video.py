@@ -0,0 +1,194 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+_END = object()
+
+
+def read_video_frames(video_path, prefetch=0, meter=None):
+    ''' Decode frames straight from a video container.
+
+    Parameters
+    ----------
+    video_path: str
+        Path of the input video.
+    prefetch: int, optional
+        Size of the bounded queue filled by a background decode thread.
+        With 0, frames are decoded lazily in the calling thread.
+    meter: StageMeter, optional
+        Records the time spent decoding each frame.
+
+    Yields
+    ------
+    frame: numpy.ndarray
+        Decoded BGR frame with shape (H, W, 3).
+    '''
+    frames = _decode_frames(video_path)
+    if meter is not None:
+        frames = timed_iterator(frames, meter)
+    if prefetch > 0:
+        frames = prefetch_iterator(frames, prefetch)
+
+    for frame in frames:
+        yield frame
+
+
+def _decode_frames(video_path):
+    stream = cv2.VideoCapture(video_path)
+    assert stream.isOpened(), 'Cannot capture source'
+
+    try:
+        while True:
+            ret, frame = stream.read()
+            if not ret:
+                break
+            yield frame
+    finally:
+        stream.release()
+
+
+def prefetch_iterator(iterable, maxsize):
+    ''' Run `iterable` in a background thread, buffering at most `maxsize` items.
+
+    Exceptions raised by the producer are re-raised in the consumer. Closing
+    the returned generator early stops the producer thread.
+    '''
+    buffer = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def _put(item):
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce():
+        try:
+            for item in iterable:
+                if not _put(item):
+                    return
+        except BaseException as e:
+            _put(e)
+            return
+        _put(_END)
+
+    worker = threading.Thread(target=_produce, daemon=True)
+    worker.start()
+
+    try:
+        while True:
+            item = buffer.get()
+            if item is _END:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        worker.join()
+
+
+class StageMeter(object):
+    """Throughput meter of one pipeline stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.busy = 0.0
+        self._lock = threading.Lock()
+
+    def update(self, seconds, n=1):
+        with self._lock:
+            self.count += n
+            self.busy += seconds
+
+    def __repr__(self):
+        fps = self.count / self.busy if self.busy > 0 else 0.0
+        return '{}: {} frames, {:.1f}s busy, {:.1f} fps'.format(
+            self.name, self.count, self.busy, fps)
+
+
+def timed_iterator(iterable, meter):
+    ''' Yield from `iterable`, recording the time spent producing each item in `meter`. '''
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        meter.update(time.perf_counter() - start)
+        yield item
+
+
+class FrameWriterPool(object):
+    """Render frames on a worker pool and write them back in submission order.
+
+    `render_fn(*args)` runs on one of `num_workers` threads, `write_fn(result)`
+    runs on a single writer thread in the order the frames were submitted.
+    At most `max_pending` frames are in flight; `submit` blocks beyond that,
+    so a slow encoder throttles inference instead of buffering the video.
+    With `num_workers=0` both functions run inline in `submit`.
+    """
+
+    def __init__(self, render_fn, write_fn, num_workers=2, max_pending=8):
+        self.render_fn = render_fn
+        self.write_fn = write_fn
+        self.num_workers = num_workers
+        self.render_meter = StageMeter('render')
+        self.write_meter = StageMeter('encode')
+        self._error = None
+
+        if num_workers > 0:
+            self._pool = ThreadPoolExecutor(max_workers=num_workers)
+            self._pending = queue.Queue(maxsize=max_pending)
+            self._writer = threading.Thread(target=self._write_loop, daemon=True)
+            self._writer.start()
+
+    def _render(self, *args):
+        start = time.perf_counter()
+        result = self.render_fn(*args)
+        self.render_meter.update(time.perf_counter() - start)
+        return result
+
+    def _write(self, result):
+        start = time.perf_counter()
+        self.write_fn(result)
+        self.write_meter.update(time.perf_counter() - start)
+
+    def _write_loop(self):
+        while True:
+            future = self._pending.get()
+            if future is _END:
+                break
+            if self._error is not None:
+                # keep draining so that producers never block on a dead writer
+                continue
+            try:
+                self._write(future.result())
+            except BaseException as e:
+                self._error = e
+
+    def submit(self, *args):
+        if self._error is not None:
+            raise self._error
+
+        if self.num_workers > 0:
+            self._pending.put(self._pool.submit(self._render, *args))
+        else:
+            self._write(self._render(*args))
+
+    def close(self):
+        if self.num_workers > 0:
+            self._pending.put(_END)
+            self._writer.join()
+            self._pool.shutdown()
+
+        if self._error is not None:
+            raise self._error
@@ -6,6 +6,8 @@ import cv2
 import numpy as np
 import PIL.Image as pil_img
 
+from .bbox import bbox_iou
+
 
 RED = (0, 0, 255)
 GREEN = (0, 255, 0)
@@ -22,66 +24,117 @@ SOFT_RED = (251, 180, 174)
 SOFT_GREEN = (204, 235, 197)
 
 
-def get_one_box(det_output, thrd=0.9):
-    max_area = 0
-    max_bbox = None
+def _person_boxes(det_output, person_label=1):
+    boxes, scores = det_output['boxes'], det_output['scores']
+    if 'labels' in det_output:
+        is_person = det_output['labels'] == person_label
+        boxes, scores = boxes[is_person], scores[is_person]
+    return boxes, scores
+
 
+def get_one_box(det_output, thrd=0.9):
     if det_output['boxes'].shape[0] == 0 or thrd < 1e-5:
         return None
 
-    for i in range(det_output['boxes'].shape[0]):
-        bbox = det_output['boxes'][i]
-        score = det_output['scores'][i]
-        if float(score) < thrd:
-            continue
-        area = (bbox[2] - bbox[0]) * (bbox[3] - bbox[1])
-        if float(area) > max_area:
-            max_bbox = [float(x) for x in bbox]
-            max_area = area
+    boxes, scores = det_output['boxes'], det_output['scores']
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+
+    # lower the threshold by 0.1 until a box with positive area passes it
+    while thrd >= 1e-5:
+        valid_area = torch.where((scores >= thrd) & (area > 0), area, torch.zeros_like(area))
+        max_area, max_idx = valid_area.max(dim=0)
+        if float(max_area) > 0:
+            return boxes[max_idx].tolist()
+        thrd = thrd - 0.1
+
+    return None
+
+
+def get_all_boxes(det_output, thrd=0.9, max_num=0, person_label=1):
+    ''' All confident person detections of a frame, largest first.
+
+    Parameters
+    ----------
+    det_output: dict
+        torchvision detector output with 'boxes', 'scores' and 'labels'.
+    thrd: float, optional
+        Minimum detection score.
+    max_num: int, optional
+        Keep at most this many boxes, all if 0.
+    person_label: int, optional
+        Label of the person class, 1 for COCO.
+
+    Returns
+    -------
+    bboxes: list
+        Boxes in (x1, y1, x2, y2) format.
+    '''
+    boxes, scores = _person_boxes(det_output, person_label)
+    boxes = boxes[scores >= thrd]
 
-    if max_bbox is None:
-        return get_one_box(det_output, thrd=thrd - 0.1)
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    order = torch.argsort(area, descending=True)
+    if max_num > 0:
+        order = order[:max_num]
 
-    return max_bbox
+    return boxes[order].tolist()
 
 
 def get_max_iou_box(det_output, prev_bbox, thrd=0.9):
-    max_score = 0
-    max_bbox = None
-    for i in range(det_output['boxes'].shape[0]):
-        bbox = det_output['boxes'][i]
-        score = det_output['scores'][i]
-        # if float(score) < thrd:
-        #     continue
-        # area = (bbox[2] - bbox[0]) * (bbox[3] - bbox[1])
-        iou = calc_iou(prev_bbox, bbox)
-        iou_score = float(score) * iou
-        if float(iou_score) > max_score:
-            max_bbox = [float(x) for x in bbox]
-            max_score = iou_score
-    if max_bbox is None:
-        max_bbox = prev_bbox
-
-    return max_bbox
-
-
-def calc_iou(bbox1, bbox2):
-    bbox1 = [float(x) for x in bbox1]
-    bbox2 = [float(x) for x in bbox2]
+    boxes, scores = det_output['boxes'], det_output['scores']
+    if boxes.shape[0] == 0:
+        return prev_bbox
+
+    prev = torch.as_tensor([prev_bbox], dtype=boxes.dtype, device=boxes.device)
+    iou_score = scores * bbox_iou(prev, boxes, offset=1)[0]
+    max_score, max_idx = iou_score.max(dim=0)
+    if float(max_score) > 0:
+        return boxes[max_idx].tolist()
+
+    return prev_bbox
+
+
+def get_keypoint_box(uv, bbox_xywh, width, height, scale=1.2):
+    ''' Person box around the 2D keypoints predicted in a crop.
+
+    Used to propagate the box to the next frame without running the detector.
+
+    Parameters
+    ----------
+    uv: torch.tensor Kx2
+        Keypoints normalized by the crop, `pred_uvd_jts[:, :2]`.
+    bbox_xywh: list
+        Crop of the prediction as (cx, cy, w, h).
+    width: int
+        Image width.
+    height: int
+        Image height.
+    scale: float, optional
+        Enlarge the keypoint extent to cover the body outline.
+
+    Returns
+    -------
+    bbox: list
+        Box in (x1, y1, x2, y2) format.
+    '''
+    pts = uv * bbox_xywh[2] + uv.new_tensor(bbox_xywh[:2])
+    top_left, bottom_right = pts.min(dim=0).values, pts.max(dim=0).values
 
-    xA = max(bbox1[0], bbox2[0])
-    yA = max(bbox1[1], bbox2[1])
-    xB = min(bbox1[2], bbox2[2])
-    yB = min(bbox1[3], bbox2[3])
+    center = (top_left + bottom_right) * 0.5
+    half_size = (bottom_right - top_left) * 0.5 * scale
+    top_left = center - half_size
+    bottom_right = center + half_size
 
-    interArea = max(0, xB - xA + 1) * max(0, yB - yA + 1)
+    limit = uv.new_tensor([width - 1, height - 1])
+    top_left = torch.min(top_left.clamp(min=0), limit)
+    bottom_right = torch.min(bottom_right.clamp(min=0), limit)
+    return torch.cat([top_left, bottom_right]).tolist()
 
-    box1Area = (bbox1[2] - bbox1[0] + 1) * (bbox1[3] - bbox1[1] + 1)
-    box2Area = (bbox2[2] - bbox2[0] + 1) * (bbox2[3] - bbox2[1] + 1)
-    
-    iou = interArea / float(box1Area + box2Area - interArea)
 
-    return iou
+def calc_iou(bbox1, bbox2):
+    iou = bbox_iou(torch.tensor([[float(x) for x in bbox1]], dtype=torch.float64),
+                   torch.tensor([[float(x) for x in bbox2]], dtype=torch.float64), offset=1)
+    return float(iou)
 
 
 def vis_bbox(image, bbox):
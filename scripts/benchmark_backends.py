@@ -0,0 +1,92 @@
+"""Compare PyTorch and ONNX Runtime inference of HybrIK on CPU."""
+import argparse
+import time
+
+import numpy as np
+import torch
+from hybrik.models import builder
+from hybrik.models.export import HybrIKInference
+from hybrik.utils.config import update_config
+from hybrik.utils.onnx_inference import HybrIKOnnx
+
+parser = argparse.ArgumentParser(description='HybrIK Backend Benchmark')
+parser.add_argument('--cfg',
+                    help='experiment configure file name',
+                    default='configs/256x192_adam_lr1e-3-hrw48_cam_2x_w_pw3d_3dhp.yaml',
+                    type=str)
+parser.add_argument('--checkpoint',
+                    help='checkpoint file name',
+                    default='./pretrained_models/hybrik_hrnet.pth',
+                    type=str)
+parser.add_argument('--onnx',
+                    help='ONNX graph from scripts/export_model.py --format onnx',
+                    default='./pretrained_models/hybrik_hrnet.onnx',
+                    type=str)
+parser.add_argument('--kinematics',
+                    help='kinematics .npz saved with the ONNX graph',
+                    default='./pretrained_models/hybrik_hrnet.npz',
+                    type=str)
+parser.add_argument('--batch-sizes',
+                    help='comma separated batch sizes',
+                    default='1,4,8',
+                    type=str)
+parser.add_argument('--iters',
+                    help='timed iterations per batch size',
+                    default=10,
+                    type=int)
+parser.add_argument('--threads',
+                    help='CPU threads of both backends, library default if 0',
+                    default=0,
+                    type=int)
+
+opt = parser.parse_args()
+cfg = update_config(opt.cfg)
+
+if opt.threads > 0:
+    torch.set_num_threads(opt.threads)
+
+hybrik_model = builder.build_sppe(cfg.MODEL)
+
+print(f'Loading model from {opt.checkpoint}...')
+save_dict = torch.load(opt.checkpoint, map_location='cpu')
+if type(save_dict) == dict:
+    model_dict = save_dict['model']
+    hybrik_model.load_state_dict(model_dict)
+else:
+    hybrik_model.load_state_dict(save_dict)
+hybrik_model.eval()
+
+runner = HybrIKOnnx(opt.onnx, opt.kinematics, num_threads=opt.threads if opt.threads > 0 else None)
+# the flip test is baked into the ONNX graph, run PyTorch the same way
+eager = HybrIKInference(hybrik_model, flip_test=runner.flip_test).eval()
+
+
+def timeit(fn, iters):
+    fn()
+    start = time.perf_counter()
+    for _ in range(iters):
+        fn()
+    return (time.perf_counter() - start) / iters
+
+
+input_h, input_w = cfg.MODEL.IMAGE_SIZE
+print(f'flip test: {runner.flip_test}, threads: {opt.threads or "default"}')
+
+for batch_size in [int(b) for b in opt.batch_sizes.split(',')]:
+    img = torch.randn(batch_size, 3, input_h, input_w)
+    bboxes = torch.tensor([[0., 0., input_w, input_h]]).repeat(batch_size, 1)
+    img_center = torch.tensor([[input_w * 0.5, input_h * 0.5]]).repeat(batch_size, 1)
+    np_inputs = (img.numpy(), bboxes.numpy(), img_center.numpy())
+
+    with torch.no_grad():
+        eager_out = eager.to_dict(eager(img, bboxes, img_center))
+        torch_time = timeit(lambda: eager(img, bboxes, img_center), opt.iters)
+    ort_out = runner(*np_inputs)
+    ort_time = timeit(lambda: runner(*np_inputs), opt.iters)
+
+    diff = {k: np.abs(eager_out[k].numpy() - ort_out[k]).max()
+            for k in ('pred_uvd_jts', 'pred_xyz_jts_24_struct', 'pred_vertices', 'transl')}
+    print(f'batch {batch_size:3d} | '
+          f'pytorch {torch_time * 1000:8.1f} ms {batch_size / torch_time:7.1f} img/s | '
+          f'onnxruntime {ort_time * 1000:8.1f} ms {batch_size / ort_time:7.1f} img/s | '
+          + ' '.join(f'{k} {v:.1e}' for k, v in diff.items()))
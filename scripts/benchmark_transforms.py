@@ -0,0 +1,234 @@
+"""Time the label generation of the 3D transform presets against per-joint loops."""
+import argparse
+import random
+import time
+
+import cv2
+import numpy as np
+from easydict import EasyDict as edict
+from hybrik.utils import transforms
+from hybrik.utils.presets import simple_transform_3d_smpl_cam
+from hybrik.utils.presets.simple_transform_3d_smpl_cam import SimpleTransform3DSMPLCam
+
+parser = argparse.ArgumentParser(description='HybrIK Transform Benchmark')
+parser.add_argument('--iters',
+                    help='timed calls per function',
+                    default=2000,
+                    type=int)
+parser.add_argument('--samples',
+                    help='timed samples of the full transform',
+                    default=500,
+                    type=int)
+parser.add_argument('--img-size',
+                    help='side of the synthetic images, smaller leaves more of the time to the labels',
+                    default=256,
+                    type=int)
+
+opt = parser.parse_args()
+
+JOINT_PAIRS_17 = ((1, 4), (2, 5), (3, 6), (11, 14), (12, 15), (13, 16))
+JOINT_PAIRS_24 = ((1, 2), (4, 5), (7, 8), (10, 11), (13, 14), (16, 17), (18, 19), (20, 21), (22, 23))
+JOINT_PAIRS_29 = JOINT_PAIRS_24 + ((25, 26), (27, 28))
+# body, hand and leaf pairs of the SMPL-X preset, 127 joints with the face ones
+JOINT_PAIRS_55 = JOINT_PAIRS_24[:8] + ((23, 24),) + tuple((25 + i, 40 + i) for i in range(15))
+JOINT_PAIRS_71 = JOINT_PAIRS_55 + ((55, 56), (58, 59)) + tuple((60 + i, 65 + i) for i in range(5))
+JOINT_PAIRS_127 = JOINT_PAIRS_71 + tuple((71 + i, 99 + i) for i in range(28))
+
+
+# per-joint implementations the presets used before, for timing and checks
+def loop_flip_joints_3d(joints_3d, width, joint_pairs):
+    joints = joints_3d.copy()
+    joints[:, 0, 0] = width - joints[:, 0, 0] - 1
+    for pair in joint_pairs:
+        joints[pair[0], :, 0], joints[pair[1], :, 0] = joints[pair[1], :, 0], joints[pair[0], :, 0].copy()
+        joints[pair[0], :, 1], joints[pair[1], :, 1] = joints[pair[1], :, 1], joints[pair[0], :, 1].copy()
+    joints[:, :, 0] *= joints[:, :, 1]
+    return joints
+
+
+def loop_flip_cam_xyz_joints_3d(joints_3d, joint_pairs):
+    root_jts = joints_3d[:1].copy()
+    joints = (joints_3d - root_jts)
+    joints[:, 0] = -1 * joints[:, 0]
+    for pair in joint_pairs:
+        joints[pair[0], :], joints[pair[1], :] = joints[pair[1], :], joints[pair[0], :].copy()
+    return joints + root_jts
+
+
+def loop_flip_thetas(thetas, theta_pairs):
+    thetas_flip = thetas.copy()
+    thetas_flip[:, 1] = -1 * thetas_flip[:, 1]
+    thetas_flip[:, 2] = -1 * thetas_flip[:, 2]
+    for pair in theta_pairs:
+        thetas_flip[pair[0], :], thetas_flip[pair[1], :] = thetas_flip[pair[1], :], thetas_flip[pair[0], :].copy()
+    return thetas_flip
+
+
+def loop_flip_twist(twist_phi, twist_weight, twist_pairs):
+    twist_flip = np.zeros_like(twist_phi)
+    weight_flip = twist_weight.copy()
+    twist_flip[:, 0] = twist_phi[:, 0].copy()
+    twist_flip[:, 1] = -1 * twist_phi[:, 1].copy()
+    for pair in twist_pairs:
+        idx0, idx1 = pair[0] - 1, pair[1] - 1
+        twist_flip[idx0, :], twist_flip[idx1, :] = twist_flip[idx1, :], twist_flip[idx0, :].copy()
+        weight_flip[idx0, :], weight_flip[idx1, :] = weight_flip[idx1, :], weight_flip[idx0, :].copy()
+    return twist_flip, weight_flip
+
+
+def loop_affine_transform_joints_3d(joints_3d, t):
+    for i in range(len(joints_3d)):
+        if joints_3d[i, 0, 1] > 0.0:
+            joints_3d[i, 0:2, 0] = transforms.affine_transform(joints_3d[i, 0:2, 0], t)
+    return joints_3d
+
+
+def loop_uvd_target_generator(self, joints_3d, num_joints, patch_height, patch_width):
+    target_weight = np.ones((num_joints, 3), dtype=np.float32)
+    target_weight[:, 0] = joints_3d[:, 0, 1]
+    target_weight[:, 1] = joints_3d[:, 0, 1]
+    target_weight[:, 2] = joints_3d[:, 0, 1]
+
+    target = np.zeros((num_joints, 3), dtype=np.float32)
+    target[:, 0] = joints_3d[:, 0, 0] / patch_width - 0.5
+    target[:, 1] = joints_3d[:, 1, 0] / patch_height - 0.5
+    target[:, 2] = joints_3d[:, 2, 0] / self.bbox_3d_shape[2]
+    return target.reshape((-1)), target_weight.reshape((-1))
+
+
+def loop_xyz_target_generator(self, joints_3d, joints_3d_vis, num_joints):
+    target_weight = np.ones((num_joints, 3), dtype=np.float32)
+    target_weight[:, 0] = joints_3d_vis[:, 0]
+    target_weight[:, 1] = joints_3d_vis[:, 1]
+    target_weight[:, 2] = joints_3d_vis[:, 2]
+
+    target = np.zeros((num_joints, 3), dtype=np.float32)
+    target[:, 0] = joints_3d[:, 0] / self.bbox_3d_shape[0]
+    target[:, 1] = joints_3d[:, 1] / self.bbox_3d_shape[1]
+    target[:, 2] = joints_3d[:, 2] / self.bbox_3d_shape[2]
+    return target.reshape((-1)), target_weight.reshape((-1))
+
+
+LOOP_FUNCTIONS = {
+    'flip_joints_3d': loop_flip_joints_3d,
+    'flip_cam_xyz_joints_3d': loop_flip_cam_xyz_joints_3d,
+    'flip_thetas': loop_flip_thetas,
+    'flip_twist': loop_flip_twist,
+    'affine_transform_joints_3d': loop_affine_transform_joints_3d,
+}
+LOOP_METHODS = {
+    '_integral_uvd_target_generator': loop_uvd_target_generator,
+    '_integral_xyz_target_generator': loop_xyz_target_generator,
+}
+
+
+def timeit(fn, iters):
+    fn()
+    tic = time.perf_counter()
+    for _ in range(iters):
+        fn()
+    return (time.perf_counter() - tic) / iters
+
+
+def check_equal(a, b, name):
+    for x, y in zip(a if isinstance(a, tuple) else (a,), b if isinstance(b, tuple) else (b,)):
+        assert x.dtype == y.dtype and np.array_equal(x, y), f'{name} differs from the per-joint loop'
+
+
+rng = np.random.RandomState(0)
+trans = cv2.getAffineTransform(np.float32([[0, 0], [400, 0], [0, 400]]), np.float32([[3, 5], [250, 40], [-30, 240]]))
+
+print('label functions, us per call (per-joint loop -> vectorized)')
+for num_joints, pairs in ((29, JOINT_PAIRS_29), (71, JOINT_PAIRS_71), (127, JOINT_PAIRS_127)):
+    joints = rng.randn(num_joints, 3, 2).astype(np.float32) * 300
+    joints[:, :, 1] = rng.rand(num_joints, 3) > 0.2
+    xyz = rng.randn(num_joints, 3)
+    twist = (rng.randn(num_joints - 1, 2), np.ones((num_joints - 1, 2)))
+
+    calls = {
+        'flip_joints_3d': (joints, 1000, pairs),
+        'flip_cam_xyz_joints_3d': (xyz, pairs),
+        'flip_thetas': (xyz, pairs),
+        'flip_twist': twist + (pairs,),
+        'affine_transform_joints_3d': (joints, trans),
+    }
+    cols = []
+    for name, args in calls.items():
+        fn = getattr(transforms, name)
+        if name == 'affine_transform_joints_3d':
+            # in place, run on copies
+            check_equal(LOOP_FUNCTIONS[name](joints.copy(), trans), fn(joints.copy(), trans), name)
+            before = timeit(lambda: LOOP_FUNCTIONS[name](joints.copy(), trans), opt.iters)
+            after = timeit(lambda: fn(joints.copy(), trans), opt.iters)
+        else:
+            check_equal(LOOP_FUNCTIONS[name](*args), fn(*args), name)
+            before = timeit(lambda: LOOP_FUNCTIONS[name](*args), opt.iters)
+            after = timeit(lambda: fn(*args), opt.iters)
+        cols.append(f'{name} {before * 1e6:6.1f} -> {after * 1e6:5.1f}')
+    print(f'{num_joints:3d} joints | ' + ' | '.join(cols))
+
+# full SimpleTransform3DSMPLCam samples with synthetic labels
+dataset = edict(
+    joint_pairs_17=JOINT_PAIRS_17, joint_pairs_24=JOINT_PAIRS_24, joint_pairs_29=JOINT_PAIRS_29,
+    bbox_3d_shape=(2.2, 2.2, 2.2), num_joints_half_body=8, prob_half_body=0.3,
+    upper_body_ids=tuple(range(7, 17)), lower_body_ids=tuple(range(7)))
+transformation = SimpleTransform3DSMPLCam(
+    dataset, scale_factor=0.3, color_factor=0.2, occlusion=True, input_size=(256, 256), output_size=(64, 64),
+    depth_dim=64, bbox_3d_shape=(2.2, 2.2, 2.2), rot=30, sigma=2, train=True, add_dpg=False,
+    loss_type='L1LossDimSMPLCam')
+
+size = opt.img_size
+img = cv2.resize((rng.rand(size // 8, size // 8, 3) * 255).astype(np.uint8), (size, size))
+samples = []
+for _ in range(8):
+    x0, y0 = size * (0.2 + 0.2 * rng.rand()), size * (0.1 + 0.1 * rng.rand())
+    bw, bh = size * 0.3, size * 0.6
+    samples.append(dict(
+        bbox=np.array([x0, y0, x0 + bw, y0 + bh]),
+        joint_img_17=np.stack([x0 + rng.rand(17) * bw, y0 + rng.rand(17) * bh, rng.randn(17)], 1),
+        joint_relative_17=rng.randn(17, 3), joint_cam_17=rng.randn(17, 3), joint_vis_17=np.ones((17, 3)),
+        joint_img_29=np.stack([x0 + rng.rand(29) * bw, y0 + rng.rand(29) * bh, rng.randn(29)], 1),
+        joint_cam_29=rng.randn(29, 3), joint_vis_29=np.ones((29, 3)),
+        f=np.array([1000., 1000.]), c=np.array([size / 2, size / 2]), root_cam=np.array([0, 0, 5.]),
+        beta=rng.randn(10), theta=rng.randn(24, 3) * 0.3, twist_phi=rng.randn(23, 2), twist_weight=np.ones((23, 2))))
+
+
+def run_samples():
+    random.seed(0)
+    np.random.seed(0)
+    outputs = [transformation(img.copy(), samples[i % len(samples)]) for i in range(opt.samples)]
+    return outputs
+
+
+VECTORIZED = {name: getattr(simple_transform_3d_smpl_cam, name) for name in LOOP_FUNCTIONS
+              if hasattr(simple_transform_3d_smpl_cam, name)}
+
+
+def use_loops(loops):
+    for name, fn in VECTORIZED.items():
+        setattr(simple_transform_3d_smpl_cam, name, LOOP_FUNCTIONS[name] if loops else fn)
+    for name, method in LOOP_METHODS.items():
+        if loops:
+            setattr(transformation, name, method.__get__(transformation))
+        elif name in transformation.__dict__:
+            delattr(transformation, name)
+
+
+# alternate the two versions, keep the fastest round of each
+times = {True: [], False: []}
+outputs = {}
+for _ in range(3):
+    for loops in (True, False):
+        use_loops(loops)
+        tic = time.perf_counter()
+        outputs[loops] = run_samples()
+        times[loops].append((time.perf_counter() - tic) / opt.samples)
+use_loops(False)
+
+for out, loop_out in zip(outputs[False], outputs[True]):
+    for k, v in out.items():
+        if hasattr(v, 'numpy'):
+            assert np.array_equal(v.numpy(), loop_out[k].numpy(), equal_nan=True), f'{k} differs from the per-joint loops'
+
+print(f'SimpleTransform3DSMPLCam ({size}x{size} images): '
+      f'{min(times[True]) * 1e3:.2f} ms -> {min(times[False]) * 1e3:.2f} ms per sample, outputs identical')
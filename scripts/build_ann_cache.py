@@ -0,0 +1,46 @@
+"""Build the annotation caches of the datasets of a training config."""
+import argparse
+import os
+import time
+
+from hybrik.datasets import PW3D, MixDataset, MixDataset2Cam, MixDatasetCam
+from hybrik.utils.config import update_config
+
+MIX_DATASETS = {
+    'mix_smpl': MixDataset,
+    'mix_smpl_cam': MixDatasetCam,
+    'mix2_smpl_cam': MixDataset2Cam,
+}
+
+parser = argparse.ArgumentParser(description='HybrIK Annotation Cache')
+parser.add_argument('--cfg',
+                    help='experiment configure file name',
+                    required=True,
+                    type=str)
+parser.add_argument('--workers',
+                    help='annotation parsing processes',
+                    default=os.cpu_count(),
+                    type=int)
+parser.add_argument('--skip-val', default=False, dest='skip_val',
+                    help='only build the training splits', action='store_true')
+
+opt = parser.parse_args()
+cfg = update_config(opt.cfg)
+cfg.DATASET.CACHE_WORKERS = opt.workers
+
+assert cfg.DATASET.DATASET in MIX_DATASETS, f'Unsupported dataset {cfg.DATASET.DATASET}'
+train_dataset = MIX_DATASETS[cfg.DATASET.DATASET]
+val_dataset = MixDatasetCam if cfg.DATASET.DATASET == 'mix2_smpl_cam' else train_dataset
+
+# the splits train_smpl.py and train_smpl_cam.py load
+splits = [('train', lambda: train_dataset(cfg=cfg, train=True)._subsets)]
+if not opt.skip_val:
+    splits.append(('val', lambda: val_dataset(cfg=cfg, train=False)._subsets))
+    splits.append(('val', lambda: [PW3D(cfg=cfg, ann_file='3DPW_test_new.json', train=False)]))
+
+# unchanged splits only hash their sources, changed ones are parsed again
+for name, build_fn in splits:
+    tic = time.time()
+    for dataset in build_fn():
+        print(f'[{name}] {type(dataset).__name__}: {len(dataset)} samples in {dataset.db.store_dir}')
+    print(f'[{name}] done in {time.time() - tic:.1f}s')
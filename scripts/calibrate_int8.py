@@ -0,0 +1,94 @@
+"""Calibrate an INT8 backbone for CPU inference."""
+import argparse
+
+import torch
+from hybrik.datasets import HP3D, PW3D
+from hybrik.models import builder
+from hybrik.utils.config import update_config
+from hybrik.utils.quantization import (INT8_BACKENDS, convert_backbone_int8,
+                                       prepare_backbone_int8, save_backbone_int8)
+from tqdm import tqdm
+
+parser = argparse.ArgumentParser(description='HybrIK INT8 Calibration')
+parser.add_argument('--cfg',
+                    help='experiment configure file name',
+                    required=True,
+                    type=str)
+parser.add_argument('--checkpoint',
+                    help='fp32 checkpoint file name',
+                    required=True,
+                    type=str)
+parser.add_argument('--out',
+                    help='output INT8 checkpoint, used by validate_smpl_cam.py --int8',
+                    default='./pretrained_models/hybrik_hrnet_int8.pth',
+                    type=str)
+parser.add_argument('--dataset',
+                    help='calibration images',
+                    default='pw3d',
+                    choices=['pw3d', 'hp3d', 'both'],
+                    type=str)
+parser.add_argument('--num-batches',
+                    help='number of calibration batches',
+                    default=32,
+                    type=int)
+parser.add_argument('--batch',
+                    help='calibration batch size',
+                    default=16,
+                    type=int)
+parser.add_argument('--backend',
+                    help='quantized engine, x86/fbgemm for x86 CPUs, qnnpack for ARM',
+                    default='x86',
+                    choices=INT8_BACKENDS,
+                    type=str)
+parser.add_argument('--flip-test',
+                    default=False,
+                    dest='flip_test',
+                    help='calibrate on the flipped images as well',
+                    action='store_true')
+parser.add_argument('--seed', default=0, type=int,
+                    help='seed of the calibration subset')
+
+opt = parser.parse_args()
+cfg = update_config(opt.cfg)
+
+m = builder.build_sppe(cfg.MODEL)
+
+print(f'Loading model from {opt.checkpoint}...')
+save_dict = torch.load(opt.checkpoint, map_location='cpu')
+if type(save_dict) == dict:
+    model_dict = save_dict['model']
+    m.load_state_dict(model_dict, strict=False)
+else:
+    m.load_state_dict(save_dict, strict=False)
+m.eval()
+
+calib_datasets = []
+if opt.dataset in ('pw3d', 'both'):
+    calib_datasets.append(PW3D(
+        cfg=cfg,
+        ann_file='3DPW_test_new.json',
+        train=False))
+if opt.dataset in ('hp3d', 'both'):
+    calib_datasets.append(HP3D(
+        cfg=cfg,
+        ann_file='test',
+        train=False))
+calib_dataset = torch.utils.data.ConcatDataset(calib_datasets)
+
+# a random subset, consecutive frames of one sequence are nearly identical
+calib_loader = torch.utils.data.DataLoader(
+    calib_dataset, batch_size=opt.batch, shuffle=True, num_workers=5, drop_last=False,
+    generator=torch.Generator().manual_seed(opt.seed))
+
+input_h, input_w = cfg.MODEL.IMAGE_SIZE
+prepare_backbone_int8(m, torch.randn(1, 3, input_h, input_w), backend=opt.backend)
+
+with torch.no_grad():
+    for i, (inps, labels, img_ids, bboxes) in enumerate(tqdm(calib_loader, total=opt.num_batches, dynamic_ncols=True)):
+        if i >= opt.num_batches:
+            break
+        m(inps, flip_test=opt.flip_test, bboxes=bboxes, img_center=labels['img_center'])
+
+convert_backbone_int8(m)
+save_backbone_int8(m, opt.out)
+print(f'Saved INT8 model ({opt.backend}) to {opt.out}')
@@ -0,0 +1,115 @@
+"""Check batch_procrustes_rotmat against the det-corrected SVD it replaced."""
+import argparse
+
+import torch
+from hybrik.models.layers.smpl.lbs import batch_get_pelvis_orient_svd, batch_procrustes_rotmat
+
+parser = argparse.ArgumentParser(description='HybrIK Procrustes Parity Check')
+parser.add_argument('--samples',
+                    help='random covariances per case',
+                    default=10000,
+                    type=int)
+parser.add_argument('--atol',
+                    help='allowed max abs difference of the rotations beyond twice that of the float32 SVD',
+                    default=1e-5,
+                    type=float)
+parser.add_argument('--seed',
+                    default=0,
+                    type=int)
+
+opt = parser.parse_args()
+
+
+def svd_rotmat(S):
+    # the former solution of batch_get_pelvis_orient_svd / batch_get_3children_orient_svd
+    U, _, V = torch.svd(S)
+    det_u_v = torch.det(torch.bmm(V, U.transpose(1, 2)))
+    det_modify_mat = torch.eye(3, dtype=U.dtype).unsqueeze(0).expand(U.shape[0], -1, -1).clone()
+    det_modify_mat[:, 2, 2] = det_u_v
+    return torch.bmm(torch.bmm(V, det_modify_mat), U.transpose(1, 2))
+
+
+def random_rotmat(n):
+    quat = torch.nn.functional.normalize(torch.randn(n, 4, dtype=torch.float64), dim=1)
+    w, x, y, z = quat.unbind(dim=1)
+    return torch.stack([
+        1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y),
+        2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x),
+        2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)
+    ], dim=1).view(n, 3, 3)
+
+
+def covariance(rest, target):
+    # rest, target: (B, 3, K) column vectors, as built by the IK
+    return rest.bmm(target.transpose(1, 2))
+
+
+def check_rotation(rot_mat, name):
+    rot_mat = rot_mat.double()
+    ident = torch.eye(3, dtype=rot_mat.dtype).expand_as(rot_mat)
+    assert not torch.isnan(rot_mat).any(), f'{name}: NaN rotation'
+    orth_err = (rot_mat.bmm(rot_mat.transpose(1, 2)) - ident).abs().max().item()
+    det_err = (torch.det(rot_mat) - 1).abs().max().item()
+    assert orth_err < 1e-5 and det_err < 1e-5, f'{name}: not a rotation ({orth_err:.1e}, {det_err:.1e})'
+
+
+def objective(rot_mat, S):
+    # sum of target . (R rest), maximized by the Procrustes solution
+    return torch.einsum('bij,bji->b', rot_mat.double(), S.double())
+
+
+def compare(S, name, unique=True):
+    # float64 reference, float32 inputs for both solvers
+    ref = svd_rotmat(S.double())
+    S = S.float()
+    rot_mat = batch_procrustes_rotmat(S)
+    check_rotation(rot_mat, name)
+
+    obj_ref, obj = objective(ref, S), objective(rot_mat, S)
+    obj_err = ((obj_ref - obj) / obj_ref.abs().clamp(min=1)).abs().max().item()
+    assert obj_err < 1e-5, f'{name}: objective differs by {obj_err:.1e}'
+
+    if unique:
+        # the float32 rounding of S alone moves ill-conditioned solutions,
+        # so the error is bounded by the one of the float32 SVD
+        err = (rot_mat.double() - ref).abs().max().item()
+        svd_err = (svd_rotmat(S).double() - ref).abs().max().item()
+        assert err < 2 * svd_err + opt.atol, f'{name}: max abs error {err:.1e} (float32 SVD: {svd_err:.1e})'
+        print(f'{name:<28} max abs error {err:.1e} (float32 SVD: {svd_err:.1e}) | objective {obj_err:.1e}')
+    else:
+        # the optimum is not unique, only its value is compared
+        print(f'{name:<28} objective {obj_err:.1e}')
+
+
+torch.manual_seed(opt.seed)
+n = opt.samples
+
+# three children of a joint, noisy targets
+rest = torch.randn(n, 3, 3, dtype=torch.float64)
+rot = random_rotmat(n)
+target = rot.bmm(rest) + 0.05 * torch.randn(n, 3, 3, dtype=torch.float64)
+compare(covariance(rest, target), 'three vectors, noisy')
+
+# reflected targets, where the det correction flips the smallest axis
+mirror = torch.diag(torch.tensor([1., 1., -1.], dtype=torch.float64)).expand(n, -1, -1)
+target = rot.bmm(mirror).bmm(rest) + 0.01 * torch.randn(n, 3, 3, dtype=torch.float64)
+compare(covariance(rest, target), 'three vectors, reflected')
+
+# coplanar vectors, rank 2: still a unique rotation
+rest_planar = rest.clone()
+rest_planar[:, :, 2] = rest[:, :, 0] - 0.5 * rest[:, :, 1]
+target = rot.bmm(rest_planar)
+compare(covariance(rest_planar, target), 'coplanar vectors, rank 2')
+
+# a single bone, rank 1: any rotation about it is optimal
+rest_line = rest[:, :, :1]
+target = rot.bmm(rest_line)
+compare(covariance(rest_line, target), 'one vector, rank 1', unique=False)
+
+# zero covariance: any rotation for the solver, identity for the IK
+S = torch.zeros(4, 3, 3)
+check_rotation(batch_procrustes_rotmat(S), 'zero covariance')
+zero_skeleton = torch.zeros(4, 24, 3, 1)
+rot_mat = batch_get_pelvis_orient_svd(zero_skeleton, torch.randn(4, 24, 3, 1), [1, 2, 3], torch.float32)
+assert torch.equal(rot_mat, torch.eye(3).expand(4, -1, -1)), 'zero skeleton: pelvis is not the identity'
+print(f'{"zero covariance":<28} proper rotation, pelvis falls back to the identity')
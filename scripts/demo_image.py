@@ -12,7 +12,6 @@ from hybrik.utils.presets import SimpleTransform3DSMPLCam
 from hybrik.utils.render_pytorch3d import render_mesh
 from hybrik.utils.vis import get_one_box
 from torchvision import transforms as T
-from torchvision.models.detection import fasterrcnn_resnet50_fpn
 from tqdm import tqdm
 
 det_transform = T.Compose([T.ToTensor()])
@@ -42,6 +41,23 @@ parser.add_argument('--out-dir',
                     help='output folder',
                     default='',
                     type=str)
+parser.add_argument('--detector',
+                    help='person detector backend',
+                    default='FasterRCNN',
+                    choices=list(builder.DETECTOR.module_dict.keys()),
+                    type=str)
+parser.add_argument('--det-weights',
+                    help='local detector checkpoint, no download if given (torchvision backends)',
+                    default='',
+                    type=str)
+parser.add_argument('--det-file',
+                    help='.json or MOT .txt box file (PrecomputedBoxes)',
+                    default='',
+                    type=str)
+parser.add_argument('--det-box',
+                    help='x1,y1,x2,y2 person box, full frame if empty (FixedBox)',
+                    default='',
+                    type=str)
 opt = parser.parse_args()
 
 
@@ -72,7 +88,11 @@ transformation = SimpleTransform3DSMPLCam(
     train=False, add_dpg=False,
     loss_type=cfg.LOSS['TYPE'])
 
-det_model = fasterrcnn_resnet50_fpn(pretrained=True)
+det_model = builder.build_detector(edict(
+    TYPE=opt.detector,
+    WEIGHTS=opt.det_weights,
+    BOX_FILE=opt.det_file,
+    BOX=[float(v) for v in opt.det_box.split(',')] if opt.det_box else None))
 
 hybrik_model = builder.build_sppe(cfg.MODEL)
 
@@ -109,7 +129,7 @@ for file in tqdm(files):
         # Run Detection
         input_image = cv2.cvtColor(cv2.imread(img_path), cv2.COLOR_BGR2RGB)
         det_input = det_transform(input_image).to(opt.gpu)
-        det_output = det_model([det_input])[0]
+        det_output = det_model([det_input], frame_ids=[file])[0]
 
         tight_bbox = get_one_box(det_output)  # xyxy
 
@@ -1,6 +1,8 @@
 """Image demo script."""
 import argparse
+import itertools
 import os
+import time
 import pickle as pk
 import json
 
@@ -9,14 +11,15 @@ import numpy as np
 import torch
 from easydict import EasyDict as edict
 from torchvision import transforms as T
-from torchvision.models.detection import fasterrcnn_resnet50_fpn
 from tqdm import tqdm
 
 from hybrik.models import builder
 from hybrik.utils.config import update_config
 from hybrik.utils.presets import SimpleTransform3DSMPLCam
 from hybrik.utils.render_pytorch3d import render_mesh
-from hybrik.utils.vis import get_max_iou_box, get_one_box, vis_2d
+from hybrik.utils.tracking import BoxTracker
+from hybrik.utils.video import FrameWriterPool, StageMeter, read_video_frames
+from hybrik.utils.vis import get_all_boxes, get_keypoint_box, get_max_iou_box, get_one_box, vis_2d
 
 det_transform = T.Compose([T.ToTensor()])
 
@@ -59,6 +62,14 @@ def recognize_video_ext(ext=''):
         return cv2.VideoWriter_fourcc(*'mp4v'), '.mp4'
 
 
+def split_pose_output(pose_output, batch_size):
+    ''' Split a batched HybrIK output into per-frame outputs of batch size 1. '''
+    return [
+        edict({k: v[i:i + 1] for k, v in pose_output.items()})
+        for i in range(batch_size)
+    ]
+
+
 parser = argparse.ArgumentParser(description='HybrIK Demo')
 
 parser.add_argument('--gpu',
@@ -83,6 +94,55 @@ parser.add_argument('--save-img', default=False, dest='save_img',
                     help='save prediction', action='store_true')
 parser.add_argument('--save-json', default=False, dest='save_json',
                     help='save prediction as JSON', action='store_true')
+parser.add_argument('--prefetch',
+                    help='number of frames decoded ahead in a background thread (0 to disable)',
+                    default=0,
+                    type=int)
+parser.add_argument('--render-workers',
+                    help='number of threads rendering and encoding results (0 to run inline)',
+                    default=2,
+                    type=int)
+parser.add_argument('--batch-size',
+                    help='number of frames per detection/HybrIK batch',
+                    default=1,
+                    type=int)
+parser.add_argument('--multi-person', default=False, dest='multi_person',
+                    help='run HybrIK on every confident person instead of tracking one', action='store_true')
+parser.add_argument('--det-thresh',
+                    help='detection score threshold of --multi-person',
+                    default=0.9,
+                    type=float)
+parser.add_argument('--max-people',
+                    help='maximum number of people per frame with --multi-person (0 for no limit)',
+                    default=0,
+                    type=int)
+parser.add_argument('--det-interval',
+                    help='run the detector every N frames and propagate the boxes from the HybrIK keypoints '
+                         'in between (1 to detect on every frame)',
+                    default=1,
+                    type=int)
+parser.add_argument('--track-thresh',
+                    help='detect again on the next frame when the mean joint score falls below this, '
+                         'with --det-interval > 1',
+                    default=0.8,
+                    type=float)
+parser.add_argument('--detector',
+                    help='person detector backend',
+                    default='FasterRCNN',
+                    choices=list(builder.DETECTOR.module_dict.keys()),
+                    type=str)
+parser.add_argument('--det-weights',
+                    help='local detector checkpoint, no download if given (torchvision backends)',
+                    default='',
+                    type=str)
+parser.add_argument('--det-file',
+                    help='.json or MOT .txt box file (PrecomputedBoxes)',
+                    default='',
+                    type=str)
+parser.add_argument('--det-box',
+                    help='x1,y1,x2,y2 person box, full frame if empty (FixedBox)',
+                    default='',
+                    type=str)
 
 
 opt = parser.parse_args()
@@ -119,7 +179,9 @@ res_keys = [
     'bbox',
     'height',
     'width',
-    'img_path'
+    'img_path',
+    'frame_idx',
+    'person_idx'
 ]
 res_db = {k: [] for k in res_keys}
 
@@ -148,7 +210,11 @@ transformation = SimpleTransform3DSMPLCam(
     train=False, add_dpg=False,
     loss_type=cfg.LOSS['TYPE'])
 
-det_model = fasterrcnn_resnet50_fpn(pretrained=True)
+det_model = builder.build_detector(edict(
+    TYPE=opt.detector,
+    WEIGHTS=opt.det_weights,
+    BOX_FILE=opt.det_file,
+    BOX=[float(v) for v in opt.det_box.split(',')] if opt.det_box else None))
 
 hybrik_model = builder.build_sppe(cfg.MODEL)
 
@@ -165,19 +231,16 @@ hybrik_model.cuda(opt.gpu)
 det_model.eval()
 hybrik_model.eval()
 
-print('### Extract Image...')
 video_basename = os.path.basename(opt.video_name).split('.')[0]
 
 if not os.path.exists(opt.out_dir):
     os.makedirs(opt.out_dir)
-if not os.path.exists(os.path.join(opt.out_dir, 'raw_images')):
-    os.makedirs(os.path.join(opt.out_dir, 'raw_images'))
 if not os.path.exists(os.path.join(opt.out_dir, 'res_images')) and opt.save_img:
     os.makedirs(os.path.join(opt.out_dir, 'res_images'))
 if not os.path.exists(os.path.join(opt.out_dir, 'res_2d_images')) and opt.save_img:
     os.makedirs(os.path.join(opt.out_dir, 'res_2d_images'))
 
-_, info, _ = get_video_info(opt.video_name)
+_, info, datalen = get_video_info(opt.video_name)
 video_basename = os.path.basename(opt.video_name).split('.')[0]
 
 # JSON 데이터에 비디오 정보 추가 (taiji_keypoints.json 형식에 맞춤)
@@ -209,174 +272,312 @@ if not write_stream.isOpened():
 assert write_stream.isOpened(), 'Cannot open video for writing'
 assert write2d_stream.isOpened(), 'Cannot open video for writing'
 
-os.system(f'ffmpeg -i {opt.video_name} {opt.out_dir}/raw_images/{video_basename}-%06d.png')
+prev_box = None
+tracker = BoxTracker()
+# keyframe mode state, boxes of the next frame from the last keypoints
+prop_bboxes = []
+need_det = True
+frames_since_det = 0
+renderer = None
+smpl_faces = torch.from_numpy(hybrik_model.smpl.faces.astype(np.int32))
 
 
-files = os.listdir(f'{opt.out_dir}/raw_images')
-files.sort()
+def render_frame(input_image, tight_bboxes, bbox_xywhs, vertices, transl, uv_29, focal, idx):
+    # Visualization
+    image = input_image.copy()
 
-img_path_list = []
+    # every person goes into one scene mesh
+    num_people, num_verts = vertices.shape[:2]
+    verts_batch = (vertices + transl[:, None, :]).reshape(1, -1, 3)
+    faces = torch.cat([smpl_faces + i * num_verts for i in range(num_people)], dim=0)
+    transl_batch = torch.zeros_like(transl[:1])
 
-for file in tqdm(files):
-    if not os.path.isdir(file) and file[-4:] in ['.jpg', '.png']:
+    color_batch = render_mesh(
+        vertices=verts_batch, faces=faces,
+        translation=transl_batch,
+        focal_length=focal, height=image.shape[0], width=image.shape[1])
 
-        img_path = os.path.join(opt.out_dir, 'raw_images', file)
-        img_path_list.append(img_path)
+    valid_mask_batch = (color_batch[:, :, :, [-1]] > 0)
+    image_vis_batch = color_batch[:, :, :, :3] * valid_mask_batch
+    image_vis_batch = (image_vis_batch * 255).cpu().numpy()
 
-prev_box = None
-renderer = None
-smpl_faces = torch.from_numpy(hybrik_model.smpl.faces.astype(np.int32))
+    color = image_vis_batch[0]
+    valid_mask = valid_mask_batch[0].cpu().numpy()
+    input_img = image
+    alpha = 0.9
+    image_vis = alpha * color[:, :, :3] * valid_mask + (
+        1 - alpha) * input_img * valid_mask + (1 - valid_mask) * input_img
+
+    image_vis = image_vis.astype(np.uint8)
+    image_vis = cv2.cvtColor(image_vis, cv2.COLOR_RGB2BGR)
+
+    if opt.save_img:
+        res_path = os.path.join(opt.out_dir, 'res_images', f'image-{idx:06d}.jpg')
+        cv2.imwrite(res_path, image_vis)
+
+    # vis 2d
+    bbox_img = input_image.copy()
+    for tight_bbox, bbox_xywh, pts in zip(tight_bboxes, bbox_xywhs, uv_29):
+        pts = pts * bbox_xywh[2]
+        pts[:, 0] = pts[:, 0] + bbox_xywh[0]
+        pts[:, 1] = pts[:, 1] + bbox_xywh[1]
+        bbox_img = vis_2d(np.array(bbox_img), tight_bbox, pts)
+    bbox_img = cv2.cvtColor(bbox_img, cv2.COLOR_RGB2BGR)
+
+    if opt.save_img:
+        res_path = os.path.join(
+            opt.out_dir, 'res_2d_images', f'image-{idx:06d}.jpg')
+        cv2.imwrite(res_path, bbox_img)
+
+    return image_vis, bbox_img
+
+
+def write_frame(result):
+    image_vis, bbox_img = result
+    write_stream.write(image_vis)
+    write2d_stream.write(bbox_img)
+
+
+decode_meter = StageMeter('decode')
+infer_meter = StageMeter('infer')
+writer_pool = FrameWriterPool(
+    render_frame, write_frame,
+    num_workers=opt.render_workers, max_pending=2 * max(opt.render_workers, opt.batch_size))
 
 print('### Run Model...')
 idx = 0
-for img_path in tqdm(img_path_list):
-    dirname = os.path.dirname(img_path)
-    basename = os.path.basename(img_path)
+frame_iter = enumerate(
+    read_video_frames(opt.video_name, prefetch=opt.prefetch, meter=decode_meter), start=1)
+pbar = tqdm(total=datalen)
+start_time = time.perf_counter()
+while True:
+    decoded_batch = list(itertools.islice(frame_iter, opt.batch_size))
+    if len(decoded_batch) == 0:
+        break
+    pbar.update(len(decoded_batch))
+    infer_start = time.perf_counter()
+
+    # Frames are decoded in memory; the path keeps the old ffmpeg naming to identify frames
+    frame_idx_batch = [frame_idx for frame_idx, _ in decoded_batch]
+    img_path_batch = [
+        os.path.join(opt.out_dir, 'raw_images', f'{video_basename}-{frame_idx:06d}.png')
+        for frame_idx, _ in decoded_batch]
 
     with torch.no_grad():
-        # Run Detection
-        input_image = cv2.cvtColor(cv2.imread(img_path), cv2.COLOR_BGR2RGB)
-        det_input = det_transform(input_image).to(opt.gpu)
-        det_output = det_model([det_input])[0]
+        # Keyframes: the detector runs every --det-interval frames, or when tracking was lost.
+        # The scheduled ones of the batch are detected together
+        is_planned, lost, since_det = [], need_det, frames_since_det
+        for _ in decoded_batch:
+            is_key = opt.det_interval <= 1 or lost or since_det >= opt.det_interval
+            if is_key:
+                lost, since_det = False, 0
+            since_det += 1
+            is_planned.append(is_key)
 
-        if prev_box is None:
-            tight_bbox = get_one_box(det_output)  # xyxy
-            if tight_bbox is None:
+        # Run Detection
+        input_images = [cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) for _, frame in decoded_batch]
+        det_inputs = [
+            det_transform(input_image).to(opt.gpu)
+            for input_image, is_key in zip(input_images, is_planned) if is_key]
+        det_frame_ids = [frame_idx for frame_idx, is_key in zip(frame_idx_batch, is_planned) if is_key]
+        det_outputs = iter(det_model(det_inputs, frame_ids=det_frame_ids) if len(det_inputs) > 0 else [])
+
+        # Box tracking stays sequential: each frame depends on the previous box
+        frame_batch = []
+        for frame_idx, img_path, input_image, is_planned_key in zip(
+                frame_idx_batch, img_path_batch, input_images, is_planned):
+            is_key = is_planned_key or need_det or frames_since_det >= opt.det_interval
+            if is_key:
+                need_det, frames_since_det = False, 0
+                if is_planned_key:
+                    det_output = next(det_outputs)
+                else:
+                    # tracking was lost within the batch, detect this frame on its own
+                    det_output = det_model(
+                        [det_transform(input_image).to(opt.gpu)], frame_ids=[frame_idx])[0]
+            frames_since_det += 1
+
+            if not is_key:
+                # no detection, reuse the boxes propagated from the last keypoints
+                tight_bboxes = prop_bboxes
+            elif opt.multi_person:
+                tight_bboxes = get_all_boxes(det_output, thrd=opt.det_thresh, max_num=opt.max_people)  # xyxy
+            elif prev_box is None:
+                tight_bbox = get_one_box(det_output)  # xyxy
+                tight_bboxes = [] if tight_bbox is None else [tight_bbox]
+            else:
+                tight_bboxes = [get_max_iou_box(det_output, prev_box)]  # xyxy
+            prop_bboxes = tight_bboxes
+
+            if opt.multi_person:
+                person_ids = tracker.update(tight_bboxes)
+            if len(tight_bboxes) == 0:
+                need_det = True
                 continue
-        else:
-            tight_bbox = get_max_iou_box(det_output, prev_box)  # xyxy
+            if not opt.multi_person:
+                prev_box = tight_bboxes[0]
+                person_ids = [0]
+            frame_batch.append((frame_idx, img_path, input_image, tight_bboxes, person_ids))
 
-        prev_box = tight_bbox
+        if len(frame_batch) == 0:
+            infer_meter.update(time.perf_counter() - infer_start, n=len(decoded_batch))
+            continue
 
-        # Run HybrIK
+        # Run HybrIK on every person of every frame in one batch
         # bbox: [x1, y1, x2, y2]
-        pose_input, bbox, img_center = transformation.test_transform(
-            input_image, tight_bbox)
-        pose_input = pose_input.to(opt.gpu)[None, :, :, :]
-        pose_output = hybrik_model(
+        pose_inputs, bboxes, img_centers = [], [], []
+        for _, _, input_image, tight_bboxes, _ in frame_batch:
+            for tight_bbox in tight_bboxes:
+                pose_input, bbox, img_center = transformation.test_transform(
+                    input_image, tight_bbox)
+                pose_inputs.append(pose_input)
+                bboxes.append(bbox)
+                img_centers.append(img_center)
+
+        pose_input = torch.stack(pose_inputs, dim=0).to(opt.gpu)
+        batch_output = hybrik_model(
             pose_input, flip_test=True,
-            bboxes=torch.from_numpy(np.array(bbox)).to(pose_input.device).unsqueeze(0).float(),
-            img_center=torch.from_numpy(img_center).to(pose_input.device).unsqueeze(0).float()
+            bboxes=torch.from_numpy(np.array(bboxes)).to(pose_input.device).float(),
+            img_center=torch.from_numpy(np.stack(img_centers)).to(pose_input.device).float()
         )
-        uv_29 = pose_output.pred_uvd_jts.reshape(29, 3)[:, :2]
-        transl = pose_output.transl.detach()
-
-        # Visualization
-        image = input_image.copy()
-        focal = 1000.0
-        bbox_xywh = xyxy2xywh(bbox)
-        transl_camsys = transl.clone()
-        transl_camsys = transl_camsys * 256 / bbox_xywh[2]
-
-        focal = focal / 256 * bbox_xywh[2]
-
-        vertices = pose_output.pred_vertices.detach()
-
-        verts_batch = vertices
-        transl_batch = transl
-
-        color_batch = render_mesh(
-            vertices=verts_batch, faces=smpl_faces,
-            translation=transl_batch,
-            focal_length=focal, height=image.shape[0], width=image.shape[1])
-
-        valid_mask_batch = (color_batch[:, :, :, [-1]] > 0)
-        image_vis_batch = color_batch[:, :, :, :3] * valid_mask_batch
-        image_vis_batch = (image_vis_batch * 255).cpu().numpy()
-
-        color = image_vis_batch[0]
-        valid_mask = valid_mask_batch[0].cpu().numpy()
-        input_img = image
-        alpha = 0.9
-        image_vis = alpha * color[:, :, :3] * valid_mask + (
-            1 - alpha) * input_img * valid_mask + (1 - valid_mask) * input_img
-
-        image_vis = image_vis.astype(np.uint8)
-        image_vis = cv2.cvtColor(image_vis, cv2.COLOR_RGB2BGR)
-
-        if opt.save_img:
-            idx += 1
-            res_path = os.path.join(opt.out_dir, 'res_images', f'image-{idx:06d}.jpg')
-            cv2.imwrite(res_path, image_vis)
-        write_stream.write(image_vis)
-
-        # vis 2d
-        pts = uv_29 * bbox_xywh[2]
-        pts[:, 0] = pts[:, 0] + bbox_xywh[0]
-        pts[:, 1] = pts[:, 1] + bbox_xywh[1]
-        image = input_image.copy()
-        bbox_img = vis_2d(image, tight_bbox, pts)
-        bbox_img = cv2.cvtColor(bbox_img, cv2.COLOR_RGB2BGR)
-        write2d_stream.write(bbox_img)
-
-        if opt.save_img:
-            res_path = os.path.join(
-                opt.out_dir, 'res_2d_images', f'image-{idx:06d}.jpg')
-            cv2.imwrite(res_path, bbox_img)
-
-        if opt.save_pk:
-            assert pose_input.shape[0] == 1, 'Only support single batch inference for now'
-
-            pred_xyz_jts_17 = pose_output.pred_xyz_jts_17.reshape(
-                17, 3).cpu().data.numpy()
-            pred_uvd_jts = pose_output.pred_uvd_jts.reshape(
-                -1, 3).cpu().data.numpy()
-            pred_xyz_jts_29 = pose_output.pred_xyz_jts_29.reshape(
-                -1, 3).cpu().data.numpy()
-            pred_xyz_jts_24_struct = pose_output.pred_xyz_jts_24_struct.reshape(
-                24, 3).cpu().data.numpy()
-            pred_scores = pose_output.maxvals.cpu(
-            ).data[:, :29].reshape(29).numpy()
-            pred_camera = pose_output.pred_camera.squeeze(
-                dim=0).cpu().data.numpy()
-            pred_betas = pose_output.pred_shape.squeeze(
-                dim=0).cpu().data.numpy()
-            pred_theta = pose_output.pred_theta_mats.squeeze(
-                dim=0).cpu().data.numpy()
-            pred_phi = pose_output.pred_phi.squeeze(dim=0).cpu().data.numpy()
-            pred_cam_root = pose_output.cam_root.squeeze(dim=0).cpu().numpy()
-            img_size = np.array((input_image.shape[0], input_image.shape[1]))
-
-            res_db['pred_xyz_17'].append(pred_xyz_jts_17)
-            res_db['pred_uvd'].append(pred_uvd_jts)
-            res_db['pred_xyz_29'].append(pred_xyz_jts_29)
-            res_db['pred_xyz_24_struct'].append(pred_xyz_jts_24_struct)
-            res_db['pred_scores'].append(pred_scores)
-            res_db['pred_camera'].append(pred_camera)
-            # res_db['f'].append(1000.0)
-            res_db['pred_betas'].append(pred_betas)
-            res_db['pred_thetas'].append(pred_theta)
-            res_db['pred_phi'].append(pred_phi)
-            res_db['pred_cam_root'].append(pred_cam_root)
-            # res_db['features'].append(img_feat)
-            res_db['transl'].append(transl[0].cpu().data.numpy())
-            res_db['transl_camsys'].append(transl_camsys[0].cpu().data.numpy())
-            res_db['bbox'].append(np.array(bbox))
-            res_db['height'].append(img_size[0])
-            res_db['width'].append(img_size[1])
-            res_db['img_path'].append(img_path)
-
-        # JSON 데이터 수집 (taiji_keypoints.json 형식에 맞춤)
-        if opt.save_json:
-            # 24개 관절의 3D 키포인트 추출 (xyz_24_struct 사용)
-            keypoints_3d_24 = pose_output.pred_xyz_jts_24_struct.reshape(24, 3).cpu().data.numpy().tolist()
-            
-            # 2D 키포인트는 24개 관절에 대응하는 UV 좌표 추출
-            # 29개 키포인트에서 24개 관절에 해당하는 인덱스 매핑 필요
-            # 임시로 처음 24개 사용 (실제로는 정확한 매핑 필요)
-            keypoints_2d_24 = uv_29[:24].cpu().numpy().tolist()
-            
-            # timestamp 계산 (fps 기반)
-            timestamp = idx / json_data['fps'] if json_data['fps'] > 0 else 0.0
-            
-            frame_data = {
-                'frame_id': idx + 1,  # 1부터 시작
-                'timestamp': timestamp,
-                'bbox': bbox.tolist() if hasattr(bbox, 'tolist') else bbox,
-                'keypoints_3d': keypoints_3d_24,
-                'keypoints_2d': keypoints_2d_24
-            }
-            json_data['frames'].append(frame_data)
+        person_outputs = iter(zip(bboxes, split_pose_output(batch_output, len(pose_inputs))))
+
+        infer_meter.update(time.perf_counter() - infer_start, n=len(decoded_batch))
+
+        for frame_idx, img_path, input_image, tight_bboxes, person_ids in frame_batch:
+            people = list(itertools.islice(person_outputs, len(tight_bboxes)))
+
+            if opt.save_img:
+                idx += 1
+
+            bbox_xywhs, uv_29s, transls, focals = [], [], [], []
+            for person_idx, (bbox, pose_output) in zip(person_ids, people):
+                uv_29 = pose_output.pred_uvd_jts.reshape(29, 3)[:, :2]
+                transl = pose_output.transl.detach()
+
+                focal = 1000.0
+                bbox_xywh = xyxy2xywh(bbox)
+                transl_camsys = transl.clone()
+                transl_camsys = transl_camsys * 256 / bbox_xywh[2]
+
+                focal = focal / 256 * bbox_xywh[2]
+
+                bbox_xywhs.append(bbox_xywh)
+                uv_29s.append(uv_29)
+                transls.append(transl)
+                focals.append(focal)
+
+                if opt.save_pk:
+                    pred_xyz_jts_17 = pose_output.pred_xyz_jts_17.reshape(
+                        17, 3).cpu().data.numpy()
+                    pred_uvd_jts = pose_output.pred_uvd_jts.reshape(
+                        -1, 3).cpu().data.numpy()
+                    pred_xyz_jts_29 = pose_output.pred_xyz_jts_29.reshape(
+                        -1, 3).cpu().data.numpy()
+                    pred_xyz_jts_24_struct = pose_output.pred_xyz_jts_24_struct.reshape(
+                        24, 3).cpu().data.numpy()
+                    pred_scores = pose_output.maxvals.cpu(
+                    ).data[:, :29].reshape(29).numpy()
+                    pred_camera = pose_output.pred_camera.squeeze(
+                        dim=0).cpu().data.numpy()
+                    pred_betas = pose_output.pred_shape.squeeze(
+                        dim=0).cpu().data.numpy()
+                    pred_theta = pose_output.pred_theta_mats.squeeze(
+                        dim=0).cpu().data.numpy()
+                    pred_phi = pose_output.pred_phi.squeeze(dim=0).cpu().data.numpy()
+                    pred_cam_root = pose_output.cam_root.squeeze(dim=0).cpu().numpy()
+                    img_size = np.array((input_image.shape[0], input_image.shape[1]))
+
+                    res_db['pred_xyz_17'].append(pred_xyz_jts_17)
+                    res_db['pred_uvd'].append(pred_uvd_jts)
+                    res_db['pred_xyz_29'].append(pred_xyz_jts_29)
+                    res_db['pred_xyz_24_struct'].append(pred_xyz_jts_24_struct)
+                    res_db['pred_scores'].append(pred_scores)
+                    res_db['pred_camera'].append(pred_camera)
+                    # res_db['f'].append(1000.0)
+                    res_db['pred_betas'].append(pred_betas)
+                    res_db['pred_thetas'].append(pred_theta)
+                    res_db['pred_phi'].append(pred_phi)
+                    res_db['pred_cam_root'].append(pred_cam_root)
+                    # res_db['features'].append(img_feat)
+                    res_db['transl'].append(transl[0].cpu().data.numpy())
+                    res_db['transl_camsys'].append(transl_camsys[0].cpu().data.numpy())
+                    res_db['bbox'].append(np.array(bbox))
+                    res_db['height'].append(img_size[0])
+                    res_db['width'].append(img_size[1])
+                    res_db['img_path'].append(img_path)
+                    res_db['frame_idx'].append(frame_idx)
+                    res_db['person_idx'].append(person_idx)
+
+            if opt.det_interval > 1 and frame_idx == frame_idx_batch[-1]:
+                # boxes of the next frame follow the keypoints, detect again if they are unreliable
+                img_h, img_w = input_image.shape[:2]
+                prop_bboxes = [
+                    get_keypoint_box(uv_29, bbox_xywh, img_w, img_h)
+                    for uv_29, bbox_xywh in zip(uv_29s, bbox_xywhs)]
+                track_score = min(float(pose_output.scores.mean()) for _, pose_output in people)
+                need_det = track_score < opt.track_thresh
+                if not opt.multi_person:
+                    prev_box = prop_bboxes[0]
+
+            vertices = torch.cat([pose_output.pred_vertices.detach() for _, pose_output in people], dim=0)
+            if opt.multi_person:
+                # one camera for everybody: scaling the depths of each person by 1000 / focal
+                # keeps every vertex's projection, only the shading normals change
+                depth_scale = torch.tensor([1000.0 / f for f in focals], device=vertices.device)
+                vertices = vertices.clone()
+                vertices[:, :, 2] *= depth_scale[:, None]
+                transl = torch.cat(transls, dim=0)
+                transl[:, 2] *= depth_scale
+                focal = 1000.0
+            else:
+                transl, focal = transls[0], focals[0]
+
+            # Rendering and video encoding run on the writer pool
+            writer_pool.submit(
+                input_image, tight_bboxes, bbox_xywhs, vertices, transl, torch.stack(uv_29s), focal, idx)
+
+            # JSON 데이터 수집 (taiji_keypoints.json 형식에 맞춤)
+            if opt.save_json:
+                # timestamp 계산 (fps 기반)
+                timestamp = idx / json_data['fps'] if json_data['fps'] > 0 else 0.0
+
+                frame_data = {
+                    'frame_id': idx + 1,  # 1부터 시작
+                    'timestamp': timestamp,
+                }
+                people_data = []
+                for person_idx, (bbox, pose_output), uv_29 in zip(person_ids, people, uv_29s):
+                    # 24개 관절의 3D 키포인트 추출 (xyz_24_struct 사용)
+                    keypoints_3d_24 = pose_output.pred_xyz_jts_24_struct.reshape(24, 3).cpu().data.numpy().tolist()
+
+                    # 2D 키포인트는 24개 관절에 대응하는 UV 좌표 추출
+                    # 29개 키포인트에서 24개 관절에 해당하는 인덱스 매핑 필요
+                    # 임시로 처음 24개 사용 (실제로는 정확한 매핑 필요)
+                    keypoints_2d_24 = uv_29[:24].cpu().numpy().tolist()
+
+                    people_data.append({
+                        'person_id': person_idx,
+                        'bbox': [float(x) for x in bbox],
+                        'keypoints_3d': keypoints_3d_24,
+                        'keypoints_2d': keypoints_2d_24
+                    })
+
+                if opt.multi_person:
+                    # 다중 인물: 프레임마다 사람별 결과 목록
+                    frame_data['people'] = people_data
+                else:
+                    del people_data[0]['person_id']
+                    frame_data.update(people_data[0])
+                json_data['frames'].append(frame_data)
+writer_pool.close()
+pbar.close()
+
+total_time = time.perf_counter() - start_time
+print(f'### Processed {infer_meter.count} frames in {total_time:.1f}s '
+      f'({infer_meter.count / max(total_time, 1e-9):.1f} fps)')
+for meter in (decode_meter, infer_meter, writer_pool.render_meter, writer_pool.write_meter):
+    print(f'    {meter}')
 
 
 if opt.save_pk:
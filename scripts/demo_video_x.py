@@ -1,6 +1,7 @@
 """Image demo script."""
 import argparse
 import os
+import time
 
 import cv2
 import numpy as np
@@ -10,9 +11,9 @@ from hybrik.models import builder
 from hybrik.utils.config import update_config
 from hybrik.utils.presets import SimpleTransform3DSMPLX
 from hybrik.utils.render_pytorch3d import render_mesh
+from hybrik.utils.video import FrameWriterPool, StageMeter, read_video_frames
 from hybrik.utils.vis import get_max_iou_box, get_one_box, vis_2d
 from torchvision import transforms as T
-from torchvision.models.detection import fasterrcnn_resnet50_fpn
 from tqdm import tqdm
 
 
@@ -135,6 +136,31 @@ parser.add_argument('--save-img', default=False, dest='save_img',
                     help='save prediction', action='store_true')
 parser.add_argument('--save-npz', default=False, dest='save_npz',
                     help='save prediction in NPZ format for SmoothNet', action='store_true')
+parser.add_argument('--prefetch',
+                    help='number of frames decoded ahead in a background thread (0 to disable)',
+                    default=0,
+                    type=int)
+parser.add_argument('--render-workers',
+                    help='number of threads rendering and encoding results (0 to run inline)',
+                    default=2,
+                    type=int)
+parser.add_argument('--detector',
+                    help='person detector backend',
+                    default='FasterRCNN',
+                    choices=list(builder.DETECTOR.module_dict.keys()),
+                    type=str)
+parser.add_argument('--det-weights',
+                    help='local detector checkpoint, no download if given (torchvision backends)',
+                    default='',
+                    type=str)
+parser.add_argument('--det-file',
+                    help='.json or MOT .txt box file (PrecomputedBoxes)',
+                    default='',
+                    type=str)
+parser.add_argument('--det-box',
+                    help='x1,y1,x2,y2 person box, full frame if empty (FixedBox)',
+                    default='',
+                    type=str)
 
 
 opt = parser.parse_args()
@@ -193,7 +219,11 @@ transformation = SimpleTransform3DSMPLX(
     train=False, add_dpg=False,
     loss_type=cfg.LOSS['TYPE'])
 
-det_model = fasterrcnn_resnet50_fpn(pretrained=True)
+det_model = builder.build_detector(edict(
+    TYPE=opt.detector,
+    WEIGHTS=opt.det_weights,
+    BOX_FILE=opt.det_file,
+    BOX=[float(v) for v in opt.det_box.split(',')] if opt.det_box else None))
 
 hybrik_model = builder.build_sppe(cfg.MODEL)
 
@@ -210,19 +240,16 @@ hybrik_model.cuda(opt.gpu)
 det_model.eval()
 hybrik_model.eval()
 
-print('### Extract Image...')
 video_basename = os.path.basename(opt.video_name).split('.')[0]
 
 if not os.path.exists(opt.out_dir):
     os.makedirs(opt.out_dir)
-if not os.path.exists(os.path.join(opt.out_dir, 'raw_images')):
-    os.makedirs(os.path.join(opt.out_dir, 'raw_images'))
 if not os.path.exists(os.path.join(opt.out_dir, 'res_images')) and opt.save_img:
     os.makedirs(os.path.join(opt.out_dir, 'res_images'))
 if not os.path.exists(os.path.join(opt.out_dir, 'res_2d_images')) and opt.save_img:
     os.makedirs(os.path.join(opt.out_dir, 'res_2d_images'))
 
-_, info, _ = get_video_info(opt.video_name)
+_, info, datalen = get_video_info(opt.video_name)
 video_basename = os.path.basename(opt.video_name).split('.')[0]
 
 savepath = f'./{opt.out_dir}/res_{video_basename}.mp4'
@@ -249,39 +276,89 @@ if not write_stream.isOpened():
 assert write_stream.isOpened(), 'Cannot open video for writing'
 assert write2d_stream.isOpened(), 'Cannot open video for writing'
 
-os.system(f'ffmpeg -i {opt.video_name} {opt.out_dir}/raw_images/{video_basename}-%06d.png')
+prev_box = None
+renderer = None
+smplx_faces = torch.from_numpy(hybrik_model.smplx_layer.faces.astype(np.int32))
+
 
+def render_frame(input_image, tight_bbox, bbox_xywh, vertices, transl, uv_jts, focal, idx):
+    # Visualization
+    image = input_image.copy()
 
-files = os.listdir(f'{opt.out_dir}/raw_images')
-files.sort()
+    verts_batch = vertices
+    transl_batch = transl
 
-img_path_list = []
+    color_batch = render_mesh(
+        vertices=verts_batch, faces=smplx_faces,
+        translation=transl_batch,
+        focal_length=focal, height=image.shape[0], width=image.shape[1])
 
-for file in tqdm(files):
-    if not os.path.isdir(file) and file[-4:] in ['.jpg', '.png']:
+    valid_mask_batch = (color_batch[:, :, :, [-1]] > 0)
+    image_vis_batch = color_batch[:, :, :, :3] * valid_mask_batch
+    image_vis_batch = (image_vis_batch * 255).cpu().numpy()
 
-        img_path = os.path.join(opt.out_dir, 'raw_images', file)
-        img_path_list.append(img_path)
+    color = image_vis_batch[0]
+    valid_mask = valid_mask_batch[0].cpu().numpy()
+    input_img = image
+    alpha = 0.9
+    image_vis = alpha * color[:, :, :3] * valid_mask + (
+        1 - alpha) * input_img * valid_mask + (1 - valid_mask) * input_img
 
-prev_box = None
-renderer = None
-smplx_faces = torch.from_numpy(hybrik_model.smplx_layer.faces.astype(np.int32))
+    image_vis = image_vis.astype(np.uint8)
+    image_vis = cv2.cvtColor(image_vis, cv2.COLOR_RGB2BGR)
+
+    if opt.save_img:
+        res_path = os.path.join(opt.out_dir, 'res_images', f'image-{idx:06d}.jpg')
+        cv2.imwrite(res_path, image_vis)
+
+    # vis 2d
+    pts = uv_jts * bbox_xywh[2]
+    pts[:, 0] = pts[:, 0] + bbox_xywh[0]
+    pts[:, 1] = pts[:, 1] + bbox_xywh[1]
+    image = input_image.copy()
+    bbox_img = vis_2d(image, tight_bbox, pts)
+    # bbox_img = vis_2d(image, tight_bbox, al_fb_pts)
+    bbox_img = cv2.cvtColor(bbox_img, cv2.COLOR_RGB2BGR)
+
+    if opt.save_img:
+        res_path = os.path.join(
+            opt.out_dir, 'res_2d_images', f'image-{idx:06d}.jpg')
+        cv2.imwrite(res_path, bbox_img)
+
+    return image_vis, bbox_img
+
+
+def write_frame(result):
+    image_vis, bbox_img = result
+    write_stream.write(image_vis)
+    write2d_stream.write(bbox_img)
+
+
+decode_meter = StageMeter('decode')
+infer_meter = StageMeter('infer')
+writer_pool = FrameWriterPool(
+    render_frame, write_frame,
+    num_workers=opt.render_workers, max_pending=2 * max(opt.render_workers, 1))
 
 print('### Run Model...')
 idx = 0
-for img_path in tqdm(img_path_list):
-    dirname = os.path.dirname(img_path)
-    basename = os.path.basename(img_path)
+frame_iter = read_video_frames(opt.video_name, prefetch=opt.prefetch, meter=decode_meter)
+start_time = time.perf_counter()
+for frame_idx, frame in enumerate(tqdm(frame_iter, total=datalen), start=1):
+    # Frames are decoded in memory; the path keeps the old ffmpeg naming to identify frames
+    img_path = os.path.join(opt.out_dir, 'raw_images', f'{video_basename}-{frame_idx:06d}.png')
+    infer_start = time.perf_counter()
 
     with torch.no_grad():
         # Run Detection
-        input_image = cv2.cvtColor(cv2.imread(img_path), cv2.COLOR_BGR2RGB)
+        input_image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
         det_input = det_transform(input_image).to(opt.gpu)
-        det_output = det_model([det_input])[0]
+        det_output = det_model([det_input], frame_ids=[frame_idx])[0]
 
         if prev_box is None:
             tight_bbox = get_one_box(det_output)  # xyxy
             if tight_bbox is None:
+                infer_meter.update(time.perf_counter() - infer_start)
                 continue
         else:
             tight_bbox = get_one_box(det_output)  # xyxy
@@ -336,8 +413,8 @@ for img_path in tqdm(img_path_list):
         # uv_jts[-10:, :2] = hand_leaf_uv_jts
         transl = pose_output.transl.detach()
 
-        # Visualization
-        image = input_image.copy()
+        infer_meter.update(time.perf_counter() - infer_start)
+
         focal = 1000.0
         bbox_xywh = xyxy2xywh(bbox)
 
@@ -345,48 +422,12 @@ for img_path in tqdm(img_path_list):
 
         vertices = pose_output.pred_vertices.detach()
 
-        verts_batch = vertices
-        transl_batch = transl
-
-        color_batch = render_mesh(
-            vertices=verts_batch, faces=smplx_faces,
-            translation=transl_batch,
-            focal_length=focal, height=image.shape[0], width=image.shape[1])
-
-        valid_mask_batch = (color_batch[:, :, :, [-1]] > 0)
-        image_vis_batch = color_batch[:, :, :, :3] * valid_mask_batch
-        image_vis_batch = (image_vis_batch * 255).cpu().numpy()
-
-        color = image_vis_batch[0]
-        valid_mask = valid_mask_batch[0].cpu().numpy()
-        input_img = image
-        alpha = 0.9
-        image_vis = alpha * color[:, :, :3] * valid_mask + (
-            1 - alpha) * input_img * valid_mask + (1 - valid_mask) * input_img
-
-        image_vis = image_vis.astype(np.uint8)
-        image_vis = cv2.cvtColor(image_vis, cv2.COLOR_RGB2BGR)
-
         if opt.save_img:
             idx += 1
-            res_path = os.path.join(opt.out_dir, 'res_images', f'image-{idx:06d}.jpg')
-            cv2.imwrite(res_path, image_vis)
-        write_stream.write(image_vis)
-        
-        # vis 2d
-        pts = uv_jts * bbox_xywh[2]
-        pts[:, 0] = pts[:, 0] + bbox_xywh[0]
-        pts[:, 1] = pts[:, 1] + bbox_xywh[1]
-        image = input_image.copy()
-        bbox_img = vis_2d(image, tight_bbox, pts)
-        # bbox_img = vis_2d(image, tight_bbox, al_fb_pts)
-        bbox_img = cv2.cvtColor(bbox_img, cv2.COLOR_RGB2BGR)
-        write2d_stream.write(bbox_img)
 
-        if opt.save_img:
-            res_path = os.path.join(
-                opt.out_dir, 'res_2d_images', f'image-{idx:06d}.jpg')
-            cv2.imwrite(res_path, bbox_img)
+        # Rendering and video encoding run on the writer pool
+        writer_pool.submit(
+            input_image, tight_bbox, bbox_xywh, vertices, transl, uv_jts, focal, idx)
 
         if opt.save_pt:
             assert pose_input.shape[0] == 1, 'Only support single batch inference for now'
@@ -498,9 +539,16 @@ for img_path in tqdm(img_path_list):
             res_db['width'].append(img_size[1])
             res_db['img_path'].append(img_path)
 
+writer_pool.close()
 write_stream.release()
 write2d_stream.release()
 
+total_time = time.perf_counter() - start_time
+print(f'### Processed {infer_meter.count} frames in {total_time:.1f}s '
+      f'({infer_meter.count / max(total_time, 1e-9):.1f} fps)')
+for meter in (decode_meter, infer_meter, writer_pool.render_meter, writer_pool.write_meter):
+    print(f'    {meter}')
+
 # Save keypoints and SMPL parameters to JSON and pickle files
 if opt.save_pt and len(res_db['pred_xyz_17']) > 0:
     import json
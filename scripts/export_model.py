@@ -0,0 +1,116 @@
+"""Export a HybrIK model as a TorchScript inference graph or for ONNX Runtime."""
+import argparse
+import os
+import time
+
+import numpy as np
+import torch
+from hybrik.models import builder
+from hybrik.models.export import HybrIKInference, export_inference, export_onnx
+from hybrik.utils.config import update_config
+
+parser = argparse.ArgumentParser(description='HybrIK Export')
+parser.add_argument('--cfg',
+                    help='experiment configure file name',
+                    default='configs/256x192_adam_lr1e-3-hrw48_cam_2x_w_pw3d_3dhp.yaml',
+                    type=str)
+parser.add_argument('--checkpoint',
+                    help='checkpoint file name',
+                    default='./pretrained_models/hybrik_hrnet.pth',
+                    type=str)
+parser.add_argument('--out',
+                    help='output TorchScript or ONNX file',
+                    default='./pretrained_models/hybrik_hrnet_traced.pt',
+                    type=str)
+parser.add_argument('--format',
+                    help='torchscript, or onnx for the ONNX Runtime backend (HRNetSMPLCam models only)',
+                    default='torchscript',
+                    choices=['torchscript', 'onnx'],
+                    type=str)
+parser.add_argument('--kinematics',
+                    help='output .npz of the NumPy kinematics with --format onnx, next to --out by default',
+                    default='',
+                    type=str)
+parser.add_argument('--gpu',
+                    help='gpu, -1 to export on CPU',
+                    default=0,
+                    type=int)
+parser.add_argument('--batch',
+                    help='batch size of the example input',
+                    default=2,
+                    type=int)
+parser.add_argument('--no-flip', default=False, dest='no_flip',
+                    help='export without flip test', action='store_true')
+parser.add_argument('--freeze', default=False, dest='freeze',
+                    help='freeze the traced graph (folds batch norms)', action='store_true')
+
+opt = parser.parse_args()
+cfg = update_config(opt.cfg)
+
+device = torch.device('cpu') if opt.gpu < 0 else torch.device('cuda', opt.gpu)
+
+hybrik_model = builder.build_sppe(cfg.MODEL)
+if opt.format == 'onnx' and not hasattr(hybrik_model, 'forward_network'):
+    # fail before loading the checkpoint, see export_onnx
+    parser.error(f'--format onnx only supports HRNetSMPLCam models, not {cfg.MODEL.TYPE}; use --format torchscript')
+
+print(f'Loading model from {opt.checkpoint}...')
+save_dict = torch.load(opt.checkpoint, map_location='cpu')
+if type(save_dict) == dict:
+    model_dict = save_dict['model']
+    hybrik_model.load_state_dict(model_dict)
+else:
+    hybrik_model.load_state_dict(save_dict)
+
+hybrik_model.to(device)
+hybrik_model.eval()
+
+input_h, input_w = cfg.MODEL.IMAGE_SIZE
+img = torch.randn(opt.batch, 3, input_h, input_w, device=device)
+bboxes = torch.tensor([[0., 0., input_w, input_h]], device=device).repeat(opt.batch, 1)
+img_center = torch.tensor([[input_w * 0.5, input_h * 0.5]], device=device).repeat(opt.batch, 1)
+example_inputs = (img, bboxes, img_center)
+
+eager = HybrIKInference(hybrik_model, flip_test=not opt.no_flip).eval()
+
+if opt.format == 'onnx':
+    from hybrik.utils.onnx_inference import HybrIKOnnx
+
+    kinematics_path = opt.kinematics or os.path.splitext(opt.out)[0] + '.npz'
+    export_onnx(hybrik_model, opt.out, kinematics_path, img, flip_test=not opt.no_flip)
+    print(f'Saved ONNX graph to {opt.out} and kinematics to {kinematics_path}')
+
+    # check the ONNX Runtime pipeline against eager mode, see scripts/benchmark_backends.py for timings
+    runner = HybrIKOnnx(opt.out, kinematics_path)
+    with torch.no_grad():
+        eager_out = eager(*example_inputs)
+    ort_out = runner(*[t.cpu().numpy() for t in example_inputs])
+
+    for name, a in zip(eager.output_names, eager_out):
+        print(f'{name:24s} max abs diff: {np.abs(a.cpu().numpy() - ort_out[name]).max():.2e}')
+else:
+    exported = export_inference(
+        hybrik_model, example_inputs, mode='trace', flip_test=not opt.no_flip, freeze=opt.freeze)
+    torch.jit.save(exported, opt.out)
+    print(f'Saved TorchScript graph to {opt.out}')
+
+    # check the saved graph against eager mode
+    exported = torch.jit.load(opt.out, map_location=device)
+
+    with torch.no_grad():
+        eager_out = eager(*example_inputs)
+        exported_out = exported(*example_inputs)
+
+        for name, a, b in zip(eager.output_names, eager_out, exported_out):
+            print(f'{name:24s} max abs diff: {(a - b).abs().max().item():.2e}')
+
+        for name, module in (('eager', eager), ('torchscript', exported)):
+            module(*example_inputs)
+            if device.type == 'cuda':
+                torch.cuda.synchronize(device)
+            start = time.perf_counter()
+            for _ in range(10):
+                module(*example_inputs)
+            if device.type == 'cuda':
+                torch.cuda.synchronize(device)
+            print(f'{name}: {(time.perf_counter() - start) / 10 * 1000:.1f} ms / batch of {opt.batch}')
@@ -0,0 +1,109 @@
+"""Pack person crops of a dataset split into shards for training."""
+import argparse
+import multiprocessing as mp
+import os
+
+from hybrik.datasets import AGORAX, HP3D, PW3D, H36mSMPL
+from hybrik.datasets.cocoeft import COCO_EFT_3D
+from hybrik.datasets.mscoco import Mscoco
+from hybrik.utils.config import update_config
+from hybrik.utils.shards import SHARD_ENCODINGS, CropShardWriter, crop_box, read_image, shard_dir_of
+from tqdm import tqdm
+
+DATASETS = {
+    'h36m': H36mSMPL,
+    'pw3d': PW3D,
+    'hp3d': HP3D,
+    'coco': Mscoco,
+    'cocoeft': COCO_EFT_3D,
+    'agora': AGORAX,
+}
+
+parser = argparse.ArgumentParser(description='HybrIK Shard Packing')
+parser.add_argument('--cfg',
+                    help='experiment configure file name, for the input size and augmentation range',
+                    required=True,
+                    type=str)
+parser.add_argument('--dataset',
+                    help='dataset of the split',
+                    required=True,
+                    choices=list(DATASETS.keys()),
+                    type=str)
+parser.add_argument('--ann-file',
+                    help='split as given to the dataset class, e.g. Sample_5_train_Human36M_smpl_leaf_twist',
+                    required=True,
+                    type=str)
+parser.add_argument('--root',
+                    help='dataset root, the class default if empty',
+                    default='',
+                    type=str)
+parser.add_argument('--test', default=False, dest='test',
+                    help='pack a test split', action='store_true')
+parser.add_argument('--low-res', default=False, dest='low_res',
+                    help='AGORA: pack the 720p images instead of 4k', action='store_true')
+parser.add_argument('--encoding',
+                    help='crop encoding, raw skips decoding at training time but is ~10x larger',
+                    default='jpg',
+                    choices=SHARD_ENCODINGS,
+                    type=str)
+parser.add_argument('--pad',
+                    help='crop margin on top of the scale and rotation augmentation range',
+                    default=1.2,
+                    type=float)
+parser.add_argument('--samples-per-shard',
+                    default=4096,
+                    type=int)
+parser.add_argument('--workers',
+                    help='image decoding processes',
+                    default=8,
+                    type=int)
+
+opt = parser.parse_args()
+cfg = update_config(opt.cfg)
+cfg.DATASET.USE_SHARDS = False
+
+dataset_kwargs = dict(cfg=cfg, ann_file=opt.ann_file, train=not opt.test)
+if opt.root:
+    dataset_kwargs['root'] = opt.root
+if opt.dataset == 'agora':
+    dataset_kwargs['high_res_inp'] = not opt.low_res
+dataset = DATASETS[opt.dataset](**dataset_kwargs)
+
+if opt.dataset == 'cocoeft':
+    ann_prefix = dataset._ann_file + '_smpl_annot'
+elif opt.dataset == 'agora':
+    ann_prefix = dataset._ann_file + dataset._resolution + '_final'
+else:
+    ann_prefix = dataset._ann_file
+shard_dir = shard_dir_of(ann_prefix)
+
+writer = CropShardWriter(shard_dir, encoding=opt.encoding, samples_per_shard=opt.samples_per_shard)
+transformation = dataset.transformation
+
+
+def pack_one(idx):
+    if hasattr(dataset, 'image_path'):
+        img_path = dataset.image_path(idx)
+    else:
+        img_path = dataset.db['img_path'][idx]
+    img = read_image(img_path)
+    img_h, img_w = img.shape[:2]
+
+    crop = crop_box(
+        dataset.db['bbox'][idx], img_w, img_h, transformation._aspect_ratio,
+        scale_mult=getattr(transformation, '_scale_mult', 1.25),
+        scale_factor=transformation._scale_factor, pad=opt.pad)
+    return writer.encode(img, crop), crop, (img_h, img_w), img_path
+
+
+print(f'Packing {len(dataset)} crops into {shard_dir}...')
+# workers are forked after the dataset is loaded and share its annotations
+with mp.get_context('fork').Pool(opt.workers) as pool:
+    for data, crop, img_size, img_path in tqdm(
+            pool.imap(pack_one, range(len(dataset)), chunksize=16), total=len(dataset), dynamic_ncols=True):
+        writer.write(data, crop, img_size, img_path)
+writer.close()
+
+num_bytes = sum(
+    os.path.getsize(os.path.join(shard_dir, f)) for f in os.listdir(shard_dir) if f.endswith('.bin'))
+print(f'{len(dataset)} crops, {num_bytes / 2 ** 30:.2f} GiB. Set DATASET.USE_SHARDS: True in the config to train on them.')
@@ -13,6 +13,7 @@ from torch.nn.utils import clip_grad
 from hybrik.datasets import MixDataset, MixDatasetCam, PW3D, MixDataset2Cam
 from hybrik.models import builder
 from hybrik.opt import cfg, logger, opt
+from hybrik.utils.batch_augment import batch_augment
 from hybrik.utils.env import init_dist
 from hybrik.utils.metrics import DataLogger, NullWriter, calc_coord_accuracy
 from hybrik.utils.transforms import get_func_heatmap_to_coord
@@ -43,14 +44,18 @@ def train(opt, train_loader, m, criterion, optimizer, writer, epoch_num):
         train_loader = tqdm(train_loader, dynamic_ncols=True)
 
     for j, (inps, labels, _, bboxes) in enumerate(train_loader):
+        for k, _ in labels.items():
+            labels[k] = labels[k].cuda(opt.gpu)
+
         if isinstance(inps, list):
             inps = [inp.cuda(opt.gpu).requires_grad_() for inp in inps]
+        elif 'patch_trans_inv' in labels:
+            # DATASET.GPU_AUGMENT: light crops are augmented here
+            inps = batch_augment(inps.cuda(opt.gpu, non_blocking=True), labels, cfg.MODEL.IMAGE_SIZE)
+            inps.requires_grad_()
         else:
             inps = inps.cuda(opt.gpu).requires_grad_()
 
-        for k, _ in labels.items():
-            labels[k] = labels[k].cuda(opt.gpu)
-
         trans_inv = labels.pop('trans_inv')
         intrinsic_param = labels.pop('intrinsic_param')
         root = labels.pop('joint_root')
@@ -3,6 +3,7 @@ import argparse
 import os
 import pickle as pk
 import sys
+import time
 
 import numpy as np
 import torch
@@ -11,7 +12,9 @@ from hybrik.datasets import HP3D, PW3D, H36mSMPL
 from hybrik.models import builder
 from hybrik.utils.config import update_config
 from hybrik.utils.env import init_dist
-from hybrik.utils.metrics import NullWriter
+from hybrik.utils.metrics import NullWriter, PrecisionParity
+from hybrik.utils.precision import get_amp_dtype
+from hybrik.utils.quantization import load_backbone_int8
 from hybrik.utils.transforms import get_func_heatmap_to_coord
 from tqdm import tqdm
 
@@ -40,6 +43,19 @@ parser.add_argument('--flip-shift',
                     dest='flip_shift',
                     help='flip shift',
                     action='store_true')
+parser.add_argument('--amp',
+                    default='fp32',
+                    choices=['fp32', 'fp16', 'bf16'],
+                    help='precision of the backbone, the kinematics always run in fp32')
+parser.add_argument('--amp-parity',
+                    default=False,
+                    dest='amp_parity',
+                    help='also run in fp32 and report the MPJPE / PA-MPJPE deltas of --amp',
+                    action='store_true')
+parser.add_argument('--int8',
+                    default='',
+                    help='INT8 checkpoint from calibrate_int8.py, validated on CPU against --checkpoint',
+                    type=str)
 parser.add_argument('--rank', default=-1, type=int,
                     help='node rank for distributed testing')
 parser.add_argument('--dist-url', default='tcp://192.168.1.219:23456', type=str,
@@ -54,12 +70,29 @@ parser.add_argument('--world-size', default=-1, type=int,
 opt = parser.parse_args()
 cfg = update_config(opt.cfg)
 
-gpus = [int(i) for i in opt.gpus.split(',')]
+gpus = [int(i) for i in opt.gpus.split(',')] if opt.gpus else []
 
 norm_method = cfg.LOSS.get('norm', 'softmax')
 
 
-def validate_gt(m, opt, cfg, gt_val_dataset, heatmap_to_coord, batch_size=32, pred_root=False, test_vertice=False):
+def timed_forward(m, inps, **kwargs):
+    if opt.device.type == 'cuda':
+        torch.cuda.synchronize(opt.device)
+    start = time.perf_counter()
+    output = m(inps, **kwargs)
+    if opt.device.type == 'cuda':
+        torch.cuda.synchronize(opt.device)
+    return output, time.perf_counter() - start
+
+
+def validate_gt(m, opt, cfg, gt_val_dataset, heatmap_to_coord, batch_size=32, pred_root=False, test_vertice=False,
+                ref_m=None):
+    ''' Evaluate `m` on a dataset.
+
+    With `ref_m`, or --amp-parity and a mixed-precision `m`, every batch is
+    also run through the fp32 reference and the MPJPE / PA-MPJPE deltas and
+    the forward latency of both are reported.
+    '''
 
     gt_val_sampler = torch.utils.data.distributed.DistributedSampler(
         gt_val_dataset, num_replicas=opt.world_size, rank=opt.rank)
@@ -68,6 +101,19 @@ def validate_gt(m, opt, cfg, gt_val_dataset, heatmap_to_coord, batch_size=32, pr
         gt_val_dataset, batch_size=batch_size, shuffle=False, num_workers=5, drop_last=False, sampler=gt_val_sampler)
     kpt_pred = {}
     m.eval()
+    model = m.module if hasattr(m, 'module') else m
+
+    amp_dtype = model.amp_dtype
+    parity = None
+    if ref_m is not None or (opt.amp_parity and amp_dtype is not None):
+        # xyz outputs are in units of the depth factor, millimeter -> meter
+        parity = PrecisionParity(depth_factor=cfg.MODEL.BBOX_3D_SHAPE[2] * 1e-3)
+        # forward seconds of m and of the reference
+        latency = [0.0, 0.0]
+        if ref_m is None:
+            # the same model in fp32
+            ref_m = m
+    variant = 'int8' if opt.int8 else opt.amp
 
     hm_shape = cfg.MODEL.get('HEATMAP_SIZE')
     hm_shape = (hm_shape[1], hm_shape[0])
@@ -75,23 +121,34 @@ def validate_gt(m, opt, cfg, gt_val_dataset, heatmap_to_coord, batch_size=32, pr
 
     for inps, labels, img_ids, bboxes in tqdm(gt_val_loader, dynamic_ncols=True):
         if isinstance(inps, list):
-            inps = [inp.cuda(opt.gpu) for inp in inps]
+            inps = [inp.to(opt.device) for inp in inps]
         else:
-            inps = inps.cuda(opt.gpu)
+            inps = inps.to(opt.device)
 
         for k, _ in labels.items():
             try:
-                labels[k] = labels[k].cuda(opt.gpu)
+                labels[k] = labels[k].to(opt.device)
             except AttributeError:
                 assert k == 'type'
 
         # output = m(inps, trans_inv, intrinsic_param, joint_root, depth_factor, (gt_betas, None, None))
-        output = m(inps, flip_test=opt.flip_test, bboxes=bboxes,
-                   img_center=labels['img_center'])
+        output, elapsed = timed_forward(m, inps, flip_test=opt.flip_test, bboxes=bboxes,
+                                        img_center=labels['img_center'])
+        if parity is not None:
+            if ref_m is m:
+                model.amp_dtype = None
+            ref_output, ref_elapsed = timed_forward(ref_m, inps, flip_test=opt.flip_test, bboxes=bboxes,
+                                                    img_center=labels['img_center'])
+            model.amp_dtype = amp_dtype
+            latency[0] += elapsed
+            latency[1] += ref_elapsed
+            parity.update(
+                output.pred_xyz_jts_17.reshape(inps.shape[0], 17, 3).cpu().numpy(),
+                ref_output.pred_xyz_jts_17.reshape(inps.shape[0], 17, 3).cpu().numpy())
         if test_vertice:
             gt_betas = labels['target_beta']
             gt_thetas = labels['target_theta']
-            gt_output = m.module.forward_gt_theta(gt_thetas, gt_betas)
+            gt_output = model.forward_gt_theta(gt_thetas, gt_betas)
 
         pred_uvd_jts = output.pred_uvd_jts
         pred_xyz_jts_24 = output.pred_xyz_jts_24.reshape(inps.shape[0], -1, 3)[:, :24, :]
@@ -135,9 +192,23 @@ def validate_gt(m, opt, cfg, gt_val_dataset, heatmap_to_coord, batch_size=32, pr
     with open(os.path.join('exp', f'test_gt_kpt_rank_{opt.rank}.pkl'), 'wb') as fid:
         pk.dump(kpt_pred, fid, pk.HIGHEST_PROTOCOL)
 
-    torch.distributed.barrier()  # Make sure all JSON files are saved
+    distributed = torch.distributed.is_initialized()
+    if distributed:
+        torch.distributed.barrier()  # Make sure all JSON files are saved
+
+    if parity is not None:
+        parity_state = torch.tensor(parity.state() + latency, dtype=torch.float64, device=opt.device)
+        if distributed:
+            torch.distributed.all_reduce(parity_state)
+        parity_state = parity_state.tolist()
 
     if opt.rank == 0:
+        if parity is not None:
+            cnt = max(parity_state[2], 1)
+            ms, ref_ms = parity_state[3] / cnt * 1000, parity_state[4] / cnt * 1000
+            print(f'##### {variant} vs fp32: {parity.summary(parity_state[:3])} | '
+                  f'{ms:.1f} vs {ref_ms:.1f} ms / img ({ref_ms / max(ms, 1e-9):.2f}x) #####')
+
         kpt_all_pred = {}
         for r in range(opt.world_size):
             with open(os.path.join('exp', f'test_gt_kpt_rank_{r}.pkl'), 'rb') as fid:
@@ -159,7 +230,9 @@ def validate_gt(m, opt, cfg, gt_val_dataset, heatmap_to_coord, batch_size=32, pr
 
 
 def main():
-    if opt.launcher == 'slurm':
+    if opt.int8:
+        main_int8(opt, cfg)
+    elif opt.launcher == 'slurm':
         main_worker(None, opt, cfg)
     else:
         ngpus_per_node = torch.cuda.device_count()
@@ -173,6 +246,7 @@ def main_worker(gpu, opt, cfg):
         opt.gpu = gpu
 
     init_dist(opt)
+    opt.device = torch.device('cuda', opt.gpu)
 
     if not opt.log:
         null_writer = NullWriter()
@@ -181,6 +255,7 @@ def main_worker(gpu, opt, cfg):
     torch.backends.cudnn.benchmark = True
 
     m = builder.build_sppe(cfg.MODEL)
+    m.amp_dtype = get_amp_dtype(opt.amp)
 
     print(f'Loading model from {opt.checkpoint}...')
     save_dict = torch.load(opt.checkpoint, map_location='cpu')
@@ -224,5 +299,46 @@ def main_worker(gpu, opt, cfg):
     print(f'##### gt h36m err: {gt_tot_err} #####')
 
 
+def main_int8(opt, cfg):
+    ''' Single process CPU validation of an INT8 model against its fp32 checkpoint. '''
+    opt.device = torch.device('cpu')
+    opt.rank = 0
+    opt.world_size = 1
+
+    m_fp32 = builder.build_sppe(cfg.MODEL)
+
+    print(f'Loading model from {opt.checkpoint}...')
+    save_dict = torch.load(opt.checkpoint, map_location='cpu')
+    if type(save_dict) == dict:
+        model_dict = save_dict['model']
+        m_fp32.load_state_dict(model_dict, strict=False)
+    else:
+        m_fp32.load_state_dict(save_dict, strict=False)
+    m_fp32.eval()
+
+    print(f'Loading INT8 model from {opt.int8}...')
+    input_h, input_w = cfg.MODEL.IMAGE_SIZE
+    m_int8 = load_backbone_int8(builder.build_sppe(cfg.MODEL), opt.int8, torch.randn(1, 3, input_h, input_w))
+
+    heatmap_to_coord = get_func_heatmap_to_coord(cfg)
+
+    gt_val_dataset_3dpw = PW3D(
+        cfg=cfg,
+        ann_file='3DPW_test_new.json',
+        train=False)
+
+    gt_val_dataset_hp3d = HP3D(
+        cfg=cfg,
+        ann_file='test',
+        train=False)
+
+    for name, dataset, test_vertice in (('3dpw', gt_val_dataset_3dpw, True), ('3dhp', gt_val_dataset_hp3d, False)):
+        print(f'##### Testing INT8 on {name} #####')
+        with torch.no_grad():
+            gt_tot_err = validate_gt(m_int8, opt, cfg, dataset, heatmap_to_coord, opt.batch,
+                                     test_vertice=test_vertice, ref_m=m_fp32)
+        print(f'##### gt {name} err: {gt_tot_err} #####')
+
+
 if __name__ == "__main__":
     main()
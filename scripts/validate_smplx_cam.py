@@ -14,7 +14,8 @@ from hybrik.datasets import AGORAX
 from hybrik.models import builder
 from hybrik.utils.config import update_config
 from hybrik.utils.env import init_dist
-from hybrik.utils.metrics import NullWriter
+from hybrik.utils.metrics import NullWriter, PrecisionParity
+from hybrik.utils.precision import get_amp_dtype
 from hybrik.utils.transforms import get_func_heatmap_to_coord
 from hybrik.utils.vis import vis_uvd_trivial
 
@@ -49,6 +50,15 @@ parser.add_argument('--visualize',
                     dest='visualize',
                     help='visualize predictions',
                     action='store_true')
+parser.add_argument('--amp',
+                    default='fp32',
+                    choices=['fp32', 'fp16', 'bf16'],
+                    help='precision of the backbone, the kinematics always run in fp32')
+parser.add_argument('--amp-parity',
+                    default=False,
+                    dest='amp_parity',
+                    help='also run in fp32 and report the MPJPE / PA-MPJPE deltas of --amp',
+                    action='store_true')
 parser.add_argument('--rank', default=-1, type=int,
                     help='node rank for distributed testing')
 parser.add_argument('--dist-url', default='tcp://192.168.1.219:23456', type=str,
@@ -84,6 +94,12 @@ def validate_gt(m, opt, cfg, gt_val_dataset, heatmap_to_coord, batch_size=32, pr
     kpt_pred = {}
     m.eval()
 
+    amp_dtype = m.module.amp_dtype
+    parity = None
+    if opt.amp_parity and amp_dtype is not None:
+        # xyz outputs are in units of the depth factor, millimeter -> meter
+        parity = PrecisionParity(depth_factor=cfg.MODEL.BBOX_3D_SHAPE[2] * 1e-3)
+
     hm_shape = cfg.MODEL.get('HEATMAP_SIZE')
     hm_shape = (hm_shape[1], hm_shape[0])
     smplx_faces = torch.from_numpy(m.module.smplx_layer.faces.astype(np.int32))
@@ -108,6 +124,14 @@ def validate_gt(m, opt, cfg, gt_val_dataset, heatmap_to_coord, batch_size=32, pr
             inps, flip_test=opt.flip_test, bboxes=bboxes,
             img_center=labels['img_center'],
         )
+        if parity is not None:
+            m.module.amp_dtype = None
+            ref_output = m(inps, flip_test=opt.flip_test, bboxes=bboxes,
+                           img_center=labels['img_center'])
+            m.module.amp_dtype = amp_dtype
+            parity.update(
+                output.pred_xyz_hybrik.reshape(inps.shape[0], -1, 3).cpu().numpy(),
+                ref_output.pred_xyz_hybrik.reshape(inps.shape[0], -1, 3).cpu().numpy())
 
         pred_xyz_hybrik = output.pred_xyz_hybrik.reshape(inps.shape[0], -1, 3)
         pred_xyz_hybrik_struct = output.pred_xyz_hybrik_struct.reshape(inps.shape[0], -1, 3)
@@ -143,7 +167,14 @@ def validate_gt(m, opt, cfg, gt_val_dataset, heatmap_to_coord, batch_size=32, pr
 
     torch.distributed.barrier()  # Make sure all JSON files are saved
 
+    if parity is not None:
+        parity_state = torch.tensor(parity.state(), dtype=torch.float64, device=torch.device('cuda', opt.gpu))
+        torch.distributed.all_reduce(parity_state)
+
     if opt.rank == 0:
+        if parity is not None:
+            print(f'##### {opt.amp} vs fp32: {parity.summary(parity_state.tolist())} #####')
+
         kpt_all_pred = {}
         for r in range(opt.world_size):
             with open(os.path.join('exp', f'test_gt_kpt_rank_{r}.pkl'), 'rb') as fid:
@@ -197,6 +228,7 @@ def main_worker(gpu, opt, cfg):
     torch.backends.cudnn.benchmark = True
 
     m = builder.build_sppe(cfg.MODEL)
+    m.amp_dtype = get_amp_dtype(opt.amp)
     old_children_map = m.smplx_layer.children_map.clone()
 
     print(f'Loading model from {opt.checkpoint}...')